@@ -0,0 +1,31 @@
+# benchmarks/bench_anomaly.py
+
+from benchmarks.common import get_app, build_synthetic_db, reset_database, measure
+
+from server.services.anomaly_service import AnomalyService
+
+
+def run(results, quick=False):
+    app = get_app()
+
+    # Полный проход детектора (чтение окна, оценка, запись) по числу датчиков
+    for sensors in ([10, 100] if quick else [10, 100, 1000]):
+        build_synthetic_db(app, buildings=10, sensors_per_building=sensors // 10, hours=24, readings_per_hour=12)
+
+        for method, workers in (('zscore', 1), ('isolation_forest', 1), ('isolation_forest', 4)):
+            if quick and method == 'isolation_forest' and sensors > 10:
+                continue
+
+            reports = []
+            stats = measure(lambda: reports.append(AnomalyService.run_detection(24, method, workers)),
+                            repeat=1 if method == 'isolation_forest' else 3)
+            report = reports[-1]
+            results.record(
+                'anomaly.run_detection',
+                {'sensors': sensors, 'readings': report['readings'], 'method': method, 'workers': workers},
+                stats,
+                sensors_per_second=report['sensors_per_second'],
+                score_seconds=report['score_seconds']
+            )
+
+    reset_database(app)
@@ -0,0 +1,26 @@
+# benchmarks/bench_approximation.py
+
+from benchmarks.common import get_app, build_synthetic_db, measure
+
+from server.database.db import db
+from server.services.approximation_service import ApproximationService
+
+
+def run(results, quick=False):
+    app = get_app()
+
+    # Полиномиальная аппроксимация за сутки в зависимости от количества точек
+    for points in ([100, 1000] if quick else [100, 1000, 10000, 50000]):
+        sensor_ids = build_synthetic_db(app, sensors_per_building=1, hours=24, readings_per_hour=points / 24)
+
+        def approximate():
+            with app.app_context():
+                result = ApproximationService.get_polynomial_approximation(sensor_ids[0], 24, 3, 50)
+                assert result['error'] is None, result['error']
+                db.session.remove()
+
+        results.record(
+            'service.polynomial_approximation',
+            {'points': points, 'degree': 3},
+            measure(approximate, repeat=3 if quick else 5)
+        )
@@ -0,0 +1,69 @@
+# benchmarks/bench_engines.py
+
+import math
+
+from benchmarks.common import measure
+
+import numpy as np
+
+from server.services import approximation_engines
+from server.services.resampling import resample, find_gaps
+from server.services.heatmap_service import idw_weights, interpolate
+from server.services.correlation_service import pairwise_correlation, lagged_correlation
+
+
+def run(results, quick=False):
+    sizes = [1000, 10000, 100000] if quick else [10000, 100000, 1000000, 3000000]
+    rng = np.random.default_rng(42)
+
+    # Сутки равномерных показаний: синусоида с трендом и шумом
+    series = {}
+    for n in sizes:
+        t = np.linspace(0, 1440, n)
+        series[n] = (t, np.sin(t / 200) + t / 1440 + rng.normal(0, 0.3, n))
+
+    for method in list(approximation_engines.ENGINES) + ['auto']:
+        timings = {}
+        for n in sizes:
+            t, v = series[n]
+            stats = measure(lambda: approximation_engines.fit(method, t, v, 100), repeat=3)
+            timings[n] = stats['p50_ms']
+            results.record('engine.fit', {'method': method, 'points': n}, stats)
+
+        # Показатель степени роста времени: ~1 для линейной сложности
+        exponent = math.log(timings[sizes[-1]] / timings[sizes[0]]) / math.log(sizes[-1] / sizes[0])
+        results.record(
+            'engine.scaling', {'method': method, 'from': sizes[0], 'to': sizes[-1]},
+            {}, scaling_exponent=round(exponent, 3)
+        )
+
+    # Регулярная сетка и пропуски: неравномерные показания за сутки (мкс), шаг - ~10 показаний
+    for n in sizes:
+        t = np.sort(rng.choice(86400 * 10**6, n, replace=False)).astype('datetime64[us]')
+        v = rng.normal(0, 1, n)
+        step = 86400 / n * 10
+        for fill in ('none', 'linear', 'ffill'):
+            stats = measure(lambda: resample(t, v, step, fill), repeat=3)
+            results.record('engine.resample', {'fill': fill, 'points': n}, stats)
+        stats = measure(lambda: find_gaps(t, t[0], t[-1]), repeat=3)
+        results.record('engine.gaps', {'points': n}, stats)
+
+    # Тепловая карта: расчет матрицы весов IDW (промах кэша) и карта по готовой матрице
+    for sensors in ([10, 50] if quick else [10, 50, 200]):
+        sensor_x, sensor_y = rng.uniform(0, 100, sensors), rng.uniform(0, 100, sensors)
+        grid = np.linspace(0, 100, 100)
+        weights = idw_weights(grid, grid, sensor_x, sensor_y)
+        values = rng.normal(0, 1, sensors)
+        stats = measure(lambda: idw_weights(grid, grid, sensor_x, sensor_y), repeat=3)
+        results.record('engine.heatmap_weights', {'sensors': sensors, 'grid': 100}, stats)
+        stats = measure(lambda: interpolate(weights, values), repeat=5)
+        results.record('engine.heatmap_interpolate', {'sensors': sensors, 'grid': 100}, stats)
+
+    # Корреляция датчиков здания: сутки с шагом 1 минута, 5% пропусков
+    for sensors in ([10, 50] if quick else [10, 50, 200]):
+        matrix = rng.normal(0, 1, (1441, sensors))
+        matrix[rng.random(matrix.shape) < 0.05] = np.nan
+        stats = measure(lambda: pairwise_correlation(matrix, matrix), repeat=3)
+        results.record('engine.correlation', {'sensors': sensors, 'bins': 1441}, stats)
+        stats = measure(lambda: lagged_correlation(matrix, 30), repeat=1)
+        results.record('engine.correlation_lagged', {'sensors': sensors, 'bins': 1441, 'lags': 30}, stats)
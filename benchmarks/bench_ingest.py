@@ -0,0 +1,121 @@
+# benchmarks/bench_ingest.py
+
+import itertools
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import get_app, build_synthetic_db, measure, BENCH_DB_PATH
+
+from server.mqtt.mqtt_client import MQTTClient
+from server.config import MQTT_BATCH_TOPIC
+from server.services import ingest_service
+from server.services.ingest_spool import IngestSpool
+
+
+_batch_numbers = itertools.count()
+
+
+class FakeMessage:
+    """Сообщение MQTT без брокера: вызываем _on_message напрямую"""
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload.encode('utf-8')
+
+
+def _throughput(count, fn):
+    """Выполняет fn count раз, возвращает (статистику, операций/с)"""
+    started = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    elapsed = time.perf_counter() - started
+    return {'total_ms': round(elapsed * 1000, 3)}, round(count / elapsed, 1)
+
+
+def _batch_message(sensor_ids, batch_size):
+    """Пакет показаний для темы шлюзов; метки времени разных пакетов не пересекаются"""
+    now = datetime.utcnow() - timedelta(hours=next(_batch_numbers))
+    return FakeMessage(MQTT_BATCH_TOPIC, json.dumps({'readings': [
+        {
+            'sensor_id': sensor_ids[i % len(sensor_ids)],
+            'value': 1.0 + i % 7,
+            'unit': 'мм',
+            'timestamp': (now - timedelta(microseconds=i)).isoformat() + 'Z'
+        }
+        for i in range(batch_size)
+    ]}))
+
+
+def run(results, quick=False):
+    app = get_app()
+    sensor_ids = build_synthetic_db(app, sensors_per_building=10, hours=0)
+    client = MQTTClient()
+    messages = 300 if quick else 2000
+
+    # Одиночные показания: прямой вызов записи
+    stats, rate = _throughput(messages, lambda i: client._save_to_database(
+        sensor_id=sensor_ids[i % len(sensor_ids)],
+        timestamp=datetime.utcnow(),
+        value=1.0 + i % 7,
+        unit='мм'
+    ))
+    results.record('ingest.save_to_database', {'messages': messages}, stats, readings_per_second=rate)
+
+    # Одиночные сообщения через обработчик (разбор темы и JSON)
+    payloads = [
+        FakeMessage(
+            f"geo/sensors/датчик трещин/{sensor_ids[i % len(sensor_ids)]}/data",
+            json.dumps({'value': 1.0 + i % 7, 'unit': 'мм', 'timestamp': datetime.utcnow().isoformat() + 'Z'})
+        )
+        for i in range(messages)
+    ]
+    stats, rate = _throughput(messages, lambda i: client._on_message(None, None, payloads[i]))
+    results.record('ingest.on_message', {'messages': messages}, stats, readings_per_second=rate)
+
+    # Те же сообщения через журнал на диске: обработчик только дописывает сегмент,
+    # запись в БД - отдельным проходом писателя (новые метки времени, иначе это повторы)
+    spool_dir = tempfile.mkdtemp(prefix='geo_bench_spool_')
+    spool = IngestSpool(spool_dir, db_path=BENCH_DB_PATH)
+    spooled_client = MQTTClient(spool=spool)
+    now = datetime.utcnow() - timedelta(hours=next(_batch_numbers))
+    payloads = [
+        FakeMessage(
+            f"geo/sensors/датчик трещин/{sensor_ids[i % len(sensor_ids)]}/data",
+            json.dumps({'value': 1.0 + i % 7, 'unit': 'мм', 'timestamp': (now - timedelta(microseconds=i)).isoformat() + 'Z'})
+        )
+        for i in range(messages)
+    ]
+    stats, rate = _throughput(messages, lambda i: spooled_client._on_message(None, None, payloads[i]))
+    results.record('ingest.on_message_spool', {'messages': messages}, stats, readings_per_second=rate)
+
+    stats, rate = _throughput(1, lambda i: spool.drain())
+    results.record('ingest.spool_drain', {'readings': messages}, stats, readings_per_second=rate * messages)
+    shutil.rmtree(spool_dir, ignore_errors=True)
+
+    # Пакеты через тему шлюзов (у каждого прогона свои метки времени, иначе это повторы)
+    for batch_size in ([100, 1000] if quick else [100, 1000, 10000]):
+        batches = iter([_batch_message(sensor_ids, batch_size) for _ in range(4)])
+        stats = measure(lambda: client._on_message(None, None, next(batches)), repeat=3)
+        results.record(
+            'ingest.batch_message', {'batch_size': batch_size}, stats,
+            readings_per_second=round(batch_size / (stats['p50_ms'] / 1000), 1)
+        )
+
+    # Повторная доставка пакета: отсекает фильтр в памяти или уникальный индекс БД
+    batch_size = 1000 if quick else 10000
+    batch = _batch_message(sensor_ids, batch_size)
+    client._on_message(None, None, batch)
+    for stage in ('cache', 'db'):
+        def redeliver():
+            if stage == 'db':
+                ingest_service._recent_keys.clear()
+            client._on_message(None, None, batch)
+
+        stats = measure(redeliver, repeat=3)
+        results.record(
+            'ingest.duplicate_batch', {'batch_size': batch_size, 'stage': stage}, stats,
+            readings_per_second=round(batch_size / (stats['p50_ms'] / 1000), 1)
+        )
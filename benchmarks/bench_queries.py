@@ -0,0 +1,123 @@
+# benchmarks/bench_queries.py
+
+from datetime import datetime, timedelta
+
+from benchmarks.common import get_app, build_synthetic_db, measure
+
+from sqlalchemy import text
+from server.database.db import db
+from server.database.timestamps import to_db
+from server.services.data_service import DataService
+from server.services.approximation_service import ApproximationService
+from server.services.reading_buffer import reading_buffer
+from server.services.alert_events import AlertEventService
+
+
+def run(results, quick=False):
+    app = get_app()
+    client = app.test_client()
+
+    # GET /sensors в зависимости от количества датчиков
+    for sensor_count in ([10, 50] if quick else [10, 100, 500, 1000]):
+        build_synthetic_db(app, buildings=1, sensors_per_building=sensor_count, hours=24, readings_per_hour=1)
+
+        def get_sensors():
+            response = client.get('/api/v1/geo/sensors')
+            assert response.status_code == 200
+
+        results.record('api.get_sensors', {'sensors': sensor_count}, measure(get_sensors, repeat=3 if quick else 5))
+
+    # get_readings_simple в зависимости от ширины окна (1 показание в минуту за неделю)
+    readings_per_hour = 12 if quick else 60
+    sensor_ids = build_synthetic_db(app, sensors_per_building=1, hours=168, readings_per_hour=readings_per_hour)
+
+    for hours in [1, 6, 24, 72, 168]:
+        def get_readings():
+            with app.app_context():
+                DataService.get_readings_simple(sensor_ids[0], hours)
+                db.session.remove()
+
+        results.record(
+            'service.get_readings_simple',
+            {'hours': hours, 'points': hours * readings_per_hour},
+            measure(get_readings, repeat=3 if quick else 5)
+        )
+
+    # Показания и аппроксимация за сутки: буфер в памяти против SQL
+    for points in ([10000] if quick else [10000, 100000]):
+        sensor_ids = build_synthetic_db(app, sensors_per_building=1, hours=24, readings_per_hour=points / 24)
+
+        def read_columns():
+            with app.app_context():
+                DataService.get_readings_columns(sensor_ids[0], 24)
+                db.session.remove()
+
+        def approximate():
+            with app.app_context():
+                result = ApproximationService.get_polynomial_approximation(sensor_ids[0], 24, 3, 50)
+                assert result['error'] is None, result['error']
+                db.session.remove()
+
+        for buffered in (False, True):
+            # Синтетические показания записаны в обход IngestService - буфер заполняет первый промах
+            reading_buffer.clear()
+            reading_buffer.enabled = buffered
+            for name, fn in (('service.get_readings_columns', read_columns),
+                             ('service.polynomial_approximation', approximate)):
+                results.record(
+                    name,
+                    {'points': points, 'source': 'buffer' if buffered else 'sql'},
+                    measure(fn, repeat=3 if quick else 5)
+                )
+        reading_buffer.enabled = False
+        reading_buffer.clear()
+
+    # /alerts: инциденты alert_event против прежнего поиска тревог среди показаний
+    readings_per_hour = 60 if quick else 360
+    for sensor_count in ([10] if quick else [10, 50]):
+        sensor_ids = build_synthetic_db(app, sensors_per_building=sensor_count, hours=24,
+                                        readings_per_hour=readings_per_hour)
+
+        # Датчик, застрявший за порогом: тревога на каждом показании - один инцидент
+        with app.app_context():
+            db.session.execute(text("UPDATE sensor_reading SET is_alert = 1 WHERE sensor_id = :sensor_id"),
+                               {'sensor_id': sensor_ids[0]})
+            AlertEventService.rebuild(db.session.connection().connection.cursor(), [sensor_ids[0]])
+            db.session.commit()
+            db.session.remove()
+
+        def get_alerts():
+            response = client.get('/api/v1/geo/alerts?hours=24')
+            assert response.status_code == 200
+
+        def scan_alert_readings():
+            with app.app_context():
+                db.session.execute(text("""
+                    SELECT r.id, r.sensor_id, s.name, s.building_id, r.value, r.unit, r.timestamp
+                    FROM sensor_reading r
+                    LEFT JOIN sensor s ON s.id = r.sensor_id
+                    WHERE r.is_alert = 1 AND r.timestamp >= :start_time
+                    ORDER BY r.timestamp DESC
+                """), {'start_time': to_db(datetime.utcnow() - timedelta(hours=24))}).fetchall()
+                db.session.remove()
+
+        params = {'readings': sensor_count * 24 * readings_per_hour, 'alert_readings': 24 * readings_per_hour}
+        results.record('api.get_alerts', params, measure(get_alerts, repeat=3 if quick else 5))
+        results.record('sql.alert_readings_scan', params, measure(scan_alert_readings, repeat=3 if quick else 5))
+
+    # /aggregate: часовые агрегаты reading_rollup против GROUP BY по показаниям
+    readings_per_hour = 60 if quick else 360
+    sensor_ids = build_synthetic_db(app, sensors_per_building=10, hours=168, readings_per_hour=readings_per_hour)
+    query = f"/api/v1/geo/aggregate?sensor_ids={','.join(map(str, sensor_ids))}&hours=168"
+
+    for bucket, agg, source in (('1h', 'min,max,avg,count', 'rollup'), ('1h', 'min,max,avg,count', 'raw'),
+                                ('1d', 'min,max,avg,count', 'rollup'), ('1h', 'avg,p95', 'raw')):
+        def get_aggregate():
+            response = client.get(f'{query}&bucket={bucket}&agg={agg}&source={source}')
+            assert response.status_code == 200, response.get_json()
+
+        results.record(
+            'api.get_aggregate',
+            {'readings': len(sensor_ids) * 168 * readings_per_hour, 'bucket': bucket, 'agg': agg, 'source': source},
+            measure(get_aggregate, repeat=3 if quick else 5)
+        )
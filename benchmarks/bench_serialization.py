@@ -0,0 +1,74 @@
+# benchmarks/bench_serialization.py
+
+from benchmarks.common import get_app, build_synthetic_db, measure
+
+from flask import jsonify
+
+from server.database.db import db
+from server.services.data_service import DataService
+from server.utils import serialization
+
+
+def _legacy_readings(app, sensor_id):
+    """Прежний путь: объекты ORM, словарь и isoformat() на каждое показание, jsonify"""
+    with app.test_request_context():
+        readings = DataService.get_readings_simple(sensor_id, 24)
+        result = []
+        for reading in readings:
+            result.append({
+                'id': reading.id,
+                'value': reading.value,
+                'unit': reading.unit,
+                'timestamp': reading.timestamp.isoformat() + 'Z',
+                'is_alert': reading.is_alert
+            })
+        jsonify(result).get_data()
+        db.session.remove()
+
+
+def run(results, quick=False):
+    app = get_app()
+    client = app.test_client()
+    orjson = serialization._get_orjson()
+
+    for points in ([1000, 10000] if quick else [1000, 10000, 100000]):
+        sensor_ids = build_synthetic_db(app, sensors_per_building=1, hours=24, readings_per_hour=points / 24)
+        sensor_id = sensor_ids[0]
+        repeat = 3 if quick else 5
+
+        results.record(
+            'serialization.readings', {'points': points, 'format': 'legacy_rows'},
+            measure(lambda: _legacy_readings(app, sensor_id), repeat=repeat)
+        )
+
+        # Новый путь через API для всех раскладок и форматов времени
+        for layout, ts_format in (('rows', 'iso'), ('columns', 'iso'), ('columns', 'epoch')):
+            url = f'/api/v1/geo/sensors/{sensor_id}/readings?layout={layout}&ts_format={ts_format}'
+
+            def request_readings():
+                response = client.get(url)
+                assert response.status_code == 200
+
+            encoders = [('json', False)] + ([('orjson', orjson)] if orjson else [])
+            for encoder_name, encoder in encoders:
+                serialization._orjson = encoder
+                results.record(
+                    'serialization.readings',
+                    {'points': points, 'format': f'{layout}/{ts_format}', 'encoder': encoder_name},
+                    measure(request_readings, repeat=repeat)
+                )
+        serialization._orjson = None
+
+        # Бинарные столбцы: тот же эндпоинт и выгрузка (arrow - если установлен pyarrow)
+        formats = ['npy'] + (['arrow'] if serialization._get_pyarrow() else [])
+        for fmt in formats:
+            for name, url in (('readings', f'/api/v1/geo/sensors/{sensor_id}/readings?format={fmt}'),
+                              ('export', f'/api/v1/geo/readings/export?sensor_id={sensor_id}&format={fmt}')):
+                def request_binary():
+                    response = client.get(url)
+                    assert response.status_code == 200
+
+                results.record(
+                    f'serialization.{name}', {'points': points, 'format': fmt},
+                    measure(request_binary, repeat=repeat)
+                )
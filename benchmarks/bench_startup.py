@@ -0,0 +1,54 @@
+# benchmarks/bench_startup.py
+
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import BENCH_DB_PATH
+
+HEAVY_MODULES = ('numpy', 'sklearn', 'paho')
+
+# Сценарии запускаются в отдельном интерпретаторе, чтобы кеш модулей был холодным
+SCENARIOS = {
+    'import_app': "import server.app",
+    'create_app_api': "from server.app import create_app; create_app(subsystems=('api',))",
+    'create_app_core': "from server.app import create_app; create_app(subsystems=())",
+    'import_mqtt_client': "import server.mqtt.mqtt_client"
+}
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'heavy': sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def _run_scenario(code):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(code=code, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(results, quick=False):
+    repeat = 3 if quick else 7
+
+    for name, code in SCENARIOS.items():
+        runs = [_run_scenario(code) for _ in range(repeat)]
+        timings = sorted(run['seconds'] * 1000 for run in runs)
+        results.record(
+            f'startup.{name}',
+            {'db': BENCH_DB_PATH},
+            {
+                'repeat': repeat,
+                'mean_ms': round(statistics.mean(timings), 3),
+                'p50_ms': round(statistics.median(timings), 3),
+                'min_ms': round(timings[0], 3),
+                'max_ms': round(timings[-1], 3)
+            },
+            heavy_modules_loaded=runs[-1]['heavy']
+        )
@@ -0,0 +1,101 @@
+# benchmarks/bench_timestamps.py
+#
+# Хранение времени: text против epoch_us. Режим выбирается при импорте server.config,
+# поэтому каждый режим измеряется в отдельном интерпретаторе со своей БД.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+STORAGES = ('text', 'epoch_us')
+
+
+def _probe(quick):
+    """Измерения в текущем режиме (GEO_TIMESTAMP_STORAGE), результаты - JSON в stdout"""
+    from benchmarks.common import get_app, build_synthetic_db, measure
+
+    from sqlalchemy import text
+    from server.database.db import db
+    from server.database.timestamps import to_db
+    from server.services.data_service import DataService
+    from server.services.ingest_service import IngestService
+    from server.config import SQLITE_DB_PATH
+
+    app = get_app()
+    records = []
+    repeat = 3 if quick else 5
+
+    # Запись: пакет нормализованных показаний одной транзакцией
+    sensor_ids = build_synthetic_db(app, sensors_per_building=10, hours=0)
+    batch_size = 2000 if quick else 10000
+    now = datetime.utcnow()
+    batches = iter([
+        [
+            {'sensor_id': sensor_ids[i % len(sensor_ids)], 'timestamp': now - timedelta(hours=run, milliseconds=i),
+             'value': 1.0 + i % 7, 'unit': 'мм'}
+            for i in range(batch_size)
+        ]
+        for run in range(repeat + 1)
+    ])
+    stats = measure(lambda: IngestService.write_readings(next(batches), db_path=SQLITE_DB_PATH, source='bench'),
+                    repeat=repeat)
+    records.append(('timestamps.ingest_batch', {'readings': batch_size}, stats))
+
+    # Только преобразование времени к формату хранения
+    timestamps = [now - timedelta(milliseconds=i) for i in range(batch_size)]
+    stats = measure(lambda: [to_db(timestamp) for timestamp in timestamps], repeat=repeat)
+    records.append(('timestamps.to_db', {'readings': batch_size}, stats))
+
+    # Чтение большого окна одного датчика
+    for points in ([10000] if quick else [10000, 100000]):
+        sensor_id = build_synthetic_db(app, sensors_per_building=1, hours=24, readings_per_hour=points / 24)[0]
+
+        def read_columns():
+            with app.app_context():
+                DataService.get_readings_columns(sensor_id, 24)
+                db.session.remove()
+
+        def read_orm():
+            with app.app_context():
+                DataService.get_readings_simple(sensor_id, 24)
+                db.session.remove()
+
+        def export():
+            with app.app_context():
+                DataService.export_readings([sensor_id], now - timedelta(hours=25), None)
+                db.session.remove()
+
+        def count_window():
+            # Условие по времени без индекса: сравнение строк или целых на каждой строке
+            with app.app_context():
+                db.session.execute(
+                    text("SELECT COUNT(*) FROM sensor_reading WHERE timestamp >= :since"),
+                    {'since': to_db(datetime.utcnow() - timedelta(hours=12))}
+                ).scalar()
+                db.session.remove()
+
+        for name, fn in (('read_columns', read_columns), ('read_orm', read_orm),
+                         ('export', export), ('count_window', count_window)):
+            records.append((f'timestamps.{name}', {'points': points}, measure(fn, repeat=repeat)))
+
+    print(json.dumps(records))
+
+
+def run(results, quick=False):
+    for storage in STORAGES:
+        env = dict(
+            os.environ,
+            GEO_TIMESTAMP_STORAGE=storage,
+            GEO_BENCH_DB=os.path.join(tempfile.gettempdir(), f'geo_monitoring_bench_{storage}.db')
+        )
+        command = [sys.executable, '-m', 'benchmarks.bench_timestamps'] + (['--quick'] if quick else [])
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        for name, params, stats in json.loads(output.strip().splitlines()[-1]):
+            results.record(name, dict(params, storage=storage), stats)
+
+
+if __name__ == '__main__':
+    _probe('--quick' in sys.argv)
@@ -0,0 +1,183 @@
+# benchmarks/common.py
+
+import json
+import os
+import platform
+import statistics
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# БД бенчмарков задается ДО импорта server.config: рабочая БД не затрагивается
+# (для режима epoch_us - отдельный файл, чтобы не смешивать форматы времени)
+_BENCH_DB_NAME = 'geo_monitoring_bench.db' if os.environ.get('GEO_TIMESTAMP_STORAGE', 'text') == 'text' \
+    else f"geo_monitoring_bench_{os.environ['GEO_TIMESTAMP_STORAGE']}.db"
+BENCH_DB_PATH = os.environ.get('GEO_BENCH_DB', os.path.join(tempfile.gettempdir(), _BENCH_DB_NAME))
+os.environ['GEO_MONITORING_DB'] = BENCH_DB_PATH
+
+if 'server.config' in sys.modules and sys.modules['server.config'].DB_PATH != BENCH_DB_PATH:
+    raise RuntimeError('benchmarks.common нужно импортировать до модулей server')
+
+import numpy as np
+
+from server.database.db import db
+from server.config import TIMESTAMP_STORAGE
+from server.database.timestamps import datetime64_to_db
+from server.services.alert_events import AlertEventService
+from server.services.rollups import RollupService
+from server.utils.data_generator import DataGenerator
+
+_app = None
+
+
+def get_app():
+    """Flask-приложение без MQTT поверх БД бенчмарков"""
+    global _app
+    if _app is None:
+        from server.app import create_app
+        _app = create_app(subsystems=("api",))
+    return _app
+
+
+def reset_database(app):
+    """Очищает все таблицы (файл БД и пул соединений сохраняются)"""
+    with app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        db.session.remove()
+
+
+def build_synthetic_db(app, buildings=1, sensors_per_building=10, hours=24, readings_per_hour=12, seed=42):
+    """
+    Заполняет БД синтетическими данными заданного размера
+
+    Здания, датчики и настройки тревог создаются через ORM, показания -
+    векторным генератором и одним executemany на датчик.
+
+    Returns:
+        list: id созданных датчиков
+    """
+    import random
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+
+    reset_database(app)
+
+    with app.app_context():
+        building_objs = DataGenerator.generate_sample_buildings(count=buildings)
+        db.session.add_all(building_objs)
+        db.session.add_all(DataGenerator.generate_alert_configs())
+        db.session.commit()
+
+        sensors = DataGenerator.generate_sample_sensors(building_objs, count_per_building=sensors_per_building)
+        db.session.add_all(sensors)
+        db.session.commit()
+
+        sensor_rows = [(sensor.id, sensor.sensor_type) for sensor in sensors]
+        thresholds = {
+            config.sensor_type: (config.min_threshold, config.max_threshold)
+            for config in DataGenerator.generate_alert_configs()
+        }
+        db.session.remove()
+
+    count = int(hours * readings_per_hour)
+    if count > 0:
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours)
+
+        conn = sqlite3.connect(BENCH_DB_PATH)
+        try:
+            with conn:
+                for sensor_id, sensor_type in sensor_rows:
+                    timestamps, values, unit = DataGenerator.generate_series(
+                        sensor_type, start_time, end_time, count, rng
+                    )
+                    min_threshold, max_threshold = thresholds.get(sensor_type, (None, None))
+                    alerts = np.zeros(count, dtype=bool)
+                    if min_threshold is not None:
+                        alerts |= values < min_threshold
+                    if max_threshold is not None:
+                        alerts |= values > max_threshold
+
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO sensor_reading (sensor_id, timestamp, value, unit, is_alert) VALUES (?, ?, ?, ?, ?)",
+                        zip([sensor_id] * count, datetime64_to_db(timestamps), values.tolist(),
+                            [unit] * count, alerts.astype(int).tolist())
+                    )
+                # Инциденты тревог и часовые агрегаты (показания записаны в обход IngestService)
+                AlertEventService.rebuild(conn.cursor())
+                RollupService.rebuild(conn.cursor())
+        finally:
+            conn.close()
+
+    return [sensor_id for sensor_id, _ in sensor_rows]
+
+
+def measure(fn, repeat=5, warmup=1):
+    """Время выполнения fn: статистика по нескольким прогонам, в миллисекундах"""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(statistics.median(timings), 3),
+        'min_ms': round(timings[0], 3),
+        'max_ms': round(timings[-1], 3)
+    }
+
+
+class Results:
+    """Набор результатов бенчмарков с выводом в JSON"""
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, name, params, stats, **extra):
+        entry = {'name': name, 'params': params}
+        entry.update(stats)
+        entry.update(extra)
+        self.records.append(entry)
+        timing = stats.get('p50_ms', stats.get('total_ms'))
+        summary = f'{timing} мс ' if timing is not None else ''
+        print(f"{name} {params}: {summary}{extra if extra else ''}", file=sys.stderr)
+
+    def to_dict(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+
+        return {
+            'meta': {
+                'created_at': datetime.utcnow().isoformat() + 'Z',
+                'commit': commit,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'numpy': np.__version__,
+                'timestamp_storage': TIMESTAMP_STORAGE
+            },
+            'results': self.records
+        }
+
+    def emit(self, path=None):
+        data = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            print(f"Результаты записаны в {path}", file=sys.stderr)
+        else:
+            print(data)
@@ -0,0 +1,46 @@
+# benchmarks/run.py
+#
+# Запуск: python -m benchmarks.run [--quick] [--only ingest,queries] [--output results.json]
+
+import argparse
+
+from benchmarks.common import Results
+
+from benchmarks import (
+    bench_ingest, bench_queries, bench_approximation, bench_startup, bench_engines, bench_anomaly,
+    bench_serialization, bench_timestamps
+)
+
+SUITES = {
+    'ingest': bench_ingest,
+    'queries': bench_queries,
+    'approximation': bench_approximation,
+    'engines': bench_engines,
+    'anomaly': bench_anomaly,
+    'serialization': bench_serialization,
+    'timestamps': bench_timestamps,
+    'startup': bench_startup
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки системы геомониторинга')
+    parser.add_argument('--quick', action='store_true', help='Уменьшенные размеры данных')
+    parser.add_argument('--only', help=f"Наборы через запятую: {', '.join(SUITES)}")
+    parser.add_argument('--output', help='Файл для JSON-результатов (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SUITES)
+    unknown = [name for name in names if name not in SUITES]
+    if unknown:
+        parser.error(f"Неизвестные наборы: {', '.join(unknown)}")
+
+    results = Results()
+    for name in names:
+        SUITES[name].run(results, quick=args.quick)
+
+    results.emit(args.output)
+
+
+if __name__ == '__main__':
+    main()
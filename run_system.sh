@@ -7,7 +7,7 @@ SERVER_PID=$!
 
 sleep 5
 echo "Инициализация тестовыми данными..."
-curl http://localhost:5000/init-sample-data
+curl "http://localhost:5000/init-sample-data?wait=60"
 
 echo "Запуск симулятора датчиков..."
 python sensors_simulator.py --interval 1 &
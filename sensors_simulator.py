@@ -5,18 +5,63 @@ import json
 import random
 import math
 import argparse
-from datetime import datetime
+import threading
+import os
+from datetime import datetime, timedelta
 import paho.mqtt.client as mqtt
 import sqlite3
 
+# Базовые значения для типов датчиков
+SENSOR_CONFIGS = {
+    'инклинометр': {'base': 0, 'noise': 0.5, 'range': 3, 'unit': 'градусы'},
+    'тензометр': {'base': 0, 'noise': 1.0, 'range': 10, 'unit': 'мкм/м'},
+    'акселерометр': {'base': 5, 'noise': 2.0, 'range': 8, 'unit': 'мм/с²'},
+    'датчик трещин': {'base': 0.5, 'noise': 0.1, 'range': 1, 'unit': 'мм'},
+    'датчик температуры': {'base': 20, 'noise': 1.0, 'range': 10, 'unit': '°C'}
+}
+
+EPOCH = datetime(1970, 1, 1)
+
+def epoch_us(value):
+    """Время показания в микросекундах Unix: из datetime или из БД (строка или целое - режим epoch_us)"""
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def generate_value(sensor_type, rng=random):
+    """Генерирует реалистичное значение для датчика заданного типа"""
+    config = SENSOR_CONFIGS.get(sensor_type, {'base': 0, 'noise': 1, 'range': 5})
+    
+    # Базовое значение + шум + периодические колебания
+    base = config['base']
+    noise = rng.uniform(-1, 1) * config['noise']
+    
+    # Периодические изменения (имитация суточного цикла)
+    hour = datetime.now().hour
+    periodic = math.sin(hour * math.pi / 12) * config['range'] * 0.3
+    
+    # Медленный тренд (очень малый)
+    trend = rng.uniform(-0.1, 0.1)
+    
+    # Иногда аномалии (5% шанс)
+    if rng.random() < 0.05:
+        anomaly = rng.uniform(-1, 1) * config['range']
+    else:
+        anomaly = 0
+        
+    return base + noise + periodic + trend + anomaly
+
 class SensorsSimulator:
     """Упрощенный симулятор датчиков"""
     
-    def __init__(self, db_path, mqtt_broker, mqtt_port, interval):
+    def __init__(self, db_path, mqtt_broker, mqtt_port, interval, quiet=False):
         self.db_path = db_path
         self.mqtt_broker = mqtt_broker
         self.mqtt_port = mqtt_port
         self.interval = interval
+        self.quiet = quiet
         
         # MQTT клиент
         self.client = mqtt.Client()
@@ -80,38 +125,7 @@ class SensorsSimulator:
     
     def _generate_value(self, sensor):
         """Генерирует реалистичное значение для датчика"""
-        
-        # Базовые значения
-        sensor_configs = {
-            'инклинометр': {'base': 0, 'noise': 0.5, 'range': 3},
-            'тензометр': {'base': 0, 'noise': 1.0, 'range': 10},
-            'акселерометр': {'base': 5, 'noise': 2.0, 'range': 8},
-            'датчик трещин': {'base': 0.5, 'noise': 0.1, 'range': 1},
-            'датчик температуры': {'base': 20, 'noise': 1.0, 'range': 10}
-        }
-        
-        config = sensor_configs.get(sensor['sensor_type'], {'base': 0, 'noise': 1, 'range': 5})
-        
-        # Базовое значение + шум + периодические колебания
-        base = config['base']
-        noise = random.uniform(-1, 1) * config['noise']
-        
-        # Периодические изменения (имитация суточного цикла)
-        hour = datetime.now().hour
-        periodic = math.sin(hour * math.pi / 12) * config['range'] * 0.3
-        
-        # Медленный тренд (очень малый)
-        trend = random.uniform(-0.1, 0.1)
-        
-        # Иногда аномалии (5% шанс)
-        if random.random() < 0.05:
-            anomaly = random.uniform(-1, 1) * config['range']
-        else:
-            anomaly = 0
-            
-        value = base + noise + periodic + trend + anomaly
-        
-        return value
+        return generate_value(sensor['sensor_type'])
     
     def run(self):
         """Запуск симуляции"""
@@ -143,7 +157,8 @@ class SensorsSimulator:
                     
                     # Отправляем
                     self.client.publish(topic, json.dumps(message))
-                    print(f"→ {sensor['name']}: {message['value']} {message['unit']}")
+                    if not self.quiet:
+                        print(f"→ {sensor['name']}: {message['value']} {message['unit']}")
                 
                 time.sleep(self.interval)
         
@@ -152,20 +167,277 @@ class SensorsSimulator:
         finally:
             self.disconnect()
 
+class LoadGenerator:
+    """
+    Генератор нагрузки: виртуальные датчики с заданной суммарной частотой
+    
+    Публикация идет из нескольких потоков, у каждого свой MQTT клиент и
+    свой генератор случайных чисел (воспроизводимо при заданном seed).
+    Часть сообщений помечается для измерения задержки: время публикации
+    сравнивается с моментом появления строки в БД.
+    """
+    
+    LOAD_BUILDING_NAME = 'Нагрузочный тест'
+    
+    def __init__(self, db_path, mqtt_broker, mqtt_port, rate, num_sensors,
+                 threads=4, qos=0, seed=None, duration=60, batch_size=1,
+                 sensor_id_offset=100000, register_sensors=False, latency_sample=0.01):
+        self.db_path = db_path
+        self.mqtt_broker = mqtt_broker
+        self.mqtt_port = mqtt_port
+        self.rate = rate
+        self.num_sensors = num_sensors
+        self.threads = max(1, threads)
+        self.qos = qos
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.duration = duration
+        self.batch_size = max(1, batch_size)
+        self.sensor_id_offset = sensor_id_offset
+        self.register_sensors = register_sensors
+        self.latency_sample = latency_sample
+        
+        # Виртуальные датчики не привязаны к БД: типы назначаются по кругу
+        sensor_types = list(SENSOR_CONFIGS)
+        self.sensors = [
+            {
+                'id': sensor_id_offset + i,
+                'sensor_type': sensor_types[i % len(sensor_types)],
+                'unit': SENSOR_CONFIGS[sensor_types[i % len(sensor_types)]]['unit']
+            }
+            for i in range(num_sensors)
+        ]
+        
+        self._pending = {}  # (sensor_id, время в микросекундах Unix) -> время публикации
+        self._pending_lock = threading.Lock()
+        self._latencies = []
+        self._published = [0] * self.threads
+        self._stop = threading.Event()
+    
+    def _register_sensors(self):
+        """Создает виртуальные датчики в БД, чтобы сервер принимал их показания"""
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        try:
+            with conn:
+                row = conn.execute("SELECT id FROM building WHERE name = ?", (self.LOAD_BUILDING_NAME,)).fetchone()
+                if row:
+                    building_id = row[0]
+                else:
+                    building_id = conn.execute(
+                        "INSERT INTO building (name, address, building_type, created_at) VALUES (?, ?, ?, ?)",
+                        (self.LOAD_BUILDING_NAME, '-', 'Тестовое', datetime.utcnow())
+                    ).lastrowid
+                
+                conn.executemany(
+                    "INSERT OR IGNORE INTO sensor (id, name, sensor_type, location, building_id, status, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'virtual', ?)",
+                    [
+                        (sensor['id'], f"Виртуальный {sensor['id']}", sensor['sensor_type'], '-', building_id, datetime.utcnow())
+                        for sensor in self.sensors
+                    ]
+                )
+            print(f"Зарегистрировано виртуальных датчиков: {len(self.sensors)}")
+        finally:
+            conn.close()
+    
+    def _make_client(self, index):
+        """Отдельный MQTT клиент для потока публикации"""
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"geo-load-{os.getpid()}-{index}")
+        client.max_inflight_messages_set(1000)
+        client.connect(self.mqtt_broker, self.mqtt_port, 60)
+        client.loop_start()
+        return client
+    
+    def _publisher(self, index):
+        """Поток публикации: равномерно отправляет свою долю сообщений"""
+        rng = random.Random(self.seed + index)
+        sensors = self.sensors[index::self.threads] or self.sensors
+        thread_rate = self.rate / self.threads
+        messages_per_second = thread_rate / self.batch_size
+        period = 1.0 / messages_per_second if messages_per_second > 0 else 0
+        
+        client = self._make_client(index)
+        next_time = time.perf_counter()
+        end_time = next_time + self.duration
+        sensor_index = 0
+        
+        try:
+            while not self._stop.is_set() and time.perf_counter() < end_time:
+                readings = []
+                for _ in range(self.batch_size):
+                    sensor = sensors[sensor_index % len(sensors)]
+                    sensor_index += 1
+                    now = datetime.utcnow()
+                    readings.append((sensor, now, round(generate_value(sensor['sensor_type'], rng), 4)))
+                
+                if self.batch_size == 1:
+                    sensor, now, value = readings[0]
+                    topic = f"geo/sensors/{sensor['sensor_type']}/{sensor['id']}/data"
+                    payload = {'value': value, 'unit': sensor['unit'], 'timestamp': now.isoformat() + 'Z'}
+                else:
+                    topic = 'geo/sensors/batch'
+                    payload = {'readings': [
+                        {'sensor_id': sensor['id'], 'value': value, 'unit': sensor['unit'],
+                         'timestamp': now.isoformat() + 'Z'}
+                        for sensor, now, value in readings
+                    ]}
+                
+                published_at = time.time()
+                client.publish(topic, json.dumps(payload), qos=self.qos)
+                self._published[index] += len(readings)
+                
+                # Выборочно запоминаем сообщения для измерения задержки
+                if rng.random() < self.latency_sample:
+                    sensor, now, _ = readings[-1]
+                    with self._pending_lock:
+                        self._pending[(sensor['id'], epoch_us(now))] = published_at
+                
+                # Равномерный темп: спим до следующего слота
+                next_time += period
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            client.loop_stop()
+            client.disconnect()
+    
+    def _latency_probe(self):
+        """Опрашивает БД и фиксирует момент появления помеченных показаний"""
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        try:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_reading").fetchone()[0]
+            while True:
+                stopping = self._stop.is_set()
+                rows = conn.execute(
+                    "SELECT id, sensor_id, timestamp FROM sensor_reading WHERE id > ? ORDER BY id",
+                    (last_id,)
+                ).fetchall()
+                seen_at = time.time()
+                
+                if rows:
+                    last_id = rows[-1][0]
+                    with self._pending_lock:
+                        for _, sensor_id, timestamp in rows:
+                            published_at = self._pending.pop((sensor_id, epoch_us(timestamp)), None)
+                            if published_at is not None:
+                                self._latencies.append(seen_at - published_at)
+                
+                if stopping:
+                    break
+                time.sleep(0.1)
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _percentile(values, percent):
+        """Перцентиль по отсортированному списку"""
+        if not values:
+            return None
+        index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+        return values[index]
+    
+    def run(self):
+        """Запуск нагрузки и отчет о производительности"""
+        if self.register_sensors:
+            self._register_sensors()
+        
+        print(f"Нагрузка: {self.rate} показаний/с, датчиков {self.num_sensors}, потоков {self.threads}, "
+              f"QoS {self.qos}, пакет {self.batch_size}, seed {self.seed}, {self.duration} с")
+        
+        probe = threading.Thread(target=self._latency_probe, daemon=True)
+        probe.start()
+        
+        workers = [threading.Thread(target=self._publisher, args=(i,), daemon=True) for i in range(self.threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            print("\nНагрузка остановлена")
+            self._stop.set()
+            for worker in workers:
+                worker.join()
+        elapsed = time.perf_counter() - started
+        
+        # Даем серверу дописать хвост очереди
+        time.sleep(2.0)
+        self._stop.set()
+        probe.join()
+        
+        published = sum(self._published)
+        latencies = sorted(self._latencies)
+        report = {
+            'published': published,
+            'elapsed_seconds': round(elapsed, 3),
+            'publish_rate': round(published / elapsed, 1) if elapsed > 0 else 0,
+            'target_rate': self.rate,
+            'threads': self.threads,
+            'qos': self.qos,
+            'batch_size': self.batch_size,
+            'seed': self.seed,
+            'latency_samples': len(latencies),
+            'latency_lost': len(self._pending),
+            'latency_ms': {
+                name: round(value * 1000, 1) if value is not None else None
+                for name, value in (
+                    ('p50', self._percentile(latencies, 50)),
+                    ('p95', self._percentile(latencies, 95)),
+                    ('p99', self._percentile(latencies, 99)),
+                    ('max', latencies[-1] if latencies else None)
+                )
+            }
+        }
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return report
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Симулятор датчиков')
     parser.add_argument('--db', default='server/geo_monitoring.db', help='Путь к БД')
     parser.add_argument('--broker', default='localhost', help='MQTT брокер')
     parser.add_argument('--port', type=int, default=1883, help='MQTT порт')
-    parser.add_argument('--interval', type=int, default=10, help='Интервал в секундах')
+    parser.add_argument('--interval', type=float, default=10, help='Интервал в секундах')
+    parser.add_argument('--quiet', action='store_true', help='Не печатать каждое сообщение')
     
-    args = parser.parse_args()
+    # Режим нагрузки
+    parser.add_argument('--rate', type=float, help='Режим нагрузки: суммарная частота, показаний/с')
+    parser.add_argument('--sensors', type=int, default=100, help='Количество виртуальных датчиков')
+    parser.add_argument('--threads', type=int, default=4, help='Потоков публикации')
+    parser.add_argument('--qos', type=int, choices=(0, 1, 2), default=0, help='MQTT QoS')
+    parser.add_argument('--seed', type=int, help='Seed для воспроизводимых значений')
+    parser.add_argument('--duration', type=float, default=60, help='Длительность нагрузки, с')
+    parser.add_argument('--batch', type=int, default=1, help='Показаний в сообщении (>1 - тема пакетов)')
+    parser.add_argument('--sensor-id-offset', type=int, default=100000, help='Первый id виртуального датчика')
+    parser.add_argument('--register-sensors', action='store_true',
+                        help='Создать виртуальные датчики в БД (нужно для измерения задержки)')
+    parser.add_argument('--latency-sample', type=float, default=0.01, help='Доля сообщений для измерения задержки')
     
-    simulator = SensorsSimulator(
-        db_path=args.db,
-        mqtt_broker=args.broker,
-        mqtt_port=args.port,
-        interval=args.interval
-    )
+    args = parser.parse_args()
     
-    simulator.run()
\ No newline at end of file
+    if args.rate:
+        LoadGenerator(
+            db_path=args.db,
+            mqtt_broker=args.broker,
+            mqtt_port=args.port,
+            rate=args.rate,
+            num_sensors=args.sensors,
+            threads=args.threads,
+            qos=args.qos,
+            seed=args.seed,
+            duration=args.duration,
+            batch_size=args.batch,
+            sensor_id_offset=args.sensor_id_offset,
+            register_sensors=args.register_sensors,
+            latency_sample=args.latency_sample
+        ).run()
+    else:
+        simulator = SensorsSimulator(
+            db_path=args.db,
+            mqtt_broker=args.broker,
+            mqtt_port=args.port,
+            interval=args.interval,
+            quiet=args.quiet
+        )
+        
+        simulator.run()
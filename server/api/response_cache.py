@@ -0,0 +1,108 @@
+# server/api/response_cache.py
+
+import functools
+import hashlib
+from flask import Response, current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from server.config import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_AGE
+from server.models.sensor_data import Building, Sensor, AlertConfig
+from server.monitoring import metrics
+from server.services.ingest_service import IngestService
+from server.utils.cache import VersionedCache, versions, sensor_data_version
+
+# Модели, изменение которых меняет метаданные (здания, датчики, пороги)
+METADATA_MODELS = (Building, Sensor, AlertConfig)
+
+_response_cache = VersionedCache(versions, max_entries=1024)
+
+
+def cached_response(*dependencies, ttl=RESPONSE_CACHE_TTL, max_age=RESPONSE_CACHE_MAX_AGE):
+    """
+    Кэширует успешные JSON-ответы по пути и параметрам запроса
+
+    ETag - хэш тела ответа (сильный). Пока версии зависимостей не изменились,
+    ответ и условный запрос (If-None-Match -> 304) обслуживаются из памяти
+    без обращения к БД.
+
+    Args:
+        dependencies: имена счетчиков версий или функции от аргументов маршрута,
+            возвращающие имя (например, sensor_data_version)
+        ttl (float): предел жизни записи, секунды (запись из другого процесса не видна счетчикам)
+        max_age (int): max-age для Cache-Control
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            depends_on = tuple(
+                dependency(**kwargs) if callable(dependency) else dependency
+                for dependency in dependencies
+            )
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+
+            entry = _response_cache.get(key, depends_on, ttl=ttl)
+            if entry is None:
+                snapshot = versions.snapshot(depends_on)
+                response = current_app.make_response(view(**kwargs))
+
+                # Ошибки не кэшируются
+                if response.status_code != 200:
+                    return response
+
+                body = response.get_data()
+                entry = (body, response.mimetype, hashlib.sha1(body).hexdigest())
+                _response_cache.set(key, entry, depends_on, snapshot)
+                result = 'miss'
+            else:
+                result = 'hit'
+
+            body, mimetype, etag = entry
+            response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = f'public, max-age={max_age}, must-revalidate'
+            response = response.make_conditional(request)
+
+            if response.status_code == 304:
+                result = 'not_modified'
+            metrics.response_cache_requests_total.inc(endpoint=request.url_rule.rule, result=result)
+            return response
+        return wrapper
+    return decorator
+
+
+def _after_flush(session, flush_context):
+    """Отмечает сессию, в которой изменились метаданные"""
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, METADATA_MODELS):
+            session.info['geo_metadata_changed'] = True
+            return
+
+
+def _after_commit(session):
+    # Версия меняется после фиксации: иначе параллельный запрос закэширует старые данные с новой версией
+    if session.info.pop('geo_metadata_changed', False):
+        versions.bump('metadata')
+
+
+def _after_rollback(session):
+    session.info.pop('geo_metadata_changed', None)
+
+
+def _on_readings(written):
+    versions.bump(*{sensor_data_version(sensor_id) for sensor_id, *_ in written})
+
+
+def init_response_cache(app):
+    """
+    Подписывает счетчики версий на изменения метаданных (события сессии ORM)
+    и на запись показаний
+
+    Args:
+        app (Flask): Приложение Flask
+    """
+    for event_name, handler in (('after_flush', _after_flush), ('after_commit', _after_commit),
+                                ('after_rollback', _after_rollback)):
+        if not event.contains(Session, event_name, handler):
+            event.listen(Session, event_name, handler)
+
+    IngestService.add_listener(_on_readings)
@@ -1,6 +1,9 @@
 # server/api/routes.py
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
+from server.config import PROFILER_ALLOWED
+from server.monitoring.metrics import registry
+from server.monitoring.profiler import profiler
 
 # Создаем Blueprint для API
 api = Blueprint('api', __name__)
@@ -12,4 +15,36 @@ def status():
         'status': 'success',
         'message': 'API работает нормально',
         'version': 'v1'
-    }), 200
\ No newline at end of file
+    }), 200
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/metrics/profiler', methods=['GET'])
+def profiler_data():
+    """Состояние профилировщика или накопленные стеки (?format=collapsed)"""
+    if not PROFILER_ALLOWED:
+        return jsonify({'error': 'Профилировщик отключен (GEO_PROFILER_ALLOWED=1)'}), 403
+    
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), content_type='text/plain; charset=utf-8')
+    return jsonify(profiler.status()), 200
+
+@api.route('/metrics/profiler', methods=['POST'])
+def profiler_toggle():
+    """Включить/выключить профилировщик: {"enabled": true, "interval_ms": 5, "endpoint": null, "reset": false}"""
+    if not PROFILER_ALLOWED:
+        return jsonify({'error': 'Профилировщик отключен (GEO_PROFILER_ALLOWED=1)'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    if data.get('reset'):
+        profiler.reset()
+    
+    if data.get('enabled'):
+        profiler.start(interval_ms=data.get('interval_ms', 5), endpoint=data.get('endpoint'))
+    elif 'enabled' in data:
+        profiler.stop()
+    
+    return jsonify(profiler.status()), 200
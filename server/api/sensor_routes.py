@@ -1,14 +1,36 @@
 # server/api/sensor_routes.py (УПРОЩЕННАЯ ВЕРСИЯ)
 
+import logging
 from flask import Blueprint, jsonify, request
 from server.services.data_service import DataService
-from server.services.approximation_service import ApproximationService
+from server.services.approximation_service import ApproximationService, APPROXIMATION_METHODS
+from server.services.ingest_service import IngestService
+from server.services.online_stats import get_sensor_stats
+from server.services.trend_tracker import get_sensor_trend, trend_registry
+from server.services.liveness import get_offline_sensors
+from server.services.aggregate_service import AggregateService, DEFAULT_AGGREGATES, parse_aggregates
+from server.services.correlation_service import CorrelationService
+from server.services.heatmap_service import HeatmapService, parse_grid
+from server.services.resampling import ResamplingService, FILL_METHODS, parse_interval
+from server.services.anomaly_service import AnomalyService
+from server.services.forecast_service import ForecastService
+from server.services.summary_service import SummaryService
+from server.api.response_cache import cached_response, sensor_data_version
+from server.config import RESPONSE_CACHE_DATA_TTL, CORRELATION_DEFAULT_STEP
+from server.utils.serialization import (
+    json_response, readings_payload, resampled_payload, format_timestamps, request_formats, request_format,
+    format_unavailable, readings_array, binary_response, TS_FORMATS
+)
+from server.monitoring import metrics
 from server.models.sensor_data import Sensor, Building
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
 
 sensor_api = Blueprint('sensor_api', __name__)
 
 @sensor_api.route('/buildings', methods=['GET'])
+@cached_response('metadata')
 def get_buildings():
     """Список всех зданий"""
     buildings = DataService.get_all_buildings()
@@ -25,7 +47,76 @@ def get_buildings():
     
     return jsonify(result), 200
 
+@sensor_api.route('/buildings/summary', methods=['GET'])
+def get_buildings_summary():
+    """Сводка по всем зданиям: датчики, текущее состояние, тревоги и аномалии"""
+    hours = max(1, min(request.args.get('hours', 24, type=int), 168))
+    return jsonify(SummaryService.get_summaries(hours)), 200
+
+@sensor_api.route('/buildings/<int:building_id>/summary', methods=['GET'])
+def get_building_summary(building_id):
+    """Сводка по зданию"""
+    hours = max(1, min(request.args.get('hours', 24, type=int), 168))
+    summary = SummaryService.get_building_summary(building_id, hours)
+    
+    if summary is None:
+        return jsonify({'error': 'Здание не найдено'}), 404
+    
+    return jsonify(summary), 200
+
+@sensor_api.route('/buildings/<int:building_id>/heatmap', methods=['GET'])
+def get_building_heatmap(building_id):
+    """Тепловая карта здания (этажа) по последним показаниям датчиков одного типа"""
+    building = DataService.get_building(building_id)
+    
+    if not building:
+        return jsonify({'error': 'Здание не найдено'}), 404
+    
+    try:
+        grid = parse_grid(request.args.get('grid', '40'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    heatmap = HeatmapService.get_heatmap(
+        building_id, request.args.get('sensor_type'), request.args.get('floor', type=int), grid
+    )
+    if heatmap is None:
+        return jsonify({'error': 'Нет датчиков с координатами для тепловой карты'}), 404
+    
+    return json_response(heatmap)
+
+@sensor_api.route('/buildings/<int:building_id>/correlation', methods=['GET'])
+def get_building_correlation(building_id):
+    """
+    Матрица корреляции показаний датчиков здания на общей сетке
+    
+    Параметры: hours, resample (шаг сетки, по умолчанию CORRELATION_DEFAULT_STEP), fill,
+    max_lag (интервал, например 1h - взаимная корреляция со сдвигами), sensor_type (можно несколько)
+    """
+    building = DataService.get_building(building_id)
+    
+    if not building:
+        return jsonify({'error': 'Здание не найдено'}), 404
+    
+    hours = max(1, min(request.args.get('hours', 24, type=int), 720))
+    try:
+        step, fill = _resample_params()
+        step = step or CORRELATION_DEFAULT_STEP
+        max_lag = request.args.get('max_lag')
+        max_lag_steps = int(round(parse_interval(max_lag) / step)) if max_lag else 0
+        correlation = CorrelationService.get_correlation(
+            building_id, hours, step, fill, max_lag_steps, request.args.getlist('sensor_type') or None
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if correlation is None:
+        return jsonify({'error': 'Нет датчиков для расчета корреляции'}), 404
+    
+    return json_response(correlation)
+
 @sensor_api.route('/buildings/<int:building_id>', methods=['GET'])
+@cached_response('metadata')
 def get_building(building_id):
     """Информация о здании"""
     building = DataService.get_building(building_id)
@@ -95,7 +186,13 @@ def get_sensors():
     
     return jsonify(result), 200
 
+@sensor_api.route('/sensors/offline', methods=['GET'])
+def get_sensors_offline():
+    """Датчики, от которых нет показаний дольше ожидаемого"""
+    return jsonify(get_offline_sensors()), 200
+
 @sensor_api.route('/sensors/<int:sensor_id>', methods=['GET'])
+@cached_response('metadata', sensor_data_version, ttl=RESPONSE_CACHE_DATA_TTL)
 def get_sensor(sensor_id):
     """Информация о датчике"""
     sensor = DataService.get_sensor(sensor_id)
@@ -140,20 +237,305 @@ def get_sensor_readings(sensor_id):
     # Период из параметров (по умолчанию 24 часа)
     hours = request.args.get('hours', 24, type=int)
     
-    # Получаем данные
-    readings = DataService.get_readings_simple(sensor_id, hours)
+    # Формат ответа: format=json|arrow|npy, для JSON - layout=rows|columns, ts_format=iso|epoch
+    try:
+        fmt = request_format(request.args)
+        layout, ts_format = request_formats(request.args)
+        step, fill = _resample_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    unavailable = format_unavailable(fmt)
+    if unavailable:
+        return jsonify({'error': unavailable}), 406
+    
+    # Регулярная сетка: resample=5min, fill=linear|ffill|none
+    if step is not None:
+        if fmt != 'json':
+            return jsonify({'error': 'resample поддерживается только для format=json'}), 400
+        try:
+            series, unit = ResamplingService.get_resampled(sensor_id, hours, step, fill)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return json_response(resampled_payload(series, unit, layout, ts_format))
+    
+    # Столбцы из БД, время форматируется векторно
+    columns = DataService.get_readings_columns(sensor_id, hours)
+    
+    if fmt != 'json':
+        units = {sensor_id: columns['unit'][0]} if columns['unit'] else {}
+        return binary_response(readings_array(columns), fmt, units, filename=f'sensor_{sensor_id}_readings')
+    
+    return json_response(readings_payload(columns, layout, ts_format))
+
+def _resample_params():
+    """Шаг сетки (секунды или None) и заполнение из параметров resample и fill или ValueError"""
+    resample = request.args.get('resample')
+    fill = request.args.get('fill', 'linear')
+    if fill not in FILL_METHODS:
+        raise ValueError(f"Неизвестный fill: {fill}. Доступны: {', '.join(FILL_METHODS)}")
+    return (parse_interval(resample) if resample else None), fill
+
+def _min_gap_param():
+    """Порог пропуска из параметра min_gap (секунды или None) или ValueError"""
+    min_gap = request.args.get('min_gap')
+    return parse_interval(min_gap) if min_gap else None
+
+@sensor_api.route('/sensors/<int:sensor_id>/gaps', methods=['GET'])
+def get_sensor_gaps(sensor_id):
+    """Пропуски в показаниях датчика за период (min_gap=10min или по медианному интервалу)"""
+    sensor = DataService.get_sensor(sensor_id)
+    
+    if not sensor:
+        return jsonify({'error': 'Датчик не найден'}), 404
+    
+    hours = max(1, min(request.args.get('hours', 24, type=int), 720))
+    try:
+        _, ts_format = request_formats(request.args)
+        min_gap = _min_gap_param()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return json_response(ResamplingService.get_sensor_gaps(sensor_id, hours, min_gap, ts_format))
+
+@sensor_api.route('/gaps', methods=['GET'])
+def get_gaps():
+    """Пропуски в показаниях всех датчиков (или здания), датчики с худшим покрытием - первыми"""
+    building_id = request.args.get('building_id', type=int)
+    hours = max(1, min(request.args.get('hours', 24, type=int), 720))
+    try:
+        _, ts_format = request_formats(request.args)
+        min_gap = _min_gap_param()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if building_id:
+        if not DataService.get_building(building_id):
+            return jsonify({'error': 'Здание не найдено'}), 404
+        sensors = DataService.get_sensors_for_building(building_id)
+    else:
+        sensors = Sensor.query.all()
+    names = {sensor.id: sensor.name for sensor in sensors}
+    
+    reports = ResamplingService.get_gaps(list(names), hours, min_gap, ts_format)
+    for report in reports:
+        report['sensor_name'] = names[report['sensor_id']]
+    
+    return json_response({
+        'hours': hours,
+        'sensors_with_gaps': sum(1 for report in reports if report['count']),
+        'sensors': reports
+    })
+
+def _parse_time(value):
+    """Время ISO 8601 из параметра запроса (naive UTC) или ValueError"""
+    timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+@sensor_api.route('/readings/export', methods=['GET'])
+def export_readings():
+    """
+    Выгрузка показаний для аналитики: несколько датчиков, произвольный период
+    
+    Параметры: sensor_id (можно несколько) или building_id, start/end (ISO 8601)
+    или hours, format=json|arrow|npy (по умолчанию npy), ts_format для JSON
+    """
+    try:
+        fmt = request_format({'format': request.args.get('format', 'npy')})
+        _, ts_format = request_formats(request.args)
+        start = request.args.get('start')
+        end = request.args.get('end')
+        end_time = _parse_time(end) if end else None
+        if start:
+            start_time = _parse_time(start)
+        else:
+            hours = request.args.get('hours', 24, type=int)
+            start_time = (end_time or datetime.utcnow()) - timedelta(hours=hours)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    unavailable = format_unavailable(fmt)
+    if unavailable:
+        return jsonify({'error': unavailable}), 406
+    
+    sensor_ids = request.args.getlist('sensor_id', type=int) or None
+    building_id = request.args.get('building_id', type=int)
+    if sensor_ids is None and building_id is not None:
+        if not DataService.get_building(building_id):
+            return jsonify({'error': 'Здание не найдено'}), 404
+        sensor_ids = [sensor.id for sensor in DataService.get_sensors_for_building(building_id)]
+    
+    array, units = DataService.export_readings(sensor_ids, start_time, end_time)
+    
+    if fmt != 'json':
+        return binary_response(array, fmt, units, filename='readings_export')
+    
+    return json_response({
+        'sensor_id': array['sensor_id'].tolist(),
+        'id': array['id'].tolist(),
+        't': format_timestamps(array['t'].view('datetime64[us]'), ts_format),
+        'v': array['v'].tolist(),
+        'is_alert': array['is_alert'].tolist(),
+        'units': {str(key): value for key, value in units.items()}
+    })
+
+@sensor_api.route('/aggregate', methods=['GET'])
+def get_aggregates():
+    """
+    Агрегаты показаний по интервалам времени (столбцами)
+    
+    Параметры: sensor_id (можно несколько) или sensor_ids=1,2,3, или building_id;
+    bucket (интервал, например 1h), agg (min,max,avg,sum,count,p95), from/to (ISO 8601)
+    или hours, source=auto|rollup|raw, ts_format
+    """
+    try:
+        _, ts_format = request_formats(request.args)
+        bucket = parse_interval(request.args.get('bucket', '1h'))
+        aggregates = parse_aggregates(request.args.get('agg', ','.join(DEFAULT_AGGREGATES)))
+        end = request.args.get('to')
+        end_time = _parse_time(end) if end else datetime.utcnow()
+        start = request.args.get('from')
+        if start:
+            start_time = _parse_time(start)
+        else:
+            hours = request.args.get('hours', 24, type=int)
+            start_time = end_time - timedelta(hours=hours)
+        sensor_ids = request.args.getlist('sensor_id', type=int)
+        for value in request.args.getlist('sensor_ids'):
+            sensor_ids.extend(int(item) for item in value.split(',') if item.strip())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    building_id = request.args.get('building_id', type=int)
+    if not sensor_ids and building_id is not None:
+        if not DataService.get_building(building_id):
+            return jsonify({'error': 'Здание не найдено'}), 404
+        sensor_ids = [sensor.id for sensor in DataService.get_sensors_for_building(building_id)]
+    elif not sensor_ids:
+        return jsonify({'error': 'Укажите sensor_id, sensor_ids или building_id'}), 400
+    
+    try:
+        result = AggregateService.aggregate(
+            sensor_ids, start_time, end_time, bucket, aggregates, request.args.get('source', 'auto'), ts_format
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return json_response(result)
+
+@sensor_api.route('/sensors/<int:sensor_id>/stats', methods=['GET'])
+def get_sensor_statistics(sensor_id):
+    """Онлайн-статистика датчика без сканирования показаний"""
+    sensor = DataService.get_sensor(sensor_id)
+    
+    if not sensor:
+        return jsonify({'error': 'Датчик не найден'}), 404
+    
+    stats = get_sensor_stats(sensor_id)
+    if stats is None:
+        return jsonify({'sensor_id': sensor_id, 'count': 0, 'source': 'none'}), 200
+    
+    stats['sensor_id'] = sensor_id
+    return jsonify(stats), 200
+
+@sensor_api.route('/sensors/<int:sensor_id>/trend', methods=['GET'])
+def get_sensor_trend_analysis(sensor_id):
+    """Тренд датчика по инкрементальному трекеру (без пересчета полинома)"""
+    sensor = DataService.get_sensor(sensor_id)
+    
+    if not sensor:
+        return jsonify({'error': 'Датчик не найден'}), 404
+    
+    hours_back = max(1, min(request.args.get('hours', 24, type=int), 168))
+    
+    trend = get_sensor_trend(sensor_id, hours_back)
+    trend['sensor_id'] = sensor_id
+    return jsonify(trend), 200
+
+@sensor_api.route('/trends', methods=['GET'])
+def get_trends():
+    """Тренды всех датчиков (или здания) из памяти трекеров (без них - полиномом по датчику)"""
+    building_id = request.args.get('building_id', type=int)
+    hours_back = max(1, min(request.args.get('hours', 24, type=int), 168))
+    
+    if building_id:
+        sensors = DataService.get_sensors_for_building(building_id)
+    else:
+        sensors = Sensor.query.all()
+    
+    if trend_registry.enabled:
+        trends = trend_registry.get_all(hours_back, [sensor.id for sensor in sensors])
+    else:
+        trends = {sensor.id: get_sensor_trend(sensor.id, hours_back) for sensor in sensors}
     
     result = []
-    for reading in readings:
+    summary = {}
+    for sensor in sensors:
+        trend = trends.get(sensor.id)
+        name = trend['trend'] if trend else 'unknown'
+        summary[name] = summary.get(name, 0) + 1
         result.append({
-            'id': reading.id,
-            'value': reading.value,
-            'unit': reading.unit,
-            'timestamp': reading.timestamp.isoformat() + 'Z',  # Единый формат
-            'is_alert': reading.is_alert
+            'sensor_id': sensor.id,
+            'name': sensor.name,
+            'type': sensor.sensor_type,
+            'building_id': sensor.building_id,
+            'trend': name,
+            'description': trend['description'] if trend else 'Недостаточно данных',
+            'change_percent': trend['change_percent'] if trend else 0,
+            'slope_per_hour': trend.get('slope_per_hour') if trend else None,
+            'last_timestamp': trend.get('last_timestamp') if trend else None
         })
     
-    return jsonify(result), 200
+    return jsonify({
+        'hours': hours_back,
+        'summary': summary,
+        'sensors': result
+    }), 200
+
+def _forecast_params():
+    """Параметры прогноза из запроса с ограничениями"""
+    return {
+        'horizon_hours': max(1, min(request.args.get('horizon', 24, type=int), 720)),  # до 30 суток
+        'window_hours': max(6, min(request.args.get('window', 72, type=int), 720)),
+        'degree': max(1, min(request.args.get('degree', 1, type=int), 3)),
+        'num_points': max(10, min(request.args.get('points', 25, type=int), 200))
+    }
+
+@sensor_api.route('/sensors/<int:sensor_id>/forecast', methods=['GET'])
+def get_sensor_forecast(sensor_id):
+    """Прогноз показаний и время достижения порога тревоги"""
+    sensor = DataService.get_sensor(sensor_id)
+    
+    if not sensor:
+        return jsonify({'error': 'Датчик не найден'}), 404
+    
+    return jsonify(ForecastService.get_forecast(sensor, **_forecast_params())), 200
+
+@sensor_api.route('/buildings/<int:building_id>/forecast', methods=['GET'])
+def get_building_forecast(building_id):
+    """Прогноз для всех датчиков здания, датчики с ближайшим пересечением порога - первыми"""
+    building = DataService.get_building(building_id)
+    
+    if not building:
+        return jsonify({'error': 'Здание не найдено'}), 404
+    
+    params = _forecast_params()
+    forecasts = ForecastService.get_building_forecast(building_id, **params)
+    
+    crossings = [
+        {'sensor_id': forecast['sensor_id'], 'sensor_name': forecast['sensor_name'], **forecast['threshold_crossing']}
+        for forecast in forecasts if forecast.get('threshold_crossing')
+    ]
+    crossings.sort(key=lambda crossing: crossing['eta'])
+    
+    return jsonify({
+        'building_id': building_id,
+        'parameters': params,
+        'threshold_crossings': crossings,
+        'sensors': forecasts
+    }), 200
 
 @sensor_api.route('/sensors/<int:sensor_id>/approximation', methods=['GET'])
 def get_sensor_approximation(sensor_id):
@@ -167,6 +549,36 @@ def get_sensor_approximation(sensor_id):
     hours_back = request.args.get('hours', 24, type=int)
     degree = request.args.get('degree', type=int)
     num_points = request.args.get('points', 50, type=int)
+    method = request.args.get('method', 'polynomial')
+    
+    if method not in APPROXIMATION_METHODS:
+        return jsonify({'error': f"Неизвестный метод: {method}. Доступны: {', '.join(APPROXIMATION_METHODS)}"}), 400
+    
+    ts_format = request.args.get('ts_format', 'iso')
+    if ts_format not in TS_FORMATS:
+        return jsonify({'error': f"Неизвестный ts_format: {ts_format}. Доступны: {', '.join(TS_FORMATS)}"}), 400
+    
+    # Подгонка по регулярной сетке (необязательно): resample=5min, fill=linear|ffill|none
+    try:
+        resample_step, fill = _resample_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Параметры сглаживающих методов (необязательные)
+    method_params = {
+        'window': request.args.get('window', type=int),
+        'frac': request.args.get('frac', type=float),
+        'knots': request.args.get('knots', type=int),
+        'smoothing': request.args.get('smoothing', type=float)
+    }
+    if method_params['window'] is not None:
+        method_params['window'] = max(3, method_params['window'])
+    if method_params['frac'] is not None:
+        method_params['frac'] = max(0.01, min(method_params['frac'], 1.0))
+    if method_params['knots'] is not None:
+        method_params['knots'] = max(4, min(method_params['knots'], 200))
+    if method_params['smoothing'] is not None:
+        method_params['smoothing'] = max(0.0, method_params['smoothing'])
     
     # Ограничения
     hours_back = max(1, min(hours_back, 168))  # 1 час - 1 неделя
@@ -178,32 +590,35 @@ def get_sensor_approximation(sensor_id):
     
     try:
         # Получаем аппроксимацию
-        approximation_data = ApproximationService.get_polynomial_approximation(
-            sensor_id, hours_back, degree, num_points
+        approximation_data = ApproximationService.get_approximation(
+            sensor_id, hours_back, method, degree, num_points, ts_format,
+            resample_step=resample_step, fill=fill, **method_params
         )
         
-        # Получаем анализ тренда
+        # Анализ тренда - из инкрементального трекера, как /trend (полином - только без его данных)
         trend_analysis = None
         if not approximation_data['error']:
             try:
-                trend_analysis = ApproximationService.get_trend_analysis(sensor_id, hours_back)
+                trend_analysis = get_sensor_trend(sensor_id, hours_back)
             except Exception as e:
-                print(f"Ошибка анализа тренда: {e}")
+                logger.error(f"Ошибка анализа тренда: {e}")
                 trend_analysis = {
                     'trend': 'unknown',
                     'description': 'Ошибка анализа тренда'
                 }
         
-        return jsonify({
+        return json_response({
             'sensor_id': sensor_id,
             'approximation_data': approximation_data,
             'trend_analysis': trend_analysis,
             'parameters': {
                 'hours_back': hours_back,
+                'method': method,
                 'degree': degree,
-                'num_points': num_points
+                'num_points': num_points,
+                'resample': request.args.get('resample')
             }
-        }), 200
+        })
         
     except Exception as e:
         print(f"Ошибка аппроксимации: {e}")
@@ -222,22 +637,60 @@ def get_sensor_approximation(sensor_id):
 
 @sensor_api.route('/alerts', methods=['GET'])
 def get_alerts():
-    """Список тревог"""
+    """
+    Инциденты тревог за период и все продолжающиеся
+    
+    value и timestamp - пиковое значение и последнее показание за порогом
+    (поля прежнего списка тревог-показаний)
+    """
     hours = request.args.get('hours', 24, type=int)
-    alerts = DataService.get_alerts(hours_back=hours)
+    
+    try:
+        layout, ts_format = request_formats(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Инциденты вместе с датчиками одним запросом
+    alerts = DataService.get_alerts_columns(hours_back=hours)
+    alerts['sensor_name'] = [name if name is not None else 'Неизвестный' for name in alerts['sensor_name']]
+    for name in ('started_at', 'last_at', 'peak_at'):
+        alerts[name] = format_timestamps(alerts[name], ts_format)
+    alerts['ended_at'] = [
+        None if active else timestamp
+        for active, timestamp in zip(alerts['active'], format_timestamps(alerts['ended_at'], ts_format))
+    ]
+    alerts['value'] = alerts['peak_value']
+    alerts['timestamp'] = alerts['last_at']
+    
+    if layout == 'columns':
+        return json_response(alerts)
+    
+    names = list(alerts)
+    result = [dict(zip(names, values)) for values in zip(*alerts.values())]
+    
+    return json_response(result)
+
+@sensor_api.route('/alerts/anomalies', methods=['GET'])
+def get_anomalies():
+    """Аномалии, найденные пакетным детектором"""
+    hours = request.args.get('hours', 24, type=int)
+    sensor_id = request.args.get('sensor_id', type=int)
+    building_id = request.args.get('building_id', type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), 5000))
+    
+    anomalies = AnomalyService.get_anomalies(hours, sensor_id, building_id, limit)
     
     result = []
-    for alert in alerts:
-        sensor = DataService.get_sensor(alert.sensor_id)
-        
+    for anomaly in anomalies:
         result.append({
-            'id': alert.id,
-            'sensor_id': alert.sensor_id,
-            'sensor_name': sensor.name if sensor else 'Неизвестный',
-            'building_id': sensor.building_id if sensor else None,
-            'value': alert.value,
-            'unit': alert.unit,
-            'timestamp': alert.timestamp.isoformat() + 'Z'
+            'id': anomaly.id,
+            'reading_id': anomaly.reading_id,
+            'sensor_id': anomaly.sensor_id,
+            'value': anomaly.value,
+            'score': anomaly.score,
+            'method': anomaly.method,
+            'timestamp': anomaly.timestamp.isoformat() + 'Z',
+            'detected_at': anomaly.detected_at.isoformat() + 'Z' if anomaly.detected_at else None
         })
     
     return jsonify(result), 200
@@ -272,4 +725,28 @@ def add_sensor_reading(sensor_id):
         return jsonify(result), 201
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@sensor_api.route('/readings/bulk', methods=['POST'])
+def add_readings_bulk():
+    """Пакетная загрузка показаний (много датчиков × много значений)"""
+    data = request.get_json(silent=True)
+    
+    try:
+        readings, rejected = IngestService.validate_batch(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if rejected:
+        metrics.ingest_rejected_total.inc(len(rejected), source='http_bulk', reason='invalid')
+    
+    if not readings:
+        return jsonify({'error': 'Нет корректных показаний', 'rejected': rejected}), 400
+    
+    try:
+        result = IngestService.write_readings(readings, source='http_bulk')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    result['rejected'] = rejected
+    return jsonify(result), 201
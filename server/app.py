@@ -1,16 +1,41 @@
 # server/app.py (УПРОЩЕННАЯ ВЕРСИЯ)
 
-from flask import Flask, jsonify
+import argparse
+import logging
+from flask import Flask, jsonify, request
 from flask_cors import CORS
-from server.database.db import init_db, db
+from server.database.db import init_db
 from server.api.routes import api
 from server.api.sensor_routes import sensor_api
-from server.config import SQLALCHEMY_DATABASE_URI, SECRET_KEY, API_PREFIX
-from server.utils.data_generator import DataGenerator
-from server.models.sensor_data import Building, Sensor
-from server.mqtt import init_mqtt
+from server.config import SQLALCHEMY_DATABASE_URI, SECRET_KEY, API_PREFIX, DEBUG, SUBSYSTEMS, SEED_WORKERS, log_config
+from server.models.sensor_data import Building
+from server.monitoring import init_monitoring
+from server.services.online_stats import init_online_stats
+from server.services.trend_tracker import init_trend_tracker
+from server.services.reading_buffer import init_reading_buffer
+from server.services.liveness import init_liveness
+from server.services.summary_service import init_summary_cache
+from server.api.response_cache import init_response_cache
+from server.services.seed_service import SeedService, DEFAULT_SCALE
 
-def create_app():
+# api - REST API датчиков, ingest - прием показаний по MQTT
+KNOWN_SUBSYSTEMS = ('api', 'ingest')
+
+def create_app(subsystems=None):
+    """
+    Фабрика приложения
+    
+    Args:
+        subsystems (iterable): запускаемые подсистемы из KNOWN_SUBSYSTEMS
+            (по умолчанию из GEO_SUBSYSTEMS - все). Статус и метрики
+            доступны в любом режиме.
+    """
+    subsystems = set(SUBSYSTEMS if subsystems is None else subsystems)
+    unknown = subsystems - set(KNOWN_SUBSYSTEMS)
+    if unknown:
+        raise ValueError(f"Неизвестные подсистемы: {', '.join(sorted(unknown))}")
+    
+    log_config()
     app = Flask(__name__)
     
     # CORS для React
@@ -24,14 +49,46 @@ def create_app():
     # Инициализация БД
     init_db(app)
     
-    # Инициализация MQTT
-    mqtt_success = init_mqtt(app)
-    if not mqtt_success:
-        app.logger.warning("MQTT не подключен")
+    # Метрики запросов и SQL
+    init_monitoring(app)
+    
+    # Онлайн-статистика по датчикам (по умолчанию в памяти - если ingest в этом процессе)
+    init_online_stats(app, ingest_in_process='ingest' in subsystems)
+    
+    # Инкрементальный тренд по датчикам (RLS, прогрев по истории в фоне; по умолчанию - если ingest в этом процессе)
+    init_trend_tracker(app, ingest_in_process='ingest' in subsystems)
+    
+    # Буферы последних показаний в памяти (по умолчанию - если ingest в этом процессе)
+    init_reading_buffer(app, ingest_in_process='ingest' in subsystems)
+    
+    # Контроль связи с датчиками (по умолчанию - если ingest в этом процессе)
+    init_liveness(app, ingest_in_process='ingest' in subsystems)
+    
+    # Сбрасывание кэша сводок по зданиям при записи показаний
+    init_summary_cache(app)
+    
+    # Версии метаданных и показаний для кэша ответов с ETag
+    init_response_cache(app)
+    
+    # Инициализация MQTT (paho загружается только здесь)
+    if 'ingest' in subsystems:
+        # Журнал приема на диске: сегменты с прошлого запуска записываются сразу
+        from server.services.ingest_spool import init_ingest_spool
+        spool = init_ingest_spool()
+        
+        from server.mqtt import init_mqtt
+        mqtt_success = init_mqtt(app, spool=spool)
+        if not mqtt_success:
+            app.logger.warning("MQTT не подключен")
+        
+        # Периодический поиск аномалий (ANOMALY_INTERVAL, 0 - выключен)
+        from server.services.anomaly_service import start_anomaly_scheduler
+        start_anomaly_scheduler()
     
     # Регистрация маршрутов
     app.register_blueprint(api, url_prefix=API_PREFIX)
-    app.register_blueprint(sensor_api, url_prefix=f"{API_PREFIX}/geo")
+    if 'api' in subsystems:
+        register_sensor_api(app)
     
     # Обработчики ошибок
     @app.errorhandler(404)
@@ -42,49 +99,73 @@ def create_app():
     def server_error(error):
         return jsonify({'error': 'Ошибка сервера'}), 500
     
-    # Инициализация тестовых данных
+    return app
+
+def register_sensor_api(app):
+    """REST API датчиков и инициализация тестовых данных"""
+    app.register_blueprint(sensor_api, url_prefix=f"{API_PREFIX}/geo")
+    
+    # Инициализация тестовых данных (история генерируется в фоне, прогресс - /init-sample-data/status)
     @app.route('/init-sample-data')
     def init_sample_data():
+        job = SeedService.get_job()
+        if job is not None and job.active:
+            return jsonify({'message': 'Заполнение уже выполняется', 'job': job.to_dict()}), 409
+        
+        # Проверяем, есть ли уже данные
+        if Building.query.first() is not None:
+            return jsonify({'message': 'Данные уже есть', 'job': job.to_dict() if job else None}), 200
+        
+        # Масштаб: buildings, sensors (на здание), days, rate (показаний в час на датчик)
         try:
-            # Проверяем, есть ли уже данные
-            if Building.query.first() is not None:
-                return jsonify({'message': 'Данные уже есть'}), 200
-            
-            # Создаем здания
-            buildings = DataGenerator.generate_sample_buildings(count=3)  # Уменьшено до 3
-            db.session.add_all(buildings)
-            db.session.commit()
-            
-            # Создаем настройки тревог
-            alert_configs = DataGenerator.generate_alert_configs()
-            db.session.add_all(alert_configs)
-            db.session.commit()
-            
-            # Создаем датчики
-            sensors = DataGenerator.generate_sample_sensors(buildings, count_per_building=3)
-            db.session.add_all(sensors)
-            db.session.commit()
-            
-            # Генерируем данные БЕЗ разрыва до текущего времени
-            for sensor in Sensor.query.all():
-                DataGenerator.generate_readings_for_sensor(
-                    sensor, 
-                    days_back=2,  # Только 2 дня для быстроты
-                    readings_per_day=12  # Каждые 2 часа
-                )
-            
-            return jsonify({
-                'message': 'Тестовые данные созданы БЕЗ временного разрыва',
-                'buildings': len(buildings),
-                'sensors': len(sensors),
-                'period': '2 дня данных до текущего момента'
-            }), 200
-            
+            job = SeedService.start(
+                app,
+                buildings=request.args.get('buildings', DEFAULT_SCALE['buildings'], type=int),
+                sensors_per_building=request.args.get('sensors', DEFAULT_SCALE['sensors_per_building'], type=int),
+                days=request.args.get('days', DEFAULT_SCALE['days'], type=float),
+                rate=request.args.get('rate', DEFAULT_SCALE['rate'], type=float),
+                workers=request.args.get('workers', SEED_WORKERS, type=int),
+                seed=request.args.get('seed', type=int)
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 409
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         
-    return app
+        # wait=N - дождаться окончания не дольше N секунд (для скриптов)
+        wait = request.args.get('wait', 0, type=float)
+        if wait > 0:
+            job.wait(min(wait, 600))
+        
+        state = job.to_dict()
+        return jsonify({
+            'message': 'Тестовые данные созданы' if state['status'] == 'done' else 'Заполнение тестовыми данными запущено',
+            'buildings': state['scale']['buildings'],
+            'sensors': state['sensors']['total'],
+            'period': f"{state['scale']['days']} дн. данных до текущего момента",
+            'status_url': '/init-sample-data/status',
+            'job': state
+        }), 200 if state['status'] == 'done' else 202
+    
+    @app.route('/init-sample-data/status')
+    def init_sample_data_status():
+        job = SeedService.get_job()
+        if job is None:
+            return jsonify({'error': 'Заполнение не запускалось'}), 404
+        return jsonify(job.to_dict()), 200
 
 if __name__ == "__main__":
-    app = create_app()
+    parser = argparse.ArgumentParser(description='Сервер геотехнического мониторинга')
+    parser.add_argument('--subsystems', default=','.join(SUBSYSTEMS),
+                        help=f"Подсистемы через запятую: {', '.join(KNOWN_SUBSYSTEMS)}")
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        level=logging.DEBUG if DEBUG else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    app = create_app(subsystems=[name for name in args.subsystems.split(',') if name])
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,5 +1,8 @@
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # Определение путей
 # Путь к директории server
 SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -10,8 +13,8 @@ BASE_DIR = os.path.dirname(SERVER_DIR)
 DEBUG = True
 SECRET_KEY = 'dev-key-for-geo-monitoring'  # В реальном проекте нужно использовать безопасный ключ
 
-# Полный путь к базе данных в директории server
-DB_PATH = os.path.join(SERVER_DIR, 'geo_monitoring.db')
+# Полный путь к базе данных в директории server (можно переопределить, например для бенчмарков)
+DB_PATH = os.environ.get('GEO_MONITORING_DB', os.path.join(SERVER_DIR, 'geo_monitoring.db'))
 
 # Настройки базы данных с абсолютным путем
 SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
@@ -25,14 +28,120 @@ API_PREFIX = f'/api/{API_VERSION}'
 # То же самое, что DB_PATH, но экспортируется для использования в других модулях
 SQLITE_DB_PATH = DB_PATH
 
+# Хранение времени показаний: text (строка, как SQLAlchemy DateTime) или epoch_us (микросекунды Unix)
+# Смена режима для существующей БД: python -m server.database.migrate_timestamps --to epoch_us
+TIMESTAMP_STORAGE = os.environ.get('GEO_TIMESTAMP_STORAGE', 'text')
+
 # Настройки MQTT
 MQTT_BROKER_HOST = os.environ.get('MQTT_BROKER_HOST', 'localhost')
 MQTT_BROKER_PORT = int(os.environ.get('MQTT_BROKER_PORT', 1883))
 
-# Вывод отладочной информации, если DEBUG включен
-if DEBUG:
-    print(f"Директория сервера: {SERVER_DIR}")
-    print(f"Корневая директория проекта: {BASE_DIR}")
-    print(f"Путь к БД SQLite: {DB_PATH}")
-    print(f"URI SQLAlchemy: {SQLALCHEMY_DATABASE_URI}")
-    print(f"MQTT брокер: {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
\ No newline at end of file
+# Темы MQTT: одиночные показания и пакеты от шлюзов
+MQTT_DATA_TOPIC = 'geo/sensors/+/+/data'
+MQTT_BATCH_TOPIC = 'geo/sensors/batch'
+
+# Онлайн-статистика по датчикам
+# auto - в памяти, если прием показаний (ingest) идет в этом же процессе, 1 - всегда, 0 - только из sensor_stats
+ONLINE_STATS = os.environ.get('GEO_ONLINE_STATS', 'auto')
+STATS_EWMA_ALPHA = float(os.environ.get('STATS_EWMA_ALPHA', 0.1))         # вес нового показания в EWMA
+STATS_PERSIST_INTERVAL = float(os.environ.get('STATS_PERSIST_INTERVAL', 30))  # сохранение в БД, секунды
+
+# Инкрементальный тренд (RLS с забыванием)
+# auto - трекеры, если прием показаний (ingest) идет в этом же процессе, 1 - всегда, 0 - только полином
+TREND_TRACKER = os.environ.get('GEO_TREND_TRACKER', 'auto')
+TREND_MEMORY_HOURS = float(os.environ.get('TREND_MEMORY_HOURS', 24))    # постоянная времени забывания, часы
+TREND_WARMUP_POINTS = int(os.environ.get('TREND_WARMUP_POINTS', 500))   # показаний на датчик для прогрева при старте
+
+# Поиск аномалий (пакетный детектор по всем датчикам)
+ANOMALY_INTERVAL = int(os.environ.get('ANOMALY_INTERVAL', 300))            # секунды между запусками, 0 - выключен
+ANOMALY_WINDOW_HOURS = float(os.environ.get('ANOMALY_WINDOW_HOURS', 24))   # окно анализа
+ANOMALY_METHOD = os.environ.get('ANOMALY_METHOD', 'zscore')               # zscore или isolation_forest
+ANOMALY_Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', 3.5))    # порог робастной z-оценки
+ANOMALY_WORKERS = int(os.environ.get('ANOMALY_WORKERS', os.cpu_count() or 1))
+
+# Прогноз и время достижения порога
+FORECAST_WINDOW_HOURS = int(os.environ.get('FORECAST_WINDOW_HOURS', 72))     # окно подгонки по умолчанию
+FORECAST_SHIFT_SIGMA = float(os.environ.get('FORECAST_SHIFT_SIGMA', 3.0))    # сдвиг среднего остатка новых данных, в СКО
+FORECAST_MAX_AGE_FRACTION = float(os.environ.get('FORECAST_MAX_AGE_FRACTION', 0.25))  # доля окна, после которой модель пересчитывается
+
+# Инциденты тревог (alert_event): показания за порогом подряд сворачиваются в один инцидент
+ALERT_EVENT_GAP = float(os.environ.get('ALERT_EVENT_GAP', 900))  # перерыв в тревогах, после которого начинается новый инцидент, секунды
+
+# Контроль связи с датчиками (status='offline' и GET /sensors/offline)
+# auto - если прием показаний (ingest) идет в этом же процессе, 1 - всегда, 0 - выключен
+LIVENESS = os.environ.get('GEO_LIVENESS', 'auto')
+LIVENESS_TICK = float(os.environ.get('LIVENESS_TICK', 5))                      # шаг проверки сроков, секунды
+LIVENESS_SLOTS = int(os.environ.get('LIVENESS_SLOTS', 1024))                   # слотов колеса таймеров
+LIVENESS_FACTOR = float(os.environ.get('LIVENESS_FACTOR', 3))                  # молчание дольше стольких ожидаемых интервалов
+LIVENESS_MIN_TIMEOUT = float(os.environ.get('LIVENESS_MIN_TIMEOUT', 60))       # пределы срока молчания, секунды
+LIVENESS_MAX_TIMEOUT = float(os.environ.get('LIVENESS_MAX_TIMEOUT', 86400))
+LIVENESS_DEFAULT_INTERVAL = float(os.environ.get('LIVENESS_DEFAULT_INTERVAL', 300))  # интервал, пока он не оценен
+
+# Регулярная сетка (readings?resample=) и пропуски в показаниях (/gaps)
+RESAMPLE_MAX_POINTS = int(os.environ.get('RESAMPLE_MAX_POINTS', 100000))  # предел точек сетки в одном ответе
+GAP_FACTOR = float(os.environ.get('GAP_FACTOR', 3))                       # пропуск - перерыв дольше стольких медианных интервалов
+
+# Тепловая карта этажа (обратно взвешенные расстояния по position_x/position_y датчиков)
+HEATMAP_POWER = float(os.environ.get('HEATMAP_POWER', 2))             # степень расстояния в весах
+HEATMAP_MAX_GRID = int(os.environ.get('HEATMAP_MAX_GRID', 100))       # предел ячеек сетки по стороне
+HEATMAP_CACHE_SIZE = int(os.environ.get('HEATMAP_CACHE_SIZE', 32))    # матриц весов в памяти
+
+# Корреляция показаний датчиков здания (GET /buildings/<id>/correlation)
+CORRELATION_DEFAULT_STEP = float(os.environ.get('CORRELATION_DEFAULT_STEP', 300))   # шаг общей сетки без resample, секунды
+CORRELATION_MAX_BINS = int(os.environ.get('CORRELATION_MAX_BINS', 20000))           # предел ячеек сетки
+CORRELATION_MAX_LAGS = int(os.environ.get('CORRELATION_MAX_LAGS', 120))             # предел сдвигов (шагов) взаимной корреляции
+CORRELATION_MIN_OVERLAP = int(os.environ.get('CORRELATION_MIN_OVERLAP', 10))        # минимум общих ячеек пары датчиков
+CORRELATION_CACHE_SIZE = int(os.environ.get('CORRELATION_CACHE_SIZE', 32))          # матриц в памяти
+
+# Агрегаты показаний по интервалам (GET /aggregate)
+AGGREGATE_MAX_ROWS = int(os.environ.get('AGGREGATE_MAX_ROWS', 100000))      # предел строк ответа (датчиков × интервалов)
+AGGREGATE_MAX_SCAN = int(os.environ.get('AGGREGATE_MAX_SCAN', 2000000))     # предел показаний, читаемых для перцентилей
+
+# Кэш сводок по зданиям
+SUMMARY_CACHE_TTL = float(os.environ.get('SUMMARY_CACHE_TTL', 60))      # секунды, предел при записи из другого процесса
+SUMMARY_MIN_REFRESH = float(os.environ.get('SUMMARY_MIN_REFRESH', 2))   # не пересчитывать чаще, секунды
+
+# Буферы последних показаний в памяти (запросы за последние часы без обращения к БД)
+# auto - если прием показаний (ingest) идет в этом же процессе, 1 - всегда, 0 - выключены
+READING_BUFFER = os.environ.get('GEO_READING_BUFFER', 'auto')
+READING_BUFFER_HOURS = float(os.environ.get('READING_BUFFER_HOURS', 26))             # покрываемый период, часы
+READING_BUFFER_MAX_BYTES = int(os.environ.get('READING_BUFFER_MAX_BYTES', 64 * 1024 * 1024))  # память на все буферы
+READING_BUFFER_MAX_POINTS = int(os.environ.get('READING_BUFFER_MAX_POINTS', 200000))  # показаний на датчик
+
+# Кэш ответов API (ETag)
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))            # предел жизни записи, секунды
+RESPONSE_CACHE_DATA_TTL = float(os.environ.get('RESPONSE_CACHE_DATA_TTL', 10))   # для ответов с показаниями
+RESPONSE_CACHE_MAX_AGE = int(os.environ.get('RESPONSE_CACHE_MAX_AGE', 0))        # max-age для браузера (0 - всегда проверять ETag)
+
+# Мониторинг: управление семплирующим профилировщиком через API (по умолчанию запрещено)
+PROFILER_ALLOWED = os.environ.get('GEO_PROFILER_ALLOWED', '0') == '1'
+
+# Пакетная запись показаний
+INGEST_MAX_BATCH_SIZE = int(os.environ.get('INGEST_MAX_BATCH_SIZE', 50000))  # максимум показаний в одном пакете
+INGEST_DEDUP_CACHE_SIZE = int(os.environ.get('INGEST_DEDUP_CACHE_SIZE', 100000))  # недавних ключей (датчик, время) в памяти, 0 - только индекс БД
+
+# Журнал приема MQTT на диске (показания пишутся в БД фоновым писателем)
+INGEST_SPOOL = os.environ.get('INGEST_SPOOL', '1') == '1'                            # 0 - запись в БД прямо из обработчика MQTT
+INGEST_SPOOL_DIR = os.environ.get('INGEST_SPOOL_DIR', f'{DB_PATH}.spool')           # каталог сегментов (свой у каждой БД)
+INGEST_SPOOL_SEGMENT_BYTES = int(os.environ.get('INGEST_SPOOL_SEGMENT_BYTES', 4 * 1024 * 1024))  # размер сегмента
+INGEST_SPOOL_FLUSH_INTERVAL = float(os.environ.get('INGEST_SPOOL_FLUSH_INTERVAL', 0.5))  # запись неполного сегмента, секунды
+INGEST_SPOOL_FSYNC = os.environ.get('INGEST_SPOOL_FSYNC', '0') == '1'                # fsync после каждой записи (переживает сбой ОС)
+INGEST_SPOOL_MAX_ATTEMPTS = int(os.environ.get('INGEST_SPOOL_MAX_ATTEMPTS', 10))     # ошибок данных подряд, после которых сегмент уходит в failed/ (сбои БД повторяются всегда)
+
+# Заполнение тестовыми данными (/init-sample-data, python -m server.services.seed_service)
+SEED_WORKERS = int(os.environ.get('SEED_WORKERS', os.cpu_count() or 1))     # процессы генерации рядов
+SEED_BATCH_SIZE = int(os.environ.get('SEED_BATCH_SIZE', 50000))             # показаний в одной транзакции записи
+
+# Подсистемы, запускаемые create_app по умолчанию: api (REST), ingest (MQTT)
+SUBSYSTEMS = tuple(
+    name.strip() for name in os.environ.get('GEO_SUBSYSTEMS', 'api,ingest').split(',') if name.strip()
+)
+
+def log_config():
+    """Вывод отладочной информации о настройках (через logging, если DEBUG включен)"""
+    if DEBUG:
+        logger.debug(f"Директория сервера: {SERVER_DIR}")
+        logger.debug(f"Корневая директория проекта: {BASE_DIR}")
+        logger.debug(f"Путь к БД SQLite: {DB_PATH}")
+        logger.debug(f"URI SQLAlchemy: {SQLALCHEMY_DATABASE_URI}")
+        logger.debug(f"MQTT брокер: {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
@@ -1,6 +1,11 @@
 # server/database/db.py
 
+import logging
 from flask_sqlalchemy import SQLAlchemy
+from server.database.timestamps import check_storage
+from server.database.dedupe_readings import ensure_reading_key
+
+logger = logging.getLogger(__name__)
 
 # Инициализация объекта SQLAlchemy
 db = SQLAlchemy()
@@ -14,4 +19,19 @@ def init_db(app):
     # Создает все таблицы, если их нет
     with app.app_context():
         db.create_all()
-        print("База данных инициализирована!")
\ No newline at end of file
+        
+        # Время показаний должно храниться в режиме GEO_TIMESTAMP_STORAGE
+        with db.engine.connect() as connection:
+            check_storage(connection)
+            
+            # Уникальный ключ (sensor_id, timestamp) для существующей БД
+            ensure_reading_key(connection)
+            
+            # Инциденты тревог по истории для БД, созданной до таблицы alert_event
+            from server.services.alert_events import ensure_alert_events
+            ensure_alert_events(connection)
+            
+            # Часовые агрегаты для БД, созданной до таблицы reading_rollup
+            from server.services.rollups import ensure_rollups
+            ensure_rollups(connection)
+        logger.info("База данных инициализирована!")
\ No newline at end of file
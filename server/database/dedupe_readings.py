@@ -0,0 +1,165 @@
+# server/database/dedupe_readings.py
+#
+# Уникальный ключ показаний (sensor_id, timestamp): повторная доставка MQTT QoS 1,
+# перезапуск симулятора и дозагрузка шлюзом не создают дубликатов.
+# В новой БД индекс создается вместе с таблицей, в существующей - при старте,
+# если дубликатов нет. Иначе их нужно удалить (сервер должен быть остановлен):
+# python -m server.database.dedupe_readings [--db путь] [--vacuum]
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+from server.config import SQLITE_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+READING_KEY_INDEX = 'uq_sensor_reading_sensor_time'
+
+_CREATE_INDEX = f"CREATE UNIQUE INDEX IF NOT EXISTS {READING_KEY_INDEX} ON sensor_reading (sensor_id, timestamp)"
+
+_COUNT_DUPLICATES = """
+    SELECT COALESCE(SUM(n - 1), 0) FROM (
+        SELECT COUNT(*) AS n FROM sensor_reading GROUP BY sensor_id, timestamp HAVING n > 1
+    )
+"""
+
+
+def ensure_reading_key(connection):
+    """
+    Создает уникальный индекс (sensor_id, timestamp), если его нет и дубликатов нет
+
+    Args:
+        connection: соединение SQLAlchemy
+
+    Returns:
+        bool: индекс есть (повторы отбрасывает БД)
+    """
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (READING_KEY_INDEX,)
+    ).fetchone()
+    if exists:
+        return True
+
+    duplicates = connection.exec_driver_sql(_COUNT_DUPLICATES).scalar()
+    if duplicates:
+        logger.warning(
+            f"В sensor_reading {duplicates} повторов (sensor_id, timestamp), уникальный индекс не создан. "
+            f"Повторы отсекает только фильтр в памяти. Выполните: python -m server.database.dedupe_readings"
+        )
+        return False
+
+    connection.exec_driver_sql(_CREATE_INDEX)
+    connection.commit()
+    logger.info(f"Создан уникальный индекс {READING_KEY_INDEX}")
+    return True
+
+
+def _rebuild_derived(conn, sensor_ids):
+    """
+    Пересчитывает alert_event и reading_rollup датчиков после удаления повторов
+    (таблицы могут быть заполнены при старте сервера до dedupe)
+
+    Returns:
+        int: количество датчиков (0 - таблиц еще нет, их заполнит init_db)
+    """
+    from server.services.alert_events import AlertEventService
+    from server.services.rollups import RollupService
+
+    tables = {name for name, in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('alert_event', 'reading_rollup')"
+    )}
+    if not sensor_ids or not tables:
+        return 0
+    cursor = conn.cursor()
+    if 'alert_event' in tables:
+        AlertEventService.rebuild(cursor, sensor_ids)
+    if 'reading_rollup' in tables:
+        RollupService.rebuild(cursor, sensor_ids)
+    return len(sensor_ids)
+
+
+def dedupe(db_path, vacuum=False):
+    """
+    Удаляет повторы показаний (остается запись с меньшим id) и создает уникальный индекс
+
+    Аномалии удаленных показаний переносятся на оставшиеся, если у тех еще нет
+    аномалии того же метода, инциденты тревог и часовые агрегаты затронутых
+    датчиков пересчитываются. Все изменения - одной транзакцией.
+
+    Returns:
+        dict: количество удаленных показаний и аномалий, время работы
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f'БД не найдена: {db_path}')
+
+    report = {'db': db_path}
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        with conn:
+            # Повтор -> оставляемое показание
+            conn.execute("""
+                CREATE TEMP TABLE duplicate_reading AS
+                SELECT r.id AS id, k.keep_id AS keep_id
+                FROM sensor_reading r
+                JOIN (
+                    SELECT sensor_id, timestamp, MIN(id) AS keep_id FROM sensor_reading
+                    GROUP BY sensor_id, timestamp HAVING COUNT(*) > 1
+                ) k ON k.sensor_id = r.sensor_id AND k.timestamp = r.timestamp
+                WHERE r.id <> k.keep_id
+            """)
+
+            anomalies = conn.execute(
+                "SELECT COUNT(*) FROM sensor_anomaly WHERE reading_id IN (SELECT id FROM duplicate_reading)"
+            ).fetchone()[0]
+            conn.execute("""
+                UPDATE OR IGNORE sensor_anomaly
+                SET reading_id = (SELECT keep_id FROM duplicate_reading d WHERE d.id = sensor_anomaly.reading_id)
+                WHERE reading_id IN (SELECT id FROM duplicate_reading)
+            """)
+            report['anomalies_deleted'] = conn.execute(
+                "DELETE FROM sensor_anomaly WHERE reading_id IN (SELECT id FROM duplicate_reading)"
+            ).rowcount
+            report['anomalies_moved'] = anomalies - report['anomalies_deleted']
+
+            sensor_ids = [sensor_id for sensor_id, in conn.execute(
+                "SELECT DISTINCT sensor_id FROM sensor_reading WHERE id IN (SELECT id FROM duplicate_reading)"
+            )]
+            report['readings_deleted'] = conn.execute(
+                "DELETE FROM sensor_reading WHERE id IN (SELECT id FROM duplicate_reading)"
+            ).rowcount
+
+            # Инциденты и часовые агрегаты, построенные по истории с повторами, - заново
+            report['sensors_rebuilt'] = _rebuild_derived(conn, sensor_ids)
+            conn.execute("DROP TABLE duplicate_reading")
+            conn.execute(_CREATE_INDEX)
+
+        if vacuum:
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Удаление повторов показаний и создание уникального индекса')
+    parser.add_argument('--db', default=SQLITE_DB_PATH, help='Путь к SQLite (по умолчанию GEO_MONITORING_DB)')
+    parser.add_argument('--vacuum', action='store_true', help='Сжать файл БД после удаления')
+    args = parser.parse_args()
+
+    try:
+        report = dedupe(args.db, args.vacuum)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
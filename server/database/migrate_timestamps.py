@@ -0,0 +1,99 @@
+# server/database/migrate_timestamps.py
+#
+# Перевод времени показаний между режимами хранения на месте (сервер должен быть остановлен)
+# Запуск: python -m server.database.migrate_timestamps --to epoch_us [--db путь] [--vacuum]
+# После миграции сервер запускается с GEO_TIMESTAMP_STORAGE=epoch_us
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from server.config import SQLITE_DB_PATH
+from server.database.timestamps import TIMESTAMP_STORAGES, TIMESTAMP_COLUMNS
+
+# Преобразования в SQL: строка '%Y-%m-%d %H:%M:%S.%f' <-> целые микросекунды Unix
+_TEXT_TO_EPOCH = "CAST(strftime('%s', {column}) AS INTEGER) * 1000000 + CAST(substr({column}, 21, 6) AS INTEGER)"
+_EPOCH_TO_TEXT = ("strftime('%Y-%m-%d %H:%M:%S', {column} / 1000000, 'unixepoch')"
+                  " || '.' || printf('%06d', {column} % 1000000)")
+
+# Тип значений, которые нужно преобразовать, и выражение преобразования
+_CONVERSIONS = {
+    'epoch_us': ('text', _TEXT_TO_EPOCH),
+    'text': ('integer', _EPOCH_TO_TEXT)
+}
+
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def migrate(db_path, target, vacuum=False):
+    """
+    Переводит время в таблицах TIMESTAMP_COLUMNS в режим target
+
+    Преобразуются только значения в другом формате, поэтому повторный
+    запуск ничего не меняет. Все таблицы - одной транзакцией.
+
+    Returns:
+        dict: количество преобразованных строк по таблицам и время работы
+
+    Raises:
+        ValueError: неизвестный режим или строки времени, которые SQLite не может разобрать
+    """
+    if target not in TIMESTAMP_STORAGES:
+        raise ValueError(f"Неизвестный режим: {target}. Доступны: {', '.join(TIMESTAMP_STORAGES)}")
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f'БД не найдена: {db_path}')
+
+    source_type, expression = _CONVERSIONS[target]
+    report = {'db': db_path, 'target': target, 'converted': {}}
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        with conn:
+            for table, column in TIMESTAMP_COLUMNS:
+                if not _table_exists(conn, table):
+                    continue
+
+                if target == 'epoch_us':
+                    invalid = conn.execute(
+                        f"SELECT COUNT(*) FROM {table} WHERE typeof({column}) = 'text' AND strftime('%s', {column}) IS NULL"
+                    ).fetchone()[0]
+                    if invalid:
+                        raise ValueError(f'{table}.{column}: {invalid} значений времени не удается разобрать')
+
+                cursor = conn.execute(
+                    f"UPDATE {table} SET {column} = {expression.format(column=column)} "
+                    f"WHERE typeof({column}) = ?", (source_type,)
+                )
+                report['converted'][table] = report['converted'].get(table, 0) + cursor.rowcount
+
+        if vacuum:
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перевод времени показаний между режимами хранения')
+    parser.add_argument('--to', dest='target', choices=TIMESTAMP_STORAGES, required=True, help='Целевой режим')
+    parser.add_argument('--db', default=SQLITE_DB_PATH, help='Путь к SQLite (по умолчанию GEO_MONITORING_DB)')
+    parser.add_argument('--vacuum', action='store_true', help='Сжать файл БД после миграции')
+    args = parser.parse_args()
+
+    try:
+        report = migrate(args.db, args.target, args.vacuum)
+    except (ValueError, FileNotFoundError) as e:
+        parser.error(str(e))
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Запускайте сервер с GEO_TIMESTAMP_STORAGE={args.target}")
+
+
+if __name__ == '__main__':
+    main()
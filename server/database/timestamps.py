@@ -0,0 +1,136 @@
+# server/database/timestamps.py
+#
+# Хранение времени показаний (sensor_reading.timestamp, sensor_anomaly.timestamp, alert_event):
+#   text     - строка SQLite '%Y-%m-%d %H:%M:%S.%f' (как хранит SQLAlchemy DateTime)
+#   epoch_us - целые микросекунды Unix (UTC): без форматирования при записи,
+#              разбора строк при чтении и сравнения строк в условиях по времени
+# Режим задается GEO_TIMESTAMP_STORAGE, перевод существующей БД -
+# python -m server.database.migrate_timestamps --to epoch_us
+
+from datetime import datetime, timedelta
+from sqlalchemy.types import TypeDecorator, BigInteger, DateTime
+from server.config import TIMESTAMP_STORAGE
+
+TIMESTAMP_STORAGES = ('text', 'epoch_us')
+
+# Формат, в котором SQLAlchemy хранит DateTime в SQLite
+SQLITE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Таблицы, время в которых хранится в выбранном режиме
+TIMESTAMP_COLUMNS = (
+    ('sensor_reading', 'timestamp'), ('sensor_anomaly', 'timestamp'),
+    ('alert_event', 'started_at'), ('alert_event', 'last_at'), ('alert_event', 'ended_at'), ('alert_event', 'peak_at')
+)
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+if TIMESTAMP_STORAGE not in TIMESTAMP_STORAGES:
+    raise ValueError(f"Неизвестный GEO_TIMESTAMP_STORAGE: {TIMESTAMP_STORAGE}. "
+                     f"Доступны: {', '.join(TIMESTAMP_STORAGES)}")
+
+EPOCH_STORAGE = TIMESTAMP_STORAGE == 'epoch_us'
+
+
+def datetime_to_us(value):
+    """naive datetime (UTC) в микросекунды Unix (точно, без float)"""
+    return (value - EPOCH) // _MICROSECOND
+
+
+def us_to_datetime(value):
+    """Микросекунды Unix в naive datetime (UTC)"""
+    return EPOCH + timedelta(microseconds=value)
+
+
+class EpochMicroseconds(TypeDecorator):
+    """Столбец времени: в Python - naive datetime (UTC), в БД - BIGINT микросекунд Unix"""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return datetime_to_us(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else us_to_datetime(value)
+
+
+def timestamp_type():
+    """Тип столбца времени показаний для текущего режима хранения"""
+    return EpochMicroseconds() if EPOCH_STORAGE else DateTime()
+
+
+def to_db(value):
+    """datetime в значение параметра сырого SQL (строка или микросекунды)"""
+    if EPOCH_STORAGE:
+        return datetime_to_us(value)
+    return value.strftime(SQLITE_TIMESTAMP_FORMAT)
+
+
+def from_db(value):
+    """Значение из сырого SQL (строка или микросекунды) в datetime"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, int):
+        return us_to_datetime(value)
+    return datetime.fromisoformat(str(value))
+
+
+def to_datetime64(values):
+    """Столбец значений из сырого SQL в массив datetime64[us] (для epoch_us - без разбора)"""
+    import numpy as np
+
+    if EPOCH_STORAGE:
+        return np.array(values, dtype=np.int64).view('datetime64[us]')
+    return np.array(values, dtype='datetime64[us]')
+
+
+def datetime64_to_db(timestamps):
+    """Массив datetime64 в список значений для executemany"""
+    import numpy as np
+
+    if EPOCH_STORAGE:
+        return timestamps.astype('datetime64[us]').view(np.int64).tolist()
+    # Формат SQLAlchemy DateTime для SQLite: пробел вместо 'T'
+    return np.char.replace(np.datetime_as_string(timestamps, unit='us'), 'T', ' ').tolist()
+
+
+def epoch_us_sql(column='timestamp'):
+    """SQL-выражение: время столбца в микросекундах Unix"""
+    if EPOCH_STORAGE:
+        return column
+    return (f"(CAST(strftime('%s', {column}) AS INTEGER) * 1000000"
+            f" + CAST(substr({column}, 21, 6) AS INTEGER))")
+
+
+def stored_storage(connection, table='sensor_reading', column='timestamp'):
+    """
+    Режим, в котором фактически хранится время в таблице (по первой строке)
+
+    Returns:
+        str: text, epoch_us или None (таблица пуста)
+    """
+    row = connection.exec_driver_sql(
+        f"SELECT typeof({column}) FROM {table} WHERE {column} IS NOT NULL LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return None
+    return 'epoch_us' if row[0] == 'integer' else 'text'
+
+
+def check_storage(connection):
+    """
+    Проверяет, что время в БД хранится в режиме GEO_TIMESTAMP_STORAGE
+
+    Raises:
+        RuntimeError: режимы не совпадают (нужна миграция)
+    """
+    for table, column in TIMESTAMP_COLUMNS:
+        stored = stored_storage(connection, table, column)
+        if stored is not None and stored != TIMESTAMP_STORAGE:
+            raise RuntimeError(
+                f"Время в {table}.{column} хранится в режиме {stored}, а GEO_TIMESTAMP_STORAGE={TIMESTAMP_STORAGE}. "
+                f"Выполните: python -m server.database.migrate_timestamps --to {TIMESTAMP_STORAGE}"
+            )
@@ -2,6 +2,8 @@
 
 from datetime import datetime
 from server.database.db import db
+from server.database.timestamps import timestamp_type
+from server.database.dedupe_readings import READING_KEY_INDEX
 
 class Building(db.Model):
     """Модель для хранения информации о зданиях"""
@@ -38,9 +40,12 @@ class Sensor(db.Model):
 
 class SensorReading(db.Model):
     """Модель для хранения показаний датчиков"""
+    # Одно показание на датчик и момент времени: повторы отбрасываются при записи
+    __table_args__ = (db.Index(READING_KEY_INDEX, 'sensor_id', 'timestamp', unique=True),)
+    
     id = db.Column(db.Integer, primary_key=True)
     sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(timestamp_type(), default=datetime.utcnow)  # строка или микросекунды (TIMESTAMP_STORAGE)
     value = db.Column(db.Float, nullable=False)             # числовое значение показания
     unit = db.Column(db.String(20), nullable=False)         # единица измерения (мм, градусы и т.д.)
     is_alert = db.Column(db.Boolean, default=False)         # флаг тревоги, если значение превышает норму
@@ -60,4 +65,91 @@ class AlertConfig(db.Model):
     unit = db.Column(db.String(20), nullable=False)     # единица измерения
     
     def __repr__(self):
-        return f'<AlertConfig for {self.sensor_type}>'
\ No newline at end of file
+        return f'<AlertConfig for {self.sensor_type}>'
+
+class SensorStats(db.Model):
+    """Сохраненная онлайн-статистика датчика (обновляется периодически из памяти)"""
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=True)
+    m2 = db.Column(db.Float, nullable=True)                 # сумма квадратов отклонений (Уэлфорд)
+    min_value = db.Column(db.Float, nullable=True)
+    max_value = db.Column(db.Float, nullable=True)
+    ewma = db.Column(db.Float, nullable=True)               # экспоненциальное скользящее среднее
+    ewm_variance = db.Column(db.Float, nullable=True)
+    last_value = db.Column(db.Float, nullable=True)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+    last_slope = db.Column(db.Float, nullable=True)         # изменение в единицах в час по двум последним показаниям
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SensorStats for Sensor #{self.sensor_id}: n={self.count}>'
+
+class SensorAnomaly(db.Model):
+    """Показание, отмеченное детектором аномалий"""
+    __table_args__ = (db.UniqueConstraint('reading_id', 'method'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reading_id = db.Column(db.Integer, db.ForeignKey('sensor_reading.id'), nullable=False)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), nullable=False, index=True)
+    timestamp = db.Column(timestamp_type(), nullable=False, index=True)  # время показания (как в sensor_reading)
+    value = db.Column(db.Float, nullable=False)
+    score = db.Column(db.Float, nullable=False)             # z-оценка или оценка IsolationForest
+    method = db.Column(db.String(30), nullable=False)       # zscore, isolation_forest
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Anomaly for Sensor #{self.sensor_id}: {self.value} ({self.method})>'
+
+class AlertEvent(db.Model):
+    """Инцидент тревоги: показания датчика за одним порогом подряд (см. services/alert_events.py)"""
+    # Открытый инцидент у датчика не больше одного
+    __table_args__ = (db.Index('uq_alert_event_open', 'sensor_id', unique=True, sqlite_where=db.text('ended_at IS NULL')),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), nullable=False, index=True)
+    direction = db.Column(db.String(10), nullable=False)    # high - выше максимума, low - ниже минимума
+    started_at = db.Column(timestamp_type(), nullable=False)  # первое показание за порогом
+    last_at = db.Column(timestamp_type(), nullable=False, index=True)  # последнее показание за порогом
+    ended_at = db.Column(timestamp_type(), nullable=True)   # закрытие (None - инцидент продолжается)
+    first_value = db.Column(db.Float, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    peak_value = db.Column(db.Float, nullable=False)        # самое далекое от нормы значение
+    peak_at = db.Column(timestamp_type(), nullable=False)
+    count = db.Column(db.Integer, nullable=False)           # показаний за порогом
+    unit = db.Column(db.String(20), nullable=False)
+    
+    def __repr__(self):
+        return f'<AlertEvent for Sensor #{self.sensor_id}: {self.direction}, {self.count} показаний>'
+
+class ReadingRollup(db.Model):
+    """Часовой агрегат показаний датчика (см. services/rollups.py)"""
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)  # начало часа, секунды Unix (UTC)
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)             # сумма значений
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<ReadingRollup for Sensor #{self.sensor_id} at {self.bucket}: n={self.count}>'
+
+class ForecastModel(db.Model):
+    """Сохраненные коэффициенты прогнозной модели датчика для окна подгонки"""
+    __table_args__ = (db.UniqueConstraint('sensor_id', 'window_hours', 'degree'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), nullable=False)
+    window_hours = db.Column(db.Integer, nullable=False)   # окно подгонки, часы
+    degree = db.Column(db.Integer, nullable=False)
+    coefficients = db.Column(db.JSON, nullable=False)       # младшие степени первыми, время - часы от base_time
+    base_time = db.Column(db.DateTime, nullable=False)      # начало отсчета времени (последнее показание при подгонке)
+    data_start = db.Column(db.DateTime, nullable=False)
+    data_end = db.Column(db.DateTime, nullable=False)       # последнее учтенное показание
+    num_points = db.Column(db.Integer, nullable=False)
+    r_squared = db.Column(db.Float, nullable=True)
+    residual_std = db.Column(db.Float, nullable=False)      # СКО остатков, для проверки сдвига и коридора прогноза
+    fitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ForecastModel for Sensor #{self.sensor_id} ({self.window_hours} ч, степень {self.degree})>'
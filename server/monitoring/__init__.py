@@ -0,0 +1,72 @@
+# server/monitoring/__init__.py
+
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from server.database.db import db
+from .metrics import (
+    registry, http_request_duration, http_request_sql_queries, http_request_sql_duration,
+    sql_queries_total, sql_query_duration
+)
+from .profiler import profiler
+
+
+def _endpoint_label():
+    """Шаблон маршрута вместо URL, чтобы не плодить метки (/sensors/<int:sensor_id>)"""
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время начала - в контексте выполнения: при ошибке запроса он отбрасывается
+    # вместе с ним, а не остается в соединении пула
+    context._geo_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._geo_query_start
+
+    sql_queries_total.inc()
+    sql_query_duration.observe(duration)
+
+    if has_request_context() and 'request_started' in g:
+        g.sql_queries += 1
+        g.sql_time += duration
+
+
+def init_monitoring(app):
+    """
+    Подключает сбор метрик к приложению Flask
+
+    Args:
+        app (Flask): Приложение Flask
+    """
+    with app.app_context():
+        engine = db.engine
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+        profiler.enter(_endpoint_label())
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' in g:
+            endpoint = _endpoint_label()
+            http_request_duration.observe(
+                time.perf_counter() - g.request_started,
+                method=request.method, endpoint=endpoint, status=str(response.status_code)
+            )
+            http_request_sql_queries.observe(g.sql_queries, endpoint=endpoint)
+            http_request_sql_duration.observe(g.sql_time, endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def stop_request_profiling(exception=None):
+        profiler.leave()
@@ -0,0 +1,304 @@
+# server/monitoring/metrics.py
+
+import threading
+import time
+from bisect import bisect_left
+
+# Границы корзин по умолчанию (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0, 3600.0, 86400.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    """Экранирование значения метки по формату Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Базовый класс метрики с метками"""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}')
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}'
+        ]
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+            lines.extend(self._render_items(items))
+        return lines
+
+    def _render_items(self, items):
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Текущее значение"""
+
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счетчики по корзинам + Inf, сумма, количество]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер: измеряет длительность блока"""
+        return _Timer(self, labels)
+
+    def get_count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _render_items(self, items):
+        lines = []
+        bounds = self.buckets + (float('inf'),)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Registry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Глобальный реестр процесса (метрики не агрегируются между воркерами)
+registry = Registry()
+
+# HTTP
+http_request_duration = registry.histogram(
+    'geo_http_request_duration_seconds', 'Время обработки HTTP-запроса', ('method', 'endpoint', 'status')
+)
+http_request_sql_queries = registry.histogram(
+    'geo_http_request_sql_queries', 'Количество SQL-запросов на HTTP-запрос', ('endpoint',), COUNT_BUCKETS
+)
+http_request_sql_duration = registry.histogram(
+    'geo_http_request_sql_duration_seconds', 'Суммарное время SQL на HTTP-запрос', ('endpoint',)
+)
+
+# SQL
+sql_queries_total = registry.counter('geo_sql_queries_total', 'Выполнено SQL-запросов через SQLAlchemy')
+sql_query_duration = registry.histogram('geo_sql_query_duration_seconds', 'Время выполнения SQL-запроса')
+
+# Запись показаний
+ingest_readings_total = registry.counter('geo_ingest_readings_total', 'Записано показаний', ('source',))
+ingest_alerts_total = registry.counter('geo_ingest_alerts_total', 'Записано показаний с тревогой', ('source',))
+ingest_rejected_total = registry.counter('geo_ingest_rejected_total', 'Отклонено показаний', ('source', 'reason'))
+ingest_duplicates_total = registry.counter(
+    'geo_ingest_duplicates_total', 'Отброшено повторов показаний (stage: cache - фильтр в памяти, db - уникальный индекс)',
+    ('source', 'stage')
+)
+ingest_batch_duration = registry.histogram(
+    'geo_ingest_batch_duration_seconds', 'Время записи пакета показаний в БД', ('source',)
+)
+ingest_batch_size = registry.histogram(
+    'geo_ingest_batch_size', 'Показаний в записанном пакете', ('source',), COUNT_BUCKETS + (5000, 10000, 50000)
+)
+ingest_lag = registry.histogram(
+    'geo_ingest_lag_seconds', 'Задержка от метки времени показания до записи в БД', ('source',), LAG_BUCKETS
+)
+ingest_last_write = registry.gauge('geo_ingest_last_write_timestamp_seconds', 'Время последней записи показаний')
+
+# Журнал приема на диске
+ingest_spool_bytes = registry.gauge('geo_ingest_spool_bytes', 'Показания в журнале, ожидающие записи в БД, байт')
+ingest_spool_segments = registry.gauge('geo_ingest_spool_segments', 'Сегментов журнала на диске')
+ingest_spool_lag = registry.gauge('geo_ingest_spool_lag_seconds', 'Возраст самой старой незаписанной записи журнала')
+ingest_spool_records_total = registry.counter(
+    'geo_ingest_spool_records_total', 'Показания журнала (event: appended, written; corrupt - поврежденные хвосты сегментов)',
+    ('event',)
+)
+ingest_spool_errors_total = registry.counter('geo_ingest_spool_errors_total', 'Неудачные попытки записи сегмента в БД')
+ingest_spool_failed_segments_total = registry.counter(
+    'geo_ingest_spool_failed_segments_total', 'Сегменты, перенесенные в failed/ после INGEST_SPOOL_MAX_ATTEMPTS неудачных попыток'
+)
+
+# Инциденты тревог
+alert_events_total = registry.counter(
+    'geo_alert_events_total', 'Инциденты тревог (event: opened, closed)', ('event',)
+)
+
+# Контроль связи с датчиками
+liveness_offline_sensors = registry.gauge('geo_liveness_offline_sensors', 'Датчиков без показаний дольше срока')
+liveness_transitions_total = registry.counter(
+    'geo_liveness_transitions_total', 'Смены состояния связи датчиков (state: offline, online)', ('state',)
+)
+
+# Тепловые карты и корреляция датчиков здания
+heatmap_weights_total = registry.counter(
+    'geo_heatmap_weights_total', 'Матрицы весов тепловых карт (result: hit - из кэша, miss - расчет)', ('result',)
+)
+correlation_requests_total = registry.counter(
+    'geo_correlation_requests_total', 'Запросы матриц корреляции (result: hit - из кэша, miss - расчет)', ('result',)
+)
+
+# Агрегаты показаний по интервалам
+rollup_updates_total = registry.counter('geo_rollup_updates_total', 'Обновления строк часовых агрегатов при записи')
+aggregate_queries_total = registry.counter(
+    'geo_aggregate_queries_total', 'Запросы агрегатов (source: rollup - часовые агрегаты, raw - показания)', ('source',)
+)
+
+# Буферы последних показаний
+reading_buffer_requests_total = registry.counter(
+    'geo_reading_buffer_requests_total', 'Запросы показаний за период (result: hit - из памяти, miss - из БД)', ('result',)
+)
+reading_buffer_bytes = registry.gauge('geo_reading_buffer_bytes', 'Память буферов последних показаний, байт')
+reading_buffer_sensors = registry.gauge('geo_reading_buffer_sensors', 'Датчиков с буфером показаний в памяти')
+reading_buffer_evictions_total = registry.counter(
+    'geo_reading_buffer_evictions_total', 'Буферы, вытесненные из-за READING_BUFFER_MAX_BYTES'
+)
+
+# Кэш ответов
+response_cache_requests_total = registry.counter(
+    'geo_response_cache_requests_total', 'Запросы к кэшируемым маршрутам (hit, miss, not_modified)',
+    ('endpoint', 'result')
+)
+
+# Аналитика
+approximation_fit_duration = registry.histogram(
+    'geo_approximation_fit_duration_seconds', 'Время подгонки аппроксимации', ('method',)
+)
+forecast_requests_total = registry.counter(
+    'geo_forecast_requests_total', 'Запросы прогноза по результату (cached, validated, refit)', ('result',)
+)
+forecast_fits_total = registry.counter(
+    'geo_forecast_fits_total', 'Пересчеты прогнозной модели по причине (new, shifted, stale)', ('reason',)
+)
+anomaly_run_duration = registry.histogram(
+    'geo_anomaly_run_duration_seconds', 'Время прохода детектора аномалий', ('method',)
+)
+anomalies_detected_total = registry.counter(
+    'geo_anomalies_detected_total', 'Найдено новых аномалий', ('method',)
+)
+anomaly_sensors_per_second = registry.gauge(
+    'geo_anomaly_sensors_per_second', 'Производительность последнего прохода детектора', ('method',)
+)
@@ -0,0 +1,99 @@
+# server/monitoring/profiler.py
+
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик HTTP-запросов
+
+    Пока профилировщик включен, фоновый поток с заданным интервалом снимает
+    стеки потоков, обрабатывающих запросы, и накапливает их в свернутом
+    формате ("frame;frame;frame count"), который понимают flamegraph.pl и
+    speedscope. Выключен по умолчанию и не влияет на запросы.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.interval = 0.005
+        self.endpoint_filter = None
+        self._active = {}  # id потока -> endpoint
+        self._stacks = Counter()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, interval_ms=5, endpoint=None):
+        """Включить семплирование (endpoint - профилировать только этот маршрут)"""
+        with self._lock:
+            self.interval = max(1, int(interval_ms)) / 1000
+            self.endpoint_filter = endpoint
+            if self.enabled:
+                return
+            self.enabled = True
+            self._thread = threading.Thread(target=self._run, name='geo-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self.enabled = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def enter(self, endpoint):
+        """Начало запроса в текущем потоке"""
+        if self.enabled and (self.endpoint_filter is None or self.endpoint_filter == endpoint):
+            self._active[threading.get_ident()] = endpoint
+
+    def leave(self):
+        """Конец запроса в текущем потоке"""
+        self._active.pop(threading.get_ident(), None)
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _run(self):
+        while self.enabled:
+            active = dict(self._active)
+            if active:
+                frames = sys._current_frames()
+                with self._lock:
+                    for thread_id, endpoint in active.items():
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            self._stacks[f'{endpoint};{self._collapse(frame)}'] += 1
+                            self._samples += 1
+            time.sleep(self.interval)
+
+    def status(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'interval_ms': int(self.interval * 1000),
+                'endpoint': self.endpoint_filter,
+                'samples': self._samples,
+                'unique_stacks': len(self._stacks)
+            }
+
+    def collapsed(self):
+        """Накопленные стеки в свернутом формате для построения flame graph"""
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self._stacks.most_common()) + '\n'
+
+
+profiler = SamplingProfiler()
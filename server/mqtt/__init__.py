@@ -1,30 +1,33 @@
 # server/mqtt/__init__.py
 
-from flask import Flask
-from .mqtt_client import MQTTClient
+import atexit
 
 # Глобальная переменная для хранения экземпляра MQTT-клиента
 mqtt_client = None
 
-def init_mqtt(app=None):
+def init_mqtt(app=None, spool=None):
     """
     Инициализирует MQTT-клиент и подключается к брокеру
     
     Args:
         app (Flask): Приложение Flask (опционально)
+        spool (IngestSpool): журнал приема (None - запись в БД из обработчика)
     """
     global mqtt_client
     
+    # paho загружается только для подсистемы приема данных
+    from .mqtt_client import MQTTClient
+    from server.config import MQTT_BROKER_HOST, MQTT_BROKER_PORT
+    
     # Создаем экземпляр MQTT-клиента, передавая приложение
-    mqtt_client = MQTTClient(app=app)
+    mqtt_client = MQTTClient(app=app, broker_host=MQTT_BROKER_HOST, broker_port=MQTT_BROKER_PORT, spool=spool)
     
     # Подключаемся к MQTT-брокеру
     success = mqtt_client.connect()
     
-    if success and app:
-        # Регистрируем обработчик для отключения при завершении работы приложения
-        @app.teardown_appcontext
-        def shutdown_mqtt(exception=None):
-            mqtt_client.disconnect()
+    if success:
+        # Отключаемся при завершении процесса (teardown_appcontext срабатывал
+        # после каждого запроса и обрывал соединение)
+        atexit.register(mqtt_client.disconnect)
     
     return success
\ No newline at end of file
@@ -2,21 +2,24 @@
 
 import json
 import logging
-from datetime import datetime
 import paho.mqtt.client as mqtt
-import sqlite3
-import os
-from server.config import SQLITE_DB_PATH
+from server.config import MQTT_DATA_TOPIC, MQTT_BATCH_TOPIC
+from server.services.ingest_service import IngestService
+from server.monitoring import metrics
 
 logger = logging.getLogger(__name__)
 
 class MQTTClient:
-    """MQTT клиент с прямой записью в БД (без Flask контекста)"""
+    """
+    MQTT клиент: показания пишутся в журнал на диске (spool) или прямо в БД
+    (без Flask контекста)
+    """
     
-    def __init__(self, app=None, broker_host="localhost", broker_port=1883):
+    def __init__(self, app=None, broker_host="localhost", broker_port=1883, spool=None):
         self.app = app
         self.broker_host = broker_host
         self.broker_port = broker_port
+        self.spool = spool
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         
         # Обработчики событий
@@ -50,7 +53,8 @@ class MQTTClient:
             logger.info("MQTT подключен успешно")
             self.connected = True
             # Подписка на все темы датчиков
-            self.client.subscribe("geo/sensors/+/+/data")
+            self.client.subscribe(MQTT_DATA_TOPIC)
+            self.client.subscribe(MQTT_BATCH_TOPIC)
             logger.info("Подписка на темы датчиков выполнена")
         else:
             logger.error(f"MQTT подключение не удалось: {reason_code}")
@@ -63,6 +67,11 @@ class MQTTClient:
     def _on_message(self, client, userdata, msg):
         """Обработка входящих сообщений - ПРЯМАЯ ЗАПИСЬ В БД"""
         try:
+            # Пакет показаний от шлюза
+            if msg.topic == MQTT_BATCH_TOPIC:
+                self._on_batch_message(msg)
+                return
+            
             # Парсим тему: geo/sensors/тип/id/data
             topic_parts = msg.topic.split('/')
             if len(topic_parts) >= 5:
@@ -70,80 +79,67 @@ class MQTTClient:
                 
                 # Парсим JSON
                 payload = json.loads(msg.payload.decode('utf-8'))
-                logger.info(f"MQTT → Датчик {sensor_id}: {payload}")
+                logger.debug(f"MQTT → Датчик {sensor_id}: {payload}")
                 
-                # Парсим время
-                timestamp_str = payload.get('timestamp', datetime.utcnow().isoformat() + 'Z')
-                # Убираем Z и конвертируем в SQLite формат
-                clean_time = timestamp_str.replace('Z', '')
-                try:
-                    dt = datetime.fromisoformat(clean_time)
-                    sqlite_timestamp = dt.strftime('%Y-%m-%d %H:%M:%S.%f')
-                except:
-                    sqlite_timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
-                
-                # ПРЯМАЯ ЗАПИСЬ В SQLITE (БЕЗ Flask контекста)
+                # Проверка как у пакета, запись без Flask контекста
                 self._save_to_database(
                     sensor_id=sensor_id,
-                    timestamp=sqlite_timestamp,
-                    value=float(payload['value']),
-                    unit=str(payload['unit'])
+                    timestamp=payload.get('timestamp'),
+                    value=payload.get('value'),
+                    unit=payload.get('unit')
                 )
                 
         except Exception as e:
             logger.error(f"Ошибка обработки MQTT сообщения: {e}")
     
+    def _on_batch_message(self, msg):
+        """Пакет показаний: проверка и запись одной транзакцией"""
+        payload = json.loads(msg.payload.decode('utf-8'))
+        readings, rejected = IngestService.validate_batch(payload)
+        
+        if rejected:
+            metrics.ingest_rejected_total.inc(len(rejected), source='mqtt_batch', reason='invalid')
+            logger.warning(f"MQTT пакет: отклонено показаний {len(rejected)}: {rejected[:5]}")
+        
+        if self._spool_readings(readings):
+            logger.debug(f"MQTT пакет: {len(readings)} показаний в журнале")
+            return
+        
+        result = IngestService.write_readings(readings, source='mqtt_batch')
+        logger.info(f"MQTT пакет: записано {result['inserted']} показаний, тревог {result['alerts']}, "
+                    f"повторов {result['duplicates']}")
+    
+    def _spool_readings(self, readings):
+        """Дописывает показания в журнал; False - журнала нет или диск недоступен (пишем в БД)"""
+        if self.spool is None:
+            return False
+        try:
+            self.spool.append(readings)
+            return True
+        except OSError as e:
+            logger.error(f"Ошибка записи в журнал приема, запись напрямую в БД: {e}")
+            return False
+    
     def _save_to_database(self, sensor_id, timestamp, value, unit):
-        """Прямое сохранение в SQLite без Flask контекста"""
+        """Сохранение показания: через журнал или прямо в SQLite без Flask контекста"""
         try:
-            # Проверяем путь к БД
-            if not os.path.exists(SQLITE_DB_PATH):
-                logger.error(f"БД не найдена: {SQLITE_DB_PATH}")
-                return
-            
-            # Подключаемся к БД
-            conn = sqlite3.connect(SQLITE_DB_PATH, timeout=10.0)
-            cursor = conn.cursor()
-            
-            # Проверяем, что датчик существует
-            cursor.execute("SELECT sensor_type FROM sensor WHERE id = ?", (sensor_id,))
-            sensor_row = cursor.fetchone()
-            
-            if not sensor_row:
-                logger.warning(f"Датчик {sensor_id} не найден в БД")
-                conn.close()
-                return
-            
-            sensor_type = sensor_row[0]
-            
-            # Проверяем пороги тревоги
-            is_alert = 0
-            cursor.execute(
-                "SELECT min_threshold, max_threshold FROM alert_config WHERE sensor_type = ?", 
-                (sensor_type,)
+            # Те же проверки, что у пакетов (конечное value, формат времени)
+            reading = IngestService._normalize_item(
+                {'timestamp': timestamp, 'value': value, 'unit': unit}, sensor_id
             )
-            alert_row = cursor.fetchone()
-            
-            if alert_row:
-                min_threshold, max_threshold = alert_row
-                if min_threshold is not None and value < min_threshold:
-                    is_alert = 1
-                if max_threshold is not None and value > max_threshold:
-                    is_alert = 1
-            
-            # Вставляем запись
-            cursor.execute(
-                "INSERT INTO sensor_reading (sensor_id, timestamp, value, unit, is_alert) VALUES (?, ?, ?, ?, ?)",
-                (sensor_id, timestamp, value, unit, is_alert)
-            )
-            
-            conn.commit()
-            row_id = cursor.lastrowid
-            conn.close()
+        except (TypeError, ValueError) as e:
+            metrics.ingest_rejected_total.inc(1, source='mqtt', reason='invalid')
+            logger.warning(f"MQTT: показание датчика {sensor_id} отклонено: {e}")
+            return
+        
+        if self._spool_readings([reading]):
+            return
+        
+        try:
+            result = IngestService.write_readings([reading], source='mqtt')
             
-            logger.info(f"✓ Сохранено: датчик {sensor_id}, значение {value} {unit}, ID записи {row_id}")
+            if result['inserted']:
+                logger.debug(f"✓ Сохранено: датчик {sensor_id}, значение {value} {unit}")
             
         except Exception as e:
             logger.error(f"Ошибка записи в БД: {e}")
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
@@ -0,0 +1,233 @@
+# server/services/aggregate_service.py
+#
+# Агрегаты показаний по интервалам времени (min, max, avg, sum, count,
+# перцентили) для нескольких датчиков одним сгруппированным запросом.
+# Интервалы выровнены по кратным ширине от начала эпохи, период расширяется
+# до целых интервалов. Если ширина кратна часу и перцентили не нужны,
+# запрос читает часовые агрегаты reading_rollup (одна строка на датчик и час),
+# иначе - показания с GROUP BY по номеру интервала. Перцентили считаются в
+# numpy по показаниям, отсортированным по (датчик, интервал, значение).
+# Размер ответа ограничен до выполнения запроса: датчиков × интервалов
+# не больше AGGREGATE_MAX_ROWS.
+
+import re
+from server.config import AGGREGATE_MAX_ROWS, AGGREGATE_MAX_SCAN
+from server.database.db import db
+from server.database.timestamps import to_db, epoch_us_sql, datetime_to_us, us_to_datetime
+from server.monitoring import metrics
+from server.services.rollups import ROLLUP_SECONDS
+
+# Агрегаты без перцентилей (перцентиль - p50, p95, p99.9)
+AGGREGATES = ('min', 'max', 'avg', 'sum', 'count')
+DEFAULT_AGGREGATES = ('min', 'max', 'avg', 'count')
+
+# Источник: auto - часовые агрегаты, если подходят, rollup - только они, raw - показания
+SOURCES = ('auto', 'rollup', 'raw')
+
+_PERCENTILE_PATTERN = re.compile(r'^p(\d{1,2}(?:\.\d+)?)$')
+
+# Строка результата: начало интервала - микросекунды Unix
+_GROUP_FIELDS = (
+    ('sensor_id', '<i8'),
+    ('t', '<i8'),
+    ('count', '<i8'),
+    ('sum', '<f8'),
+    ('min', '<f8'),
+    ('max', '<f8')
+)
+
+
+def parse_aggregates(value):
+    """
+    Список агрегатов из параметра запроса ('min,max,avg,count,p95')
+
+    Returns:
+        list: имена агрегатов без повторов (ValueError для неизвестного)
+    """
+    names = []
+    for name in str(value).split(','):
+        name = name.strip().lower()
+        if not name or name in names:
+            continue
+        match = _PERCENTILE_PATTERN.match(name)
+        if name not in AGGREGATES and not (match and 0 < float(match.group(1)) < 100):
+            raise ValueError(f"Неизвестный агрегат: {name}. Доступны: {', '.join(AGGREGATES)}, pNN (перцентиль)")
+        names.append(name)
+    if not names:
+        raise ValueError('Не указаны агрегаты')
+    return names
+
+
+def _percentiles(aggregates):
+    """Перцентили из списка агрегатов: {имя: доля 0..1}"""
+    return {name: float(name[1:]) / 100 for name in aggregates if name.startswith('p')}
+
+
+class AggregateService:
+    """Агрегаты показаний датчиков по интервалам времени"""
+
+    @staticmethod
+    def _fetch(sql, params):
+        """Сгруппированные строки запроса в структурный массив _GROUP_FIELDS"""
+        import numpy as np
+
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            return np.fromiter(cursor, dtype=np.dtype(list(_GROUP_FIELDS)))
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _from_rollups(sensor_ids, start_us, end_us, bucket_us):
+        """Интервалы, кратные часу, по часовым агрегатам"""
+        bucket = bucket_us // 1000000
+        return AggregateService._fetch(f"""
+            SELECT sensor_id, bucket / {bucket} * {bucket} * 1000000 AS t,
+                   SUM(count), SUM(total), MIN(min_value), MAX(max_value)
+            FROM reading_rollup
+            WHERE sensor_id IN ({', '.join('?' * len(sensor_ids))}) AND bucket >= ? AND bucket < ?
+            GROUP BY sensor_id, t
+            ORDER BY sensor_id, t
+        """, [*sensor_ids, start_us // 1000000, end_us // 1000000])
+
+    @staticmethod
+    def _from_readings(sensor_ids, start_us, end_us, bucket_us):
+        """Интервалы по показаниям: GROUP BY по номеру интервала"""
+        return AggregateService._fetch(f"""
+            SELECT sensor_id, {epoch_us_sql()} / {bucket_us} * {bucket_us} AS t,
+                   COUNT(*), SUM(value), MIN(value), MAX(value)
+            FROM sensor_reading
+            WHERE sensor_id IN ({', '.join('?' * len(sensor_ids))}) AND timestamp >= ? AND timestamp < ?
+            GROUP BY sensor_id, t
+            ORDER BY sensor_id, t
+        """, [*sensor_ids, to_db(us_to_datetime(start_us)), to_db(us_to_datetime(end_us))])
+
+    @staticmethod
+    def _with_percentiles(sensor_ids, start_us, end_us, bucket_us, percentiles):
+        """
+        Интервалы по показаниям с перцентилями (линейная интерполяция, как np.percentile)
+
+        Returns:
+            tuple: (массив _GROUP_FIELDS, {имя перцентиля: ndarray})
+        """
+        import numpy as np
+
+        where = f"sensor_id IN ({', '.join('?' * len(sensor_ids))}) AND timestamp >= ? AND timestamp < ?"
+        params = [*sensor_ids, to_db(us_to_datetime(start_us)), to_db(us_to_datetime(end_us))]
+
+        cursor = db.session.connection().connection.cursor()
+        try:
+            # Число показаний - по индексу (sensor_id, timestamp), до чтения значений
+            scanned = cursor.execute(f"SELECT COUNT(*) FROM sensor_reading WHERE {where}", params).fetchone()[0]
+            if scanned > AGGREGATE_MAX_SCAN:
+                raise ValueError(f'Для перцентилей нужно прочитать {scanned} показаний, предел {AGGREGATE_MAX_SCAN}: '
+                                 f'сократите период или число датчиков')
+            cursor.execute(f"""
+                SELECT sensor_id, {epoch_us_sql()} / {bucket_us} * {bucket_us}, value
+                FROM sensor_reading WHERE {where}
+            """, params)
+            readings = np.fromiter(cursor, dtype=[('sensor_id', '<i8'), ('t', '<i8'), ('v', '<f8')])
+        finally:
+            cursor.close()
+
+        readings = readings[np.lexsort((readings['v'], readings['t'], readings['sensor_id']))]
+        values = readings['v']
+        if len(readings):
+            changed = (np.diff(readings['sensor_id']) != 0) | (np.diff(readings['t']) != 0)
+            starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+        else:
+            starts = np.empty(0, dtype=np.int64)
+        counts = np.diff(np.append(starts, len(readings)))
+        lasts = starts + counts - 1
+
+        groups = np.empty(len(starts), dtype=np.dtype(list(_GROUP_FIELDS)))
+        groups['sensor_id'] = readings['sensor_id'][starts]
+        groups['t'] = readings['t'][starts]
+        groups['count'] = counts
+        groups['sum'] = np.add.reduceat(values, starts) if len(starts) else 0.0
+        groups['min'] = values[starts]
+        groups['max'] = values[lasts]
+
+        result = {}
+        for name, fraction in percentiles.items():
+            position = starts + fraction * (counts - 1)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, lasts)
+            result[name] = values[low] + (values[high] - values[low]) * (position - low)
+        return groups, result
+
+    @staticmethod
+    def aggregate(sensor_ids, start_time, end_time, bucket, aggregates=DEFAULT_AGGREGATES,
+                  source='auto', ts_format='iso'):
+        """
+        Агрегаты показаний датчиков по интервалам
+
+        Args:
+            sensor_ids (list): датчики
+            start_time, end_time (datetime): период (расширяется до целых интервалов)
+            bucket (float): ширина интервала, секунды (не меньше секунды)
+            aggregates (list): имена агрегатов (см. parse_aggregates)
+            source (str): SOURCES
+            ts_format (str): iso или epoch
+
+        Returns:
+            dict: столбцы sensor_id, t (начало интервала) и по одному на агрегат - только
+                  интервалы с показаниями, по датчику и времени; bucket, from, to, source, rows.
+                  ValueError, если датчиков × интервалов больше AGGREGATE_MAX_ROWS или
+                  источник rollup не подходит
+        """
+        import numpy as np
+        from server.utils.serialization import format_timestamps, format_timestamp
+
+        bucket_us = int(round(bucket * 1e6))
+        if bucket_us < 1000000:
+            raise ValueError('Интервал агрегации должен быть не меньше секунды')
+        if source not in SOURCES:
+            raise ValueError(f"Неизвестный source: {source}. Доступны: {', '.join(SOURCES)}")
+        if end_time <= start_time:
+            raise ValueError('Конец периода должен быть позже начала')
+
+        start_us = datetime_to_us(start_time) // bucket_us * bucket_us
+        end_us = -(-datetime_to_us(end_time) // bucket_us) * bucket_us
+        sensor_ids = sorted({int(sensor_id) for sensor_id in sensor_ids})
+
+        # Ограничение ответа сверху - до запроса к БД
+        rows_limit = len(sensor_ids) * ((end_us - start_us) // bucket_us)
+        if rows_limit > AGGREGATE_MAX_ROWS:
+            raise ValueError(f'Ответ может содержать до {rows_limit} строк (датчиков × интервалов), '
+                             f'предел {AGGREGATE_MAX_ROWS}: увеличьте интервал, сократите период или число датчиков')
+
+        percentiles = _percentiles(aggregates)
+        rollup_fits = not percentiles and bucket_us % (ROLLUP_SECONDS * 1000000) == 0
+        if source == 'rollup' and not rollup_fits:
+            raise ValueError('Часовые агрегаты подходят для интервалов, кратных часу, без перцентилей')
+        used = 'rollup' if rollup_fits and source != 'raw' else 'raw'
+
+        computed = {}
+        if not sensor_ids:
+            groups = np.empty(0, dtype=np.dtype(list(_GROUP_FIELDS)))
+        elif used == 'rollup':
+            groups = AggregateService._from_rollups(sensor_ids, start_us, end_us, bucket_us)
+        elif percentiles:
+            groups, computed = AggregateService._with_percentiles(sensor_ids, start_us, end_us, bucket_us, percentiles)
+        else:
+            groups = AggregateService._from_readings(sensor_ids, start_us, end_us, bucket_us)
+        metrics.aggregate_queries_total.inc(source=used)
+
+        computed['avg'] = groups['sum'] / np.maximum(groups['count'], 1)
+        result = {
+            'sensor_id': groups['sensor_id'].tolist(),
+            't': format_timestamps(groups['t'].view('datetime64[us]'), ts_format)
+        }
+        for name in aggregates:
+            result[name] = (computed[name] if name in computed else groups[name]).tolist()
+
+        result['bucket'] = bucket_us / 1e6
+        result['aggregates'] = list(aggregates)
+        result['sensors'] = sensor_ids
+        result['from'] = format_timestamp(us_to_datetime(start_us), ts_format)
+        result['to'] = format_timestamp(us_to_datetime(end_us), ts_format)
+        result['source'] = used
+        result['rows'] = len(groups)
+        return result
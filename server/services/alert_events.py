@@ -0,0 +1,245 @@
+# server/services/alert_events.py
+#
+# Инциденты тревог (таблица alert_event). Показания датчика за одним порогом
+# подряд сворачиваются в одну строку: начало, последнее показание, первое,
+# последнее и пиковое значения, количество. Инцидент открывается первым
+# показанием за порогом и закрывается первым показанием в норме, выходом за
+# другой порог или перерывом в тревогах дольше ALERT_EVENT_GAP секунд.
+# Таблица обновляется в транзакции записи показаний, поэтому /alerts читает
+# несколько строк на инцидент вместо тысяч показаний с is_alert.
+
+import logging
+from server.config import ALERT_EVENT_GAP
+from server.database.timestamps import EPOCH_STORAGE, epoch_us_sql, to_db, us_to_datetime
+from server.monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+HIGH = 'high'
+LOW = 'low'
+
+
+def breach_direction(value, min_threshold, max_threshold):
+    """Направление выхода за порог: high, low или None (значение в норме)"""
+    if max_threshold is not None and value > max_threshold:
+        return HIGH
+    if min_threshold is not None and value < min_threshold:
+        return LOW
+    return None
+
+
+def _db_time(us):
+    """Микросекунды Unix в значение столбца времени (режим GEO_TIMESTAMP_STORAGE)"""
+    if us is None:
+        return None
+    return us if EPOCH_STORAGE else to_db(us_to_datetime(us))
+
+
+class AlertEventService:
+    """Открытие, продление и закрытие инцидентов тревог при записи показаний"""
+
+    @staticmethod
+    def _load_open(cursor, sensor_ids):
+        """Открытые инциденты датчиков: {sensor_id: инцидент} (по частичному индексу открытых)"""
+        from server.services.ingest_service import SQLITE_MAX_VARIABLES
+
+        sensor_ids = sorted(sensor_ids)
+        events = {}
+        for start in range(0, len(sensor_ids), SQLITE_MAX_VARIABLES):
+            chunk = sensor_ids[start:start + SQLITE_MAX_VARIABLES]
+            cursor.execute(f"""
+                SELECT id, sensor_id, direction, {epoch_us_sql('started_at')}, {epoch_us_sql('last_at')},
+                       first_value, last_value, peak_value, {epoch_us_sql('peak_at')}, count, unit
+                FROM alert_event WHERE ended_at IS NULL AND sensor_id IN ({','.join('?' * len(chunk))})
+            """, chunk)
+            for (event_id, sensor_id, direction, started_at, last_at,
+                 first_value, last_value, peak_value, peak_at, count, unit) in cursor.fetchall():
+                events[sensor_id] = {
+                    'id': event_id, 'sensor_id': sensor_id, 'direction': direction,
+                    'started_at': started_at, 'last_at': last_at, 'ended_at': None,
+                    'first_value': first_value, 'last_value': last_value,
+                    'peak_value': peak_value, 'peak_at': peak_at, 'count': count, 'unit': unit
+                }
+        return events
+
+    @staticmethod
+    def apply(cursor, readings, gap=ALERT_EVENT_GAP):
+        """
+        Обновляет инциденты по новым показаниям (в транзакции их записи)
+
+        Показание старше открытого инцидента, которое не продлевает его,
+        записывается отдельным закрытым инцидентом.
+
+        Args:
+            cursor: курсор sqlite3
+            readings (iterable): кортежи (sensor_id, время в мкс Unix, value, unit, direction),
+                                 direction - результат breach_direction; порядок любой
+            gap (float): ALERT_EVENT_GAP, секунды
+
+        Returns:
+            dict: количество открытых и закрытых инцидентов
+        """
+        by_sensor = {}
+        for sensor_id, timestamp, value, unit, direction in readings:
+            by_sensor.setdefault(sensor_id, []).append((timestamp, value, unit, direction))
+
+        open_events = AlertEventService._load_open(cursor, by_sensor)
+        gap_us = int(gap * 1000000)
+        touched = []
+        counts = {'opened': 0, 'closed': 0}
+
+        def touch(event):
+            if not event.get('touched'):
+                event['touched'] = True
+                touched.append(event)
+
+        def close(event, ended_at):
+            event['ended_at'] = ended_at
+            counts['closed'] += 1
+            touch(event)
+
+        def new_event(sensor_id, timestamp, value, unit, direction):
+            counts['opened'] += 1
+            event = {
+                'id': None, 'sensor_id': sensor_id, 'direction': direction,
+                'started_at': timestamp, 'last_at': timestamp, 'ended_at': None,
+                'first_value': value, 'last_value': value, 'peak_value': value, 'peak_at': timestamp,
+                'count': 1, 'unit': unit
+            }
+            touch(event)
+            return event
+
+        for sensor_id, items in by_sensor.items():
+            event = open_events.get(sensor_id)
+            if event is None and all(direction is None for *_, direction in items):
+                continue
+            items.sort(key=lambda item: item[0])
+
+            for timestamp, value, unit, direction in items:
+                if direction is None:
+                    # Показание в норме после тревоги закрывает инцидент
+                    if event is not None and timestamp > event['last_at']:
+                        close(event, timestamp)
+                        event = None
+                    continue
+
+                if (event is not None and direction == event['direction']
+                        and event['started_at'] - gap_us <= timestamp <= event['last_at'] + gap_us):
+                    event['count'] += 1
+                    if timestamp < event['started_at']:
+                        event['started_at'], event['first_value'] = timestamp, value
+                    if timestamp >= event['last_at']:
+                        event['last_at'], event['last_value'] = timestamp, value
+                    if (value > event['peak_value']) if direction == HIGH else (value < event['peak_value']):
+                        event['peak_value'], event['peak_at'] = value, timestamp
+                    touch(event)
+                    continue
+
+                if event is not None and timestamp > event['last_at']:
+                    # Выход за другой порог - закрытие в момент перехода, перерыв - по последней тревоге
+                    close(event, timestamp if direction != event['direction'] else event['last_at'])
+                    event = new_event(sensor_id, timestamp, value, unit, direction)
+                elif event is not None:
+                    close(new_event(sensor_id, timestamp, value, unit, direction), timestamp)
+                else:
+                    event = new_event(sensor_id, timestamp, value, unit, direction)
+
+        if not touched:
+            return counts
+
+        # Закрытые инциденты записываются раньше новых, чтобы не нарушить индекс открытых
+        cursor.executemany(
+            "UPDATE alert_event SET started_at = ?, last_at = ?, ended_at = ?, first_value = ?, "
+            "last_value = ?, peak_value = ?, peak_at = ?, count = ? WHERE id = ?",
+            [
+                (_db_time(event['started_at']), _db_time(event['last_at']), _db_time(event['ended_at']),
+                 event['first_value'], event['last_value'], event['peak_value'], _db_time(event['peak_at']),
+                 event['count'], event['id'])
+                for event in touched if event['id'] is not None
+            ]
+        )
+        cursor.executemany(
+            "INSERT INTO alert_event (sensor_id, direction, started_at, last_at, ended_at, first_value, "
+            "last_value, peak_value, peak_at, count, unit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (event['sensor_id'], event['direction'], _db_time(event['started_at']), _db_time(event['last_at']),
+                 _db_time(event['ended_at']), event['first_value'], event['last_value'], event['peak_value'],
+                 _db_time(event['peak_at']), event['count'], event['unit'])
+                for event in touched if event['id'] is None
+            ]
+        )
+
+        for event, count in counts.items():
+            if count:
+                metrics.alert_events_total.inc(count, event=event)
+        return counts
+
+    @staticmethod
+    def rebuild(cursor, sensor_ids=None):
+        """
+        Пересчитывает инциденты по истории показаний (после записи в обход
+        IngestService и для существующей БД). Читаются только показания за
+        порогом и первые показания в норме после них.
+
+        Args:
+            cursor: курсор sqlite3 (вызывающий фиксирует транзакцию)
+            sensor_ids (list): датчики (None - все)
+
+        Returns:
+            int: количество инцидентов
+        """
+        from server.services.ingest_service import IngestService, SQLITE_MAX_VARIABLES
+
+        if sensor_ids is None:
+            sensor_ids = [sensor_id for sensor_id, in cursor.execute("SELECT id FROM sensor").fetchall()]
+        sensor_ids = sorted(sensor_ids)
+        settings = IngestService._load_sensor_settings(cursor, sensor_ids)
+
+        total = 0
+        for start in range(0, len(sensor_ids), SQLITE_MAX_VARIABLES):
+            chunk = sensor_ids[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"DELETE FROM alert_event WHERE sensor_id IN ({placeholders})", chunk)
+
+            rows = cursor.execute(f"""
+                SELECT sensor_id, ts, value, unit, is_alert FROM (
+                    SELECT sensor_id, {epoch_us_sql()} AS ts, value, unit, is_alert,
+                           LAG(is_alert) OVER (PARTITION BY sensor_id ORDER BY timestamp) AS previous
+                    FROM sensor_reading WHERE sensor_id IN ({placeholders})
+                )
+                WHERE is_alert = 1 OR previous = 1
+                ORDER BY sensor_id, ts
+            """, chunk).fetchall()
+
+            readings = []
+            for sensor_id, timestamp, value, unit, is_alert in rows:
+                direction = None
+                if is_alert:
+                    min_threshold, max_threshold, _ = settings.get(sensor_id, (None, None, None))
+                    direction = breach_direction(value, min_threshold, max_threshold)
+                    if direction is None:
+                        # Пороги изменились после записи: направление по имеющемуся порогу
+                        direction = LOW if max_threshold is None and min_threshold is not None else HIGH
+                readings.append((sensor_id, timestamp, value, unit, direction))
+
+            total += AlertEventService.apply(cursor, readings)['opened']
+
+        return total
+
+
+def ensure_alert_events(connection):
+    """
+    Заполняет alert_event по истории, если таблица пуста, а тревоги в показаниях есть
+    (первый запуск после ее появления)
+
+    Args:
+        connection: соединение SQLAlchemy
+    """
+    if connection.exec_driver_sql("SELECT 1 FROM alert_event LIMIT 1").fetchone():
+        return
+    if not connection.exec_driver_sql("SELECT 1 FROM sensor_reading WHERE is_alert = 1 LIMIT 1").fetchone():
+        return
+
+    count = AlertEventService.rebuild(connection.connection.cursor())
+    connection.commit()
+    logger.info(f"Инциденты тревог восстановлены по истории показаний: {count}")
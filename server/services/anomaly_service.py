@@ -0,0 +1,385 @@
+# server/services/anomaly_service.py
+#
+# Пакетный поиск аномалий по всем датчикам
+# Запуск вручную: python -m server.services.anomaly_service [--hours 24] [--method zscore] [--workers 4]
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from server.config import (
+    SQLITE_DB_PATH, ANOMALY_INTERVAL, ANOMALY_WINDOW_HOURS, ANOMALY_METHOD,
+    ANOMALY_Z_THRESHOLD, ANOMALY_WORKERS
+)
+from server.monitoring import metrics
+from server.database.timestamps import SQLITE_TIMESTAMP_FORMAT, to_db
+from server.utils.cache import versions
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_METHODS = ('zscore', 'isolation_forest')
+
+# Окно медианы соседей, от которой считаются отклонения (нечетное, центр не входит)
+BASELINE_WINDOW = 5
+
+# Минимум показаний датчика для оценки
+MIN_SENSOR_POINTS = 10
+
+# Параллелим z-оценки только на больших окнах: иначе передача данных дороже расчета
+PARALLEL_MIN_POINTS = 200000
+
+# Пул запускается из потока планировщика многопоточного сервера: дочерний процесс
+# после fork унаследовал бы блокировки, захваченные другими потоками (метрики,
+# версии кэшей, spool), поэтому процессы создаются через forkserver (spawn - где его нет)
+_POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+def _segments(sensor_ids):
+    """Границы групп датчиков в массиве, отсортированном по sensor_id"""
+    import numpy as np
+
+    boundaries = np.flatnonzero(np.diff(sensor_ids)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(sensor_ids)]))
+    return starts, ends
+
+
+def _segmented_median(values, segment_index, starts, counts):
+    """Медиана каждой группы одной сортировкой (lexsort по группе и значению)"""
+    import numpy as np
+
+    order = np.lexsort((values, segment_index))
+    ordered = values[order]
+    lower = ordered[starts + (counts - 1) // 2]
+    upper = ordered[starts + counts // 2]
+    return (lower + upper) / 2
+
+
+def _baseline_residuals(values, starts, ends, segment_index):
+    """
+    Отклонение от медианы соседних показаний того же датчика
+
+    Медиана устойчива к одиночным выбросам и убирает суточный цикл и тренд,
+    поэтому выброс виден как большое отклонение.
+    """
+    import numpy as np
+
+    half = BASELINE_WINDOW // 2
+    positions = np.arange(len(values))
+    segment_start = starts[segment_index]
+    segment_last = ends[segment_index] - 1
+
+    # Само показание в медиану не входит: выброс не сдвигает свою же базу
+    window = np.stack([
+        values[np.clip(positions + offset, segment_start, segment_last)]
+        for offset in range(-half, half + 1) if offset != 0
+    ])
+    return values - np.median(window, axis=0)
+
+
+def robust_zscores(sensor_ids, values):
+    """
+    Робастные z-оценки (медиана и MAD) отклонений от локальной медианы,
+    векторно по всем датчикам сразу
+
+    Args:
+        sensor_ids (ndarray): id датчиков, отсортированы (внутри датчика - по времени)
+        values (ndarray): показания
+
+    Returns:
+        ndarray: z-оценки (0 для датчиков с малым числом показаний или без разброса)
+    """
+    import numpy as np
+
+    starts, ends = _segments(sensor_ids)
+    counts = ends - starts
+    segment_index = np.repeat(np.arange(len(starts)), counts)
+
+    residuals = _baseline_residuals(values, starts, ends, segment_index)
+    median = _segmented_median(residuals, segment_index, starts, counts)
+    deviation = np.abs(residuals - median[segment_index])
+    mad = _segmented_median(deviation, segment_index, starts, counts)
+
+    # 0.6745 - квантиль нормального распределения: MAD/0.6745 оценивает сигму
+    valid = (counts >= MIN_SENSOR_POINTS) & (mad > 0)
+    scale = np.where(valid, mad, 1.0)[segment_index]
+    scores = 0.6745 * (residuals - median[segment_index]) / scale
+    scores[~valid[segment_index]] = 0.0
+    return scores
+
+
+def isolation_forest_scores(sensor_ids, values, seed=0):
+    """
+    Оценки аномальности IsolationForest, отдельная модель на каждый датчик
+
+    Признаки - отклонение от локальной медианы и само значение. Возвращает
+    -score_samples - 0.5: положительные значения - аномалии (порог 'auto'
+    из scikit-learn).
+    """
+    import numpy as np
+    from sklearn.ensemble import IsolationForest
+
+    starts, ends = _segments(sensor_ids)
+    counts = ends - starts
+    segment_index = np.repeat(np.arange(len(starts)), counts)
+    residuals = _baseline_residuals(values, starts, ends, segment_index)
+
+    scores = np.zeros(len(values))
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if end - start < MIN_SENSOR_POINTS:
+            continue
+        features = np.column_stack((residuals[start:end], values[start:end]))
+        model = IsolationForest(n_estimators=100, contamination='auto', random_state=seed)
+        model.fit(features)
+        scores[start:end] = -model.score_samples(features) - 0.5
+    return scores
+
+
+def _score_chunk(method, sensor_ids, values):
+    """Оценка части датчиков (выполняется в процессе пула)"""
+    if method == 'isolation_forest':
+        return isolation_forest_scores(sensor_ids, values)
+    return robust_zscores(sensor_ids, values)
+
+
+class AnomalyService:
+    """Поиск аномалий в недавних показаниях всего парка датчиков"""
+
+    @staticmethod
+    def load_window(hours_back=ANOMALY_WINDOW_HOURS, db_path=None):
+        """
+        Показания всех датчиков за период одним запросом, в виде столбцов
+
+        Returns:
+            dict: reading_id, sensor_id, value (ndarray) и timestamp (список значений времени из БД),
+                  отсортированы по датчику и времени
+        """
+        import numpy as np
+
+        since = to_db(datetime.utcnow() - timedelta(hours=hours_back))
+        conn = sqlite3.connect(db_path or SQLITE_DB_PATH, timeout=10.0)
+        try:
+            rows = conn.execute("""
+                SELECT id, sensor_id, timestamp, value FROM sensor_reading
+                WHERE timestamp >= ?
+                ORDER BY sensor_id, timestamp
+            """, (since,)).fetchall()
+        finally:
+            conn.close()
+
+        if not rows:
+            return {
+                'reading_id': np.empty(0, dtype=np.int64), 'sensor_id': np.empty(0, dtype=np.int64),
+                'timestamp': [], 'value': np.empty(0)
+            }
+
+        reading_ids, sensor_ids, timestamps, values = zip(*rows)
+        return {
+            'reading_id': np.array(reading_ids, dtype=np.int64),
+            'sensor_id': np.array(sensor_ids, dtype=np.int64),
+            'timestamp': list(timestamps),
+            'value': np.array(values, dtype=float)
+        }
+
+    @staticmethod
+    def score(sensor_ids, values, method='zscore', workers=1):
+        """
+        Оценки аномальности всех показаний
+
+        При workers > 1 датчики делятся на порции по числу процессов
+        (IsolationForest - всегда, z-оценки - на больших окнах).
+        """
+        import numpy as np
+
+        if method not in ANOMALY_METHODS:
+            raise ValueError(f"Неизвестный метод: {method}. Доступны: {', '.join(ANOMALY_METHODS)}")
+        if len(values) == 0:
+            return np.empty(0)
+
+        starts, ends = _segments(sensor_ids)
+        parallel = workers > 1 and len(starts) > 1 and (
+            method == 'isolation_forest' or len(values) >= PARALLEL_MIN_POINTS
+        )
+        if not parallel:
+            return _score_chunk(method, sensor_ids, values)
+
+        # Порции по границам датчиков примерно равного числа показаний
+        targets = np.linspace(0, len(values), workers + 1)[1:-1]
+        cuts = ends[np.searchsorted(ends, targets)]
+        bounds = sorted({0, len(values), *cuts.tolist()})
+        chunks = list(zip(bounds[:-1], bounds[1:]))
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=_POOL_CONTEXT) as pool:
+            futures = [
+                pool.submit(_score_chunk, method, sensor_ids[start:end], values[start:end])
+                for start, end in chunks
+            ]
+            return np.concatenate([future.result() for future in futures])
+
+    @staticmethod
+    def flag(scores, method='zscore', threshold=ANOMALY_Z_THRESHOLD):
+        """Маска аномальных показаний"""
+        import numpy as np
+
+        if method == 'isolation_forest':
+            return scores > 0
+        return np.abs(scores) > threshold
+
+    @staticmethod
+    def save(window, mask, scores, method, db_path=None):
+        """
+        Записывает найденные аномалии в sensor_anomaly
+        (повторно найденные при следующем запуске пропускаются)
+
+        Returns:
+            int: количество новых записей
+        """
+        import numpy as np
+
+        indices = np.flatnonzero(mask)
+        if len(indices) == 0:
+            return 0
+
+        detected_at = datetime.utcnow().strftime(SQLITE_TIMESTAMP_FORMAT)
+        rows = [
+            (int(window['reading_id'][i]), int(window['sensor_id'][i]), window['timestamp'][i],
+             float(window['value'][i]), float(scores[i]), method, detected_at)
+            for i in indices.tolist()
+        ]
+
+        conn = sqlite3.connect(db_path or SQLITE_DB_PATH, timeout=10.0)
+        try:
+            with conn:
+                before = conn.total_changes
+                conn.executemany("""
+                    INSERT OR IGNORE INTO sensor_anomaly
+                        (reading_id, sensor_id, timestamp, value, score, method, detected_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+                inserted = conn.total_changes - before
+        finally:
+            conn.close()
+
+        if inserted:
+            versions.bump('anomalies')
+        return inserted
+
+    @staticmethod
+    def run_detection(hours_back=ANOMALY_WINDOW_HOURS, method=ANOMALY_METHOD, workers=ANOMALY_WORKERS,
+                      threshold=ANOMALY_Z_THRESHOLD, db_path=None):
+        """
+        Один проход детектора: загрузка окна, оценка, запись аномалий
+
+        Returns:
+            dict: отчет о запуске (в т.ч. производительность в датчиках в секунду)
+        """
+        import numpy as np
+
+        started = time.perf_counter()
+        window = AnomalyService.load_window(hours_back, db_path)
+        loaded = time.perf_counter()
+
+        scores = AnomalyService.score(window['sensor_id'], window['value'], method, workers)
+        mask = AnomalyService.flag(scores, method, threshold)
+        scored = time.perf_counter()
+
+        inserted = AnomalyService.save(window, mask, scores, method, db_path)
+        finished = time.perf_counter()
+
+        sensors = int(len(np.unique(window['sensor_id'])))
+        duration = finished - started
+        report = {
+            'method': method,
+            'hours': hours_back,
+            'workers': workers,
+            'sensors': sensors,
+            'readings': int(len(window['value'])),
+            'flagged': int(mask.sum()),
+            'new_anomalies': inserted,
+            'load_seconds': round(loaded - started, 4),
+            'score_seconds': round(scored - loaded, 4),
+            'total_seconds': round(duration, 4),
+            'sensors_per_second': round(sensors / duration, 1) if duration > 0 else None
+        }
+
+        metrics.anomaly_run_duration.observe(duration, method=method)
+        metrics.anomalies_detected_total.inc(inserted, method=method)
+        if report['sensors_per_second'] is not None:
+            metrics.anomaly_sensors_per_second.set(report['sensors_per_second'], method=method)
+
+        return report
+
+    @staticmethod
+    def get_anomalies(hours_back=24, sensor_id=None, building_id=None, limit=500):
+        """Найденные аномалии за период (новые первыми)"""
+        from server.models.sensor_data import Sensor, SensorAnomaly
+
+        time_threshold = datetime.utcnow() - timedelta(hours=hours_back)
+        query = SensorAnomaly.query.filter(SensorAnomaly.timestamp >= time_threshold)
+        if sensor_id is not None:
+            query = query.filter(SensorAnomaly.sensor_id == sensor_id)
+        if building_id is not None:
+            query = query.join(Sensor, Sensor.id == SensorAnomaly.sensor_id).filter(Sensor.building_id == building_id)
+
+        return query.order_by(SensorAnomaly.timestamp.desc()).limit(limit).all()
+
+
+_scheduler = None
+
+
+def start_anomaly_scheduler(interval=ANOMALY_INTERVAL):
+    """Периодический запуск детектора в фоновом потоке"""
+    global _scheduler
+    if _scheduler is not None or interval <= 0:
+        return
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                report = AnomalyService.run_detection()
+                logger.info(f"Поиск аномалий: {report['flagged']} из {report['readings']} показаний "
+                            f"({report['sensors_per_second']} датчиков/с)")
+            except Exception as e:
+                logger.error(f"Ошибка поиска аномалий: {e}")
+
+    _scheduler = threading.Thread(target=loop, name='geo-anomaly-detector', daemon=True)
+    _scheduler.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск аномалий по всем датчикам (БД из GEO_MONITORING_DB)')
+    parser.add_argument('--hours', type=float, default=ANOMALY_WINDOW_HOURS, help='Окно, часы')
+    parser.add_argument('--method', choices=ANOMALY_METHODS, default=ANOMALY_METHOD)
+    parser.add_argument('--workers', type=int, default=ANOMALY_WORKERS, help='Число процессов')
+    parser.add_argument('--threshold', type=float, default=ANOMALY_Z_THRESHOLD, help='Порог |z| для zscore')
+    args = parser.parse_args()
+
+    if not os.path.exists(SQLITE_DB_PATH):
+        parser.error(f'БД не найдена: {SQLITE_DB_PATH}')
+
+    # Создаем таблицу аномалий, если сервер еще не запускался с этой версией
+    from flask import Flask
+    from server.config import SQLALCHEMY_DATABASE_URI
+    from server.database.db import init_db
+    import server.models.sensor_data  # noqa: F401 - модели для create_all
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
+    init_db(app)
+
+    report = AnomalyService.run_detection(args.hours, args.method, args.workers, args.threshold)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
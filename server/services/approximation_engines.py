@@ -0,0 +1,347 @@
+# server/services/approximation_engines.py
+
+import numpy as np
+
+# Окна длиннее этого порога сворачиваются через FFT, короче - прямой сверткой
+FFT_CONVOLVE_THRESHOLD = 255
+
+
+def _odd(window, minimum=3):
+    window = max(minimum, int(window))
+    return window if window % 2 == 1 else window + 1
+
+
+def _grid(t, num_points):
+    return np.linspace(t[0], t[-1], num_points)
+
+
+def _convolve_valid(values, kernel):
+    """Свертка в режиме 'valid': прямая для коротких окон, FFT для длинных"""
+    if len(kernel) <= FFT_CONVOLVE_THRESHOLD:
+        return np.convolve(values, kernel, mode='valid')
+
+    size = len(values) + len(kernel) - 1
+    nfft = 1 << (size - 1).bit_length()
+    full = np.fft.irfft(np.fft.rfft(values, nfft) * np.fft.rfft(kernel, nfft), nfft)[:size]
+    return full[len(kernel) - 1:len(values)]
+
+
+def _window_sums(cumsum, lo, hi):
+    return cumsum[hi] - cumsum[lo]
+
+
+def _centered_bounds(n, window):
+    """Границы центрированного окна [lo, hi) для каждой точки (у краев окно сужается)"""
+    index = np.arange(n)
+    lo = np.maximum(0, index - window // 2)
+    hi = np.minimum(n, index + window // 2 + 1)
+    return lo, hi
+
+
+def fit_polynomial(t, v, num_points, degree=3, **params):
+    """Полиномиальная аппроксимация методом наименьших квадратов"""
+    degree = min(degree, len(t) - 1, 4)
+    poly = np.polynomial.Polynomial.fit(t, v, degree)
+    grid = _grid(t, num_points)
+
+    return {
+        'grid_t': grid,
+        'grid_v': poly(grid),
+        'fitted': poly(t),
+        'degree': degree,
+        'description': f'Полином {degree}-й степени'
+    }
+
+
+def fit_linear(t, v, num_points, **params):
+    """Линейная регрессия"""
+    result = fit_polynomial(t, v, num_points, degree=1)
+    result['description'] = 'Линейная регрессия'
+    return result
+
+
+def fit_moving_average(t, v, num_points, window=None, **params):
+    """Центрированное скользящее среднее через накопленные суммы, O(n)"""
+    n = len(v)
+    window = _odd(window or max(3, n // 10))
+
+    offset = v.mean()
+    cumsum = np.concatenate(([0.0], np.cumsum(v - offset)))
+    lo, hi = _centered_bounds(n, window)
+    smoothed = _window_sums(cumsum, lo, hi) / (hi - lo) + offset
+
+    grid = _grid(t, num_points)
+    return {
+        'grid_t': grid,
+        'grid_v': np.interp(grid, t, smoothed),
+        'fitted': smoothed,
+        'window': window,
+        'description': f'Скользящее среднее (окно {window})'
+    }
+
+
+def fit_savgol(t, v, num_points, window=None, degree=2, **params):
+    """
+    Фильтр Савицкого-Голея: свертка с коэффициентами локального полинома
+
+    Предполагается примерно равномерный шаг по времени. Края обрабатываются
+    подгонкой полинома к первому и последнему окну (как mode='interp' в scipy).
+    """
+    n = len(v)
+    degree = max(1, min(degree or 2, 5))
+    window = _odd(window or max(5, n // 20), minimum=degree + 2)
+    if window > n:
+        window = n if n % 2 == 1 else n - 1
+    if window <= degree:
+        return fit_polynomial(t, v, num_points, degree=min(degree, n - 1))
+
+    half = window // 2
+    offsets = np.arange(-half, half + 1)
+    vander = np.vander(offsets, degree + 1, increasing=True)
+    coefficients = np.linalg.pinv(vander)[0]
+
+    smoothed = np.empty(n)
+    smoothed[half:n - half] = _convolve_valid(v, coefficients[::-1])
+
+    # Края: полином по крайним окнам
+    positions = np.arange(window)
+    head = np.polynomial.Polynomial.fit(positions, v[:window], degree)
+    tail = np.polynomial.Polynomial.fit(positions, v[-window:], degree)
+    smoothed[:half] = head(positions[:half])
+    smoothed[n - half:] = tail(positions[window - half:])
+
+    grid = _grid(t, num_points)
+    return {
+        'grid_t': grid,
+        'grid_v': np.interp(grid, t, smoothed),
+        'fitted': smoothed,
+        'window': window,
+        'degree': degree,
+        'description': f'Фильтр Савицкого-Голея (окно {window}, степень {degree})'
+    }
+
+
+def fit_lowess(t, v, num_points, frac=None, iterations=2, **params):
+    """
+    LOWESS: локально-линейная регрессия с робастными итерациями
+
+    Для каждой точки берется центрированное окно из frac·n соседей с
+    прямоугольным ядром, поэтому все взвешенные суммы считаются через
+    накопленные суммы за O(n). Робастные веса - biweight по остаткам.
+    """
+    n = len(v)
+    frac = min(max(frac or 0.1, 3 / n), 1.0)
+    window = _odd(frac * n)
+    lo, hi = _centered_bounds(n, window)
+
+    # Нормируем время и значения, чтобы не терять точность в накопленных суммах
+    span = (t[-1] - t[0]) or 1.0
+    x = (t - t[0]) / span - 0.5
+    offset = v.mean()
+    y = v - offset
+
+    weights = np.ones(n)
+    fitted = y
+    for iteration in range(iterations + 1):
+        def window_sum(values):
+            return _window_sums(np.concatenate(([0.0], np.cumsum(values))), lo, hi)
+
+        s0 = window_sum(weights)
+        s1 = window_sum(weights * x)
+        s2 = window_sum(weights * x * x)
+        sy = window_sum(weights * y)
+        sxy = window_sum(weights * x * y)
+
+        denominator = s0 * s2 - s1 * s1
+        safe = np.abs(denominator) > 1e-12 * np.maximum(s0 * s2, 1e-300)
+        slope = np.where(safe, (s0 * sxy - s1 * sy) / np.where(safe, denominator, 1.0), 0.0)
+        fitted = (sy - slope * s1) / np.maximum(s0, 1e-300) + slope * x
+
+        if iteration == iterations:
+            break
+
+        # Робастные веса (biweight)
+        residuals = y - fitted
+        scale = 6 * np.median(np.abs(residuals))
+        if scale <= 0:
+            break
+        u = np.clip(residuals / scale, -1, 1)
+        weights = (1 - u * u) ** 2
+        weights = np.maximum(weights, 1e-6)
+
+    smoothed = fitted + offset
+    grid = _grid(t, num_points)
+    return {
+        'grid_t': grid,
+        'grid_v': np.interp(grid, t, smoothed),
+        'fitted': smoothed,
+        'frac': frac,
+        'description': f'LOWESS (доля окна {frac:.2f})'
+    }
+
+
+def _cubic_bspline_basis(x, knots_count):
+    """
+    Значения равномерного кубического B-сплайна: для каждой точки 4 ненулевые
+    базисные функции (индексы j..j+3), x нормировано в [0, knots_count]
+    """
+    interval = np.minimum(np.floor(x).astype(np.int64), knots_count - 1)
+    u = x - interval
+    u2 = u * u
+    u3 = u2 * u
+    values = np.stack((
+        (1 - u) ** 3 / 6,
+        (3 * u3 - 6 * u2 + 4) / 6,
+        (-3 * u3 + 3 * u2 + 3 * u + 1) / 6,
+        u3 / 6
+    ), axis=1)
+    return interval, values
+
+
+def fit_spline(t, v, num_points, knots=None, smoothing=None, **params):
+    """
+    Сглаживающий сплайн (P-сплайн): кубические B-сплайны на равномерной
+    сетке узлов со штрафом на вторые разности коэффициентов
+
+    Нормальные уравнения собираются через bincount по 4 ненулевым базисным
+    функциям каждой точки - O(n), решается малая система размера узлов.
+    """
+    n = len(v)
+    knots = int(knots or min(30, max(4, n // 10)))
+    smoothing = 0.01 if smoothing is None else float(smoothing)
+    size = knots + 3
+
+    span = (t[-1] - t[0]) or 1.0
+    x = (t - t[0]) / span * knots
+    offset = v.mean()
+    y = v - offset
+
+    interval, basis = _cubic_bspline_basis(x, knots)
+
+    # B^T B и B^T y
+    gram = np.zeros((size, size))
+    rhs = np.zeros(size)
+    for a in range(4):
+        rhs += np.bincount(interval + a, weights=basis[:, a] * y, minlength=size)
+        for b in range(a, 4):
+            diagonal = np.bincount(interval + a, weights=basis[:, a] * basis[:, b], minlength=size)
+            index = np.arange(size - (b - a))
+            gram[index, index + (b - a)] += diagonal[:size - (b - a)]
+            if a != b:
+                gram[index + (b - a), index] += diagonal[:size - (b - a)]
+
+    # Штраф на вторые разности, масштабированный к данным
+    difference = np.diff(np.eye(size), n=2, axis=0)
+    penalty = difference.T @ difference
+    lam = smoothing * np.trace(gram) / np.trace(penalty)
+    coefficients = np.linalg.solve(gram + lam * penalty + 1e-12 * np.eye(size), rhs)
+
+    def evaluate(points):
+        idx, values = _cubic_bspline_basis(points, knots)
+        result = np.zeros(len(points))
+        for a in range(4):
+            result += values[:, a] * coefficients[idx + a]
+        return result + offset
+
+    grid = _grid(t, num_points)
+    return {
+        'grid_t': grid,
+        'grid_v': evaluate((grid - t[0]) / span * knots),
+        'fitted': evaluate(x),
+        'knots': knots,
+        'smoothing': smoothing,
+        'description': f'Сглаживающий сплайн ({knots} узлов, s={smoothing:g})'
+    }
+
+
+ENGINES = {
+    'polynomial': fit_polynomial,
+    'linear': fit_linear,
+    'moving_average': fit_moving_average,
+    'savgol': fit_savgol,
+    'lowess': fit_lowess,
+    'spline': fit_spline
+}
+
+
+def analyze_data_characteristics(values):
+    """Анализирует характеристики данных для выбора метода"""
+    if len(values) < 3:
+        return {'type': 'insufficient', 'noise_level': 'unknown'}
+
+    # Вычисляем статистики
+    data_range = float(np.max(values) - np.min(values))
+    std_dev = float(np.std(values))
+    mean_val = float(np.mean(values))
+
+    # Определяем уровень шума
+    noise_ratio = std_dev / (abs(mean_val) + 1e-10)  # Избегаем деления на ноль
+
+    # Определяем характер изменений
+    linear_trend = np.polynomial.Polynomial.fit(np.arange(len(values)), values, 1).convert().coef[-1]
+    trend_strength = float(abs(linear_trend) * len(values) / (std_dev + 1e-10))
+
+    return {
+        'type': 'flat' if data_range < std_dev * 2 else 'varying',
+        'noise_level': 'high' if noise_ratio > 0.3 else 'medium' if noise_ratio > 0.1 else 'low',
+        'trend_strength': trend_strength,
+        'data_range': data_range,
+        'std_dev': std_dev,
+        'noise_ratio': noise_ratio
+    }
+
+
+def choose_optimal_method(values, characteristics):
+    """Выбирает оптимальный метод аппроксимации"""
+
+    # Для плоских данных с высоким шумом
+    if characteristics['type'] == 'flat' and characteristics['noise_level'] == 'high':
+        return 'moving_average', {'window': max(3, len(values) // 10)}
+
+    # Для данных с низким трендом
+    if characteristics['trend_strength'] < 0.5:
+        return 'linear', {}
+
+    # Для данных с умеренным шумом
+    if characteristics['noise_level'] in ['low', 'medium']:
+        return 'polynomial', {'degree': max(1, min(3, len(values) // 4, 2))}
+
+    # Для очень зашумленных данных
+    return 'spline', {'smoothing': min(1.0, characteristics['noise_ratio'])}
+
+
+def fit(method, t, v, num_points, **params):
+    """
+    Аппроксимация выбранным методом
+
+    Args:
+        method (str): один из ENGINES или 'auto'
+        t (ndarray): время (минуты от начала), по возрастанию
+        v (ndarray): значения
+        num_points (int): точек в сглаженной кривой
+        params: параметры метода (degree, window, frac, knots, smoothing)
+
+    Returns:
+        dict: grid_t, grid_v, fitted, r_squared, method и параметры метода
+    """
+    characteristics = None
+    if method == 'auto':
+        characteristics = analyze_data_characteristics(v)
+        method, auto_params = choose_optimal_method(v, characteristics)
+        params = {**params, **auto_params}
+
+    if method not in ENGINES:
+        raise ValueError(f'Неизвестный метод аппроксимации: {method}')
+
+    params = {key: value for key, value in params.items() if value is not None}
+    result = ENGINES[method](t, v, num_points, **params)
+
+    # Качество аппроксимации (коэффициент детерминации)
+    total = float(np.sum((v - v.mean()) ** 2))
+    residual = float(np.sum((v - result['fitted']) ** 2))
+    result['r_squared'] = 1 - residual / total if total > 0 else 1.0
+    result['method'] = method
+    if characteristics is not None:
+        result['data_characteristics'] = characteristics
+
+    return result
@@ -0,0 +1,230 @@
+# server/services/correlation_service.py
+#
+# Корреляция показаний всех датчиков здания. Показания выгружаются одним
+# запросом (DataService.export_readings), ряды датчиков приводятся к общей
+# сетке (resampling.resample с одними границами), после чего матрица
+# корреляции Пирсона по попарно общим ячейкам считается несколькими
+# матричными произведениями, а взаимная корреляция - теми же произведениями
+# для каждого сдвига. Результат кэшируется по "водяному знаку" данных:
+# времени последнего показания каждого датчика и концу окна, выровненному по шагу.
+
+from datetime import datetime
+from sqlalchemy import text
+from server.config import (
+    CORRELATION_MAX_BINS, CORRELATION_MAX_LAGS, CORRELATION_MIN_OVERLAP, CORRELATION_CACHE_SIZE
+)
+from server.database.db import db
+from server.database.timestamps import from_db
+from server.monitoring import metrics
+from server.services.data_service import DataService
+from server.services.resampling import resample
+from server.utils.cache import VersionedCache, versions, sensor_data_version
+
+# Строк в списке самых связанных пар датчиков
+TOP_PAIRS = 20
+
+_correlation_cache = VersionedCache(versions, max_entries=CORRELATION_CACHE_SIZE)
+
+
+def pairwise_correlation(a, b, min_overlap=CORRELATION_MIN_OVERLAP):
+    """
+    Корреляция Пирсона каждого столбца a с каждым столбцом b по строкам, где есть оба значения
+
+    Args:
+        a, b (ndarray): (ячеек, датчиков) с NaN на месте пропусков, одинаковое число строк
+        min_overlap (int): меньше общих строк - NaN
+
+    Returns:
+        tuple: (корреляции (столбцов a, столбцов b), число общих строк)
+    """
+    import numpy as np
+
+    mask_a, mask_b = ~np.isnan(a), ~np.isnan(b)
+    ones_a, ones_b = mask_a.astype(np.float64), mask_b.astype(np.float64)
+    x, y = np.where(mask_a, a, 0.0), np.where(mask_b, b, 0.0)
+    # Центрирование столбцов: суммы квадратов без потери точности на больших значениях
+    x = np.where(mask_a, x - x.sum(axis=0) / np.maximum(ones_a.sum(axis=0), 1), 0.0)
+    y = np.where(mask_b, y - y.sum(axis=0) / np.maximum(ones_b.sum(axis=0), 1), 0.0)
+
+    overlap = ones_a.T @ ones_b
+    sum_x = x.T @ ones_b
+    sum_y = ones_a.T @ y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = x.T @ y - sum_x * sum_y / overlap
+        variance_x = (x * x).T @ ones_b - sum_x * sum_x / overlap
+        variance_y = ones_a.T @ (y * y) - sum_y * sum_y / overlap
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+
+    correlation[(overlap < min_overlap) | ~np.isfinite(correlation)] = np.nan
+    return np.clip(correlation, -1.0, 1.0), overlap.astype(np.int64)
+
+
+def lagged_correlation(matrix, max_lag, min_overlap=CORRELATION_MIN_OVERLAP):
+    """
+    Взаимная корреляция со сдвигами -max_lag..max_lag ячеек
+
+    Сдвиг k для пары (i, j) - корреляция значения i в момент t со значением j в момент t + k:
+    положительный сдвиг значит, что j повторяет i с запаздыванием.
+
+    Returns:
+        tuple: (корреляция с наибольшим модулем, сдвиг в ячейках) - матрицы (датчиков, датчиков)
+    """
+    import numpy as np
+
+    best, _ = pairwise_correlation(matrix, matrix, min_overlap)
+    best_lag = np.zeros(best.shape, dtype=np.int64)
+
+    for lag in range(1, min(max_lag, len(matrix) - 1) + 1):
+        shifted, _ = pairwise_correlation(matrix[:-lag], matrix[lag:], min_overlap)
+        # Сдвиг -lag для (i, j) - это сдвиг +lag для (j, i)
+        for candidate, signed in ((shifted, lag), (shifted.T, -lag)):
+            better = np.abs(candidate) > np.nan_to_num(np.abs(best), nan=-1.0)
+            best = np.where(better, candidate, best)
+            best_lag = np.where(better, signed, best_lag)
+
+    return best, best_lag
+
+
+def _matrix_rows(matrix):
+    """Матрица в списки строк, NaN - None"""
+    import numpy as np
+
+    rows = matrix.tolist()
+    if np.isnan(matrix).any():
+        rows = [[None if value != value else value for value in row] for row in rows]
+    return rows
+
+
+class CorrelationService:
+    """Матрицы корреляции показаний датчиков здания"""
+
+    @staticmethod
+    def _sensors(building_id, sensor_types=None):
+        """Датчики здания и время их последнего показания (водяной знак, поиск по индексу на датчик)"""
+        rows = db.session.execute(text("""
+            SELECT s.id, s.name, s.sensor_type,
+                   (SELECT MAX(timestamp) FROM sensor_reading WHERE sensor_id = s.id)
+            FROM sensor s
+            WHERE s.building_id = :building_id
+            ORDER BY s.id
+        """), {'building_id': building_id}).fetchall()
+        if sensor_types:
+            rows = [row for row in rows if row[2] in sensor_types]
+        return rows
+
+    @staticmethod
+    def _compute(sensors, start, end, step, fill, max_lag):
+        import numpy as np
+
+        sensor_ids = [row[0] for row in sensors]
+        array, units = DataService.export_readings(sensor_ids, start.item(), end.item())
+
+        # Ряды датчиков - срезы выгрузки, отсортированной по датчику и времени
+        lows = np.searchsorted(array['sensor_id'], sensor_ids, side='left')
+        highs = np.searchsorted(array['sensor_id'], sensor_ids, side='right')
+        times = array['t'].view('datetime64[us]')
+
+        columns, points = [], []
+        for lo, hi in zip(lows.tolist(), highs.tolist()):
+            series = resample(times[lo:hi], array['v'][lo:hi], step, fill, start=start, end=end,
+                              max_points=CORRELATION_MAX_BINS)
+            columns.append(series['v'])
+            points.append(hi - lo)
+        matrix = np.column_stack(columns)
+
+        correlation, overlap = pairwise_correlation(matrix, matrix)
+        result = {
+            'bins': len(matrix),
+            'sensors': [
+                {'id': sensor_id, 'name': name, 'type': sensor_type, 'unit': units.get(sensor_id), 'points': count}
+                for (sensor_id, name, sensor_type, _), count in zip(sensors, points)
+            ],
+            'matrix': _matrix_rows(correlation),
+            'overlap': overlap.tolist()
+        }
+
+        if max_lag:
+            best, best_lag = lagged_correlation(matrix, max_lag)
+            result['lagged'] = {
+                'max_correlation': _matrix_rows(best),
+                'lag_seconds': (best_lag * step).tolist()
+            }
+
+        # Самые связанные пары (верхний треугольник, по модулю корреляции)
+        source = best if max_lag else correlation
+        upper_i, upper_j = np.triu_indices(len(sensors), k=1)
+        values = source[upper_i, upper_j]
+        order = [index for index in np.argsort(-np.abs(np.nan_to_num(values, nan=0.0)), kind='stable')
+                 if not np.isnan(values[index])][:TOP_PAIRS]
+        result['top_pairs'] = [
+            {
+                'sensor_a': sensor_ids[upper_i[index]], 'sensor_b': sensor_ids[upper_j[index]],
+                'correlation': float(values[index]),
+                'lag_seconds': int(best_lag[upper_i[index], upper_j[index]] * step) if max_lag else 0
+            }
+            for index in order
+        ]
+        return result
+
+    @staticmethod
+    def get_correlation(building_id, hours_back=24, step=300.0, fill='linear', max_lag=0, sensor_types=None):
+        """
+        Корреляция показаний датчиков здания на общей сетке
+
+        Args:
+            building_id (int): здание
+            hours_back (int): период, часы (конец окна выровнен по шагу сетки)
+            step (float): шаг сетки, секунды
+            fill (str): заполнение пустых ячеек (resampling.FILL_METHODS)
+            max_lag (int): наибольший сдвиг взаимной корреляции в ячейках (0 - без сдвигов)
+            sensor_types (list): типы датчиков (None - все)
+
+        Returns:
+            dict: матрица корреляции (null - мало общих ячеек), число общих ячеек, при max_lag -
+                  наибольшая по модулю взаимная корреляция и ее сдвиг; None - нет датчиков.
+                  ValueError, если сетка длиннее CORRELATION_MAX_BINS или сдвигов больше CORRELATION_MAX_LAGS
+        """
+        import numpy as np
+
+        if max_lag > CORRELATION_MAX_LAGS:
+            raise ValueError(f'Сдвиг больше {CORRELATION_MAX_LAGS} шагов сетки: увеличьте шаг или уменьшите max_lag')
+        bins = int(hours_back * 3600 // step) + 1
+        if bins > CORRELATION_MAX_BINS:
+            raise ValueError(f'Сетка из {bins} точек длиннее предела {CORRELATION_MAX_BINS}: увеличьте шаг или сократите период')
+
+        sensors = CorrelationService._sensors(building_id, sensor_types)
+        if not sensors:
+            return None
+
+        # Окно заканчивается на границе ячейки, следующей за текущим моментом
+        step_us = int(round(step * 1e6))
+        now_us = int(np.datetime64(datetime.utcnow(), 'us').view(np.int64))
+        end = np.datetime64((now_us // step_us + 1) * step_us - 1, 'us')
+        start = end - np.timedelta64(int(hours_back * 3600 * 1e6), 'us')
+
+        watermark = tuple((row[0], row[3]) for row in sensors)
+        key = (building_id, hours_back, step, fill, max_lag, int(end.view(np.int64)), watermark)
+        depends_on = tuple(sensor_data_version(row[0]) for row in sensors)
+
+        result = _correlation_cache.get(key, depends_on)
+        cached = result is not None
+        metrics.correlation_requests_total.inc(result='hit' if cached else 'miss')
+        if not cached:
+            snapshot = versions.snapshot(depends_on)
+            result = CorrelationService._compute(sensors, start, end, step, fill, max_lag)
+            result['generated_at'] = datetime.utcnow().isoformat() + 'Z'
+            _correlation_cache.set(key, result, depends_on, snapshot)
+
+        latest = [from_db(row[3]) for row in sensors if row[3] is not None]
+        return dict(
+            result,
+            building_id=building_id,
+            hours=hours_back,
+            step=step,
+            fill=fill,
+            max_lag_seconds=max_lag * step,
+            start=str(start) + 'Z',
+            end=str(end) + 'Z',
+            watermark=max(latest).isoformat() + 'Z' if latest else None,
+            cached=cached
+        )
@@ -1,8 +1,16 @@
 # server/services/data_service.py (УПРОЩЕННАЯ ВЕРСИЯ)
 
 from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from server.database.db import db
 from server.models.sensor_data import Sensor, SensorReading, Building, AlertConfig
+from server.database.timestamps import to_db, to_datetime64, epoch_us_sql, datetime_to_us
+from server.services.ingest_service import IngestService
+from server.services.alert_events import AlertEventService, breach_direction
+from server.services.rollups import RollupService
+from server.services.reading_buffer import reading_buffer
+from server.monitoring import metrics
 
 class DataService:
     """Упрощенный сервис данных"""
@@ -52,6 +60,58 @@ class DataService:
         
         return readings
     
+    @staticmethod
+    def get_readings_columns(sensor_id, hours_back=24):
+        """
+        Те же показания, что get_readings_simple, столбцами numpy без объектов ORM
+        
+        Последние часы (READING_BUFFER_HOURS) отдаются из буфера в памяти, если он
+        включен и покрывает период; иначе - SQL, результат которого попадает в буфер.
+
+        Returns:
+            dict: id (int64), t (datetime64[us]), v (float64), unit (список), is_alert (bool)
+        """
+        import numpy as np
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours_back)
+        
+        columns = reading_buffer.get_window(sensor_id, start_time, end_time)
+        if columns is not None and len(columns['v']) >= 5:
+            return columns
+        
+        write_counter = reading_buffer.write_counter(sensor_id)
+        rows = db.session.execute(text("""
+            SELECT id, timestamp, value, unit, is_alert FROM sensor_reading
+            WHERE sensor_id = :sensor_id AND timestamp >= :start_time AND timestamp <= :end_time
+            ORDER BY timestamp
+        """), {
+            'sensor_id': sensor_id,
+            'start_time': to_db(start_time),
+            'end_time': to_db(end_time)
+        }).fetchall()
+        
+        # Если мало данных, берем последние 100 записей (как get_readings_simple)
+        windowed = len(rows) >= 5
+        if not windowed:
+            rows = db.session.execute(text("""
+                SELECT id, timestamp, value, unit, is_alert FROM sensor_reading
+                WHERE sensor_id = :sensor_id
+                ORDER BY timestamp DESC LIMIT 100
+            """), {'sensor_id': sensor_id}).fetchall()
+            rows.reverse()
+        
+        ids, timestamps, values, units, alerts = zip(*rows) if rows else ((), (), (), (), ())
+        columns = {
+            'id': np.array(ids, dtype=np.int64),
+            't': to_datetime64(timestamps),
+            'v': np.array(values, dtype=float),
+            'unit': list(units),
+            'is_alert': np.array(alerts, dtype=bool)
+        }
+        if windowed:
+            reading_buffer.offer(sensor_id, start_time, columns, write_counter)
+        return columns
+    
     @staticmethod
     def add_sensor_reading(sensor_id, value, unit, timestamp=None):
         """Добавить показание датчика"""
@@ -63,13 +123,12 @@ class DataService:
             raise ValueError(f"Датчик {sensor_id} не найден")
         
         # Проверяем тревогу
-        is_alert = False
+        direction = None
         alert_config = AlertConfig.query.filter_by(sensor_type=sensor.sensor_type).first()
         if alert_config:
-            if alert_config.min_threshold and value < alert_config.min_threshold:
-                is_alert = True
-            if alert_config.max_threshold and value > alert_config.max_threshold:
-                is_alert = True
+            # Как при приеме через IngestService: нулевой порог тоже порог
+            direction = breach_direction(value, alert_config.min_threshold, alert_config.max_threshold)
+        is_alert = direction is not None
         
         reading = SensorReading(
             sensor_id=sensor_id,
@@ -80,7 +139,27 @@ class DataService:
         )
         
         db.session.add(reading)
-        db.session.commit()
+        try:
+            db.session.flush()
+            # Инцидент тревоги и часовой агрегат - в той же транзакции, через соединение сессии
+            cursor = db.session.connection().connection.cursor()
+            AlertEventService.apply(cursor, [
+                (sensor_id, datetime_to_us(timestamp), value, unit, direction)
+            ])
+            RollupService.apply(cursor, [(sensor_id, datetime_to_us(timestamp), value)])
+            db.session.commit()
+        except IntegrityError:
+            # Показание датчика с тем же временем уже записано - возвращаем его
+            db.session.rollback()
+            existing = SensorReading.query.filter_by(sensor_id=sensor_id, timestamp=timestamp).first()
+            if existing is None:
+                raise
+            metrics.ingest_duplicates_total.inc(source='api', stage='db')
+            return existing
+        
+        IngestService.notify_listeners([
+            (sensor_id, reading.timestamp, reading.value, reading.is_alert, reading.id, reading.unit)
+        ])
         return reading
     
     @staticmethod
@@ -89,4 +168,88 @@ class DataService:
         start_time = datetime.utcnow() - timedelta(hours=hours_back)
         return SensorReading.query.filter_by(is_alert=True)\
             .filter(SensorReading.timestamp >= start_time)\
-            .order_by(SensorReading.timestamp.desc()).all()
\ No newline at end of file
+            .order_by(SensorReading.timestamp.desc()).all()
+    
+    @staticmethod
+    def get_alerts_columns(hours_back=24):
+        """
+        Инциденты тревог (alert_event), продолжавшиеся в течение периода, и все
+        открытые - вместе с датчиком одним запросом, столбцами
+        
+        Returns:
+            dict: id, sensor_id, sensor_name, building_id, direction, count, first_value, last_value,
+                  peak_value, unit, active (списки), started_at, last_at, ended_at, peak_at
+                  (datetime64[us], ended_at открытых - NaT)
+        """
+        import numpy as np
+        start_time = datetime.utcnow() - timedelta(hours=hours_back)
+        nat = np.iinfo(np.int64).min
+        rows = db.session.execute(text(f"""
+            SELECT e.id, e.sensor_id, s.name, s.building_id, e.direction, e.count, e.first_value,
+                   e.last_value, e.peak_value, e.unit, {epoch_us_sql('e.started_at')}, {epoch_us_sql('e.last_at')},
+                   COALESCE({epoch_us_sql('e.ended_at')}, {nat}), {epoch_us_sql('e.peak_at')}
+            FROM alert_event e
+            LEFT JOIN sensor s ON s.id = e.sensor_id
+            WHERE e.last_at >= :start_time OR e.ended_at IS NULL
+            ORDER BY e.last_at DESC
+        """), {'start_time': to_db(start_time)}).fetchall()
+        
+        columns = list(zip(*rows)) if rows else [()] * 14
+        names = ('id', 'sensor_id', 'sensor_name', 'building_id', 'direction', 'count',
+                 'first_value', 'last_value', 'peak_value', 'unit')
+        alerts = {name: list(column) for name, column in zip(names, columns)}
+        for name, column in zip(('started_at', 'last_at', 'ended_at', 'peak_at'), columns[10:]):
+            alerts[name] = np.array(column, dtype=np.int64).view('datetime64[us]')
+        alerts['active'] = np.isnat(alerts['ended_at']).tolist()
+        return alerts
+    
+    @staticmethod
+    def export_readings(sensor_ids=None, start_time=None, end_time=None):
+        """
+        Выгрузка показаний за период в структурный массив numpy
+        
+        Строки курсора SQLite записываются сразу в массив (np.fromiter), время
+        переводится в микросекунды Unix в самом запросе - без объектов ORM,
+        datetime и промежуточных списков.
+        
+        Args:
+            sensor_ids (list): датчики (None - все)
+            start_time, end_time (datetime): границы периода (None - без ограничения)
+        
+        Returns:
+            tuple: (ndarray с полями readings_dtype, отсортирован по датчику и времени,
+                    dict единиц измерения по датчикам)
+        """
+        import numpy as np
+        from server.utils.serialization import readings_dtype
+        
+        conditions, params = [], []
+        if sensor_ids is not None:
+            if not sensor_ids:
+                return np.empty(0, dtype=readings_dtype()), {}
+            conditions.append(f"sensor_id IN ({', '.join('?' * len(sensor_ids))})")
+            params.extend(int(sensor_id) for sensor_id in sensor_ids)
+        if start_time is not None:
+            conditions.append('timestamp >= ?')
+            params.append(to_db(start_time))
+        if end_time is not None:
+            conditions.append('timestamp <= ?')
+            params.append(to_db(end_time))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        # Курсор DBAPI соединения текущей сессии
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT sensor_id, id, {epoch_us_sql()}, value, COALESCE(is_alert, 0) FROM sensor_reading
+                {where}
+                ORDER BY sensor_id, timestamp
+            """, params)
+            array = np.fromiter(cursor, dtype=readings_dtype())
+            
+            cursor.execute(f"SELECT sensor_id, MIN(unit) FROM sensor_reading {where} GROUP BY sensor_id", params)
+            units = dict(cursor.fetchall())
+        finally:
+            cursor.close()
+        
+        return array, units
@@ -0,0 +1,272 @@
+# server/services/forecast_service.py
+
+import math
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from server.config import FORECAST_WINDOW_HOURS, FORECAST_SHIFT_SIGMA, FORECAST_MAX_AGE_FRACTION
+from server.database.db import db
+from server.models.sensor_data import Sensor, SensorReading, AlertConfig, ForecastModel
+from server.monitoring import metrics
+
+# Минимум показаний для подгонки прогнозной модели
+MIN_FORECAST_POINTS = 5
+
+
+def _hours(timestamp, base_time):
+    return (timestamp - base_time).total_seconds() / 3600
+
+
+def _evaluate(coefficients, t):
+    """Значение полинома (младшие степени первыми) по схеме Горнера"""
+    result = 0.0
+    for coefficient in reversed(coefficients):
+        result = result * t + coefficient
+    return result
+
+
+class ForecastService:
+    """Прогноз показаний и времени достижения порога тревоги"""
+
+    @staticmethod
+    def _latest_timestamps(sensor_ids):
+        """Время последнего показания каждого датчика одним запросом"""
+        rows = db.session.query(SensorReading.sensor_id, func.max(SensorReading.timestamp))\
+            .filter(SensorReading.sensor_id.in_(sensor_ids))\
+            .group_by(SensorReading.sensor_id).all()
+        return dict(rows)
+
+    @staticmethod
+    def _thresholds(sensor_types):
+        """Пороги тревоги по типам датчиков (при нескольких настройках - первая, как при записи)"""
+        thresholds = {}
+        configs = AlertConfig.query.filter(AlertConfig.sensor_type.in_(sensor_types))\
+            .order_by(AlertConfig.id).all()
+        for config in configs:
+            thresholds.setdefault(config.sensor_type, (config.min_threshold, config.max_threshold, config.unit))
+        return thresholds
+
+    @staticmethod
+    def _load(sensor_id, start_time, inclusive=True):
+        query = db.session.query(SensorReading.timestamp, SensorReading.value)\
+            .filter(SensorReading.sensor_id == sensor_id)
+        if inclusive:
+            query = query.filter(SensorReading.timestamp >= start_time)
+        else:
+            query = query.filter(SensorReading.timestamp > start_time)
+        return query.order_by(SensorReading.timestamp).all()
+
+    @staticmethod
+    def _fit(sensor_id, window_hours, degree, latest, model=None):
+        """
+        Подгонка полинома по окну window_hours до последнего показания
+
+        Returns:
+            ForecastModel: новая или обновленная модель (None, если данных мало)
+        """
+        import numpy as np
+
+        rows = ForecastService._load(sensor_id, latest - timedelta(hours=window_hours))
+        if len(rows) < MIN_FORECAST_POINTS:
+            return None
+
+        t = np.array([_hours(timestamp, latest) for timestamp, _ in rows])
+        v = np.array([value for _, value in rows], dtype=float)
+        fit_degree = min(degree, len(t) - 1)
+
+        with metrics.approximation_fit_duration.time(method='forecast'):
+            poly = np.polynomial.Polynomial.fit(t, v, fit_degree).convert()
+
+        residuals = v - poly(t)
+        ss_res = float(np.sum(residuals ** 2))
+        ss_tot = float(np.sum((v - v.mean()) ** 2))
+
+        if model is None:
+            model = ForecastModel(sensor_id=sensor_id, window_hours=window_hours, degree=degree)
+            db.session.add(model)
+
+        coefficients = poly.coef.tolist()
+        model.coefficients = coefficients + [0.0] * (fit_degree + 1 - len(coefficients))
+        model.base_time = latest
+        model.data_start = rows[0][0]
+        model.data_end = latest
+        model.num_points = len(rows)
+        model.r_squared = 1 - ss_res / ss_tot if ss_tot > 0 else 1.0
+        model.residual_std = math.sqrt(ss_res / max(1, len(rows) - fit_degree - 1))
+        model.fitted_at = datetime.utcnow()
+        return model
+
+    @staticmethod
+    def _refit_reason(model, latest):
+        """
+        Нужно ли пересчитывать модель после появления новых показаний
+
+        Модель сохраняется, пока средний остаток новых показаний в пределах
+        FORECAST_SHIFT_SIGMA стандартных ошибок и модель не старше
+        FORECAST_MAX_AGE_FRACTION окна.
+
+        Returns:
+            str: причина пересчета (stale, shifted) или None
+        """
+        if _hours(latest, model.data_end) > model.window_hours * FORECAST_MAX_AGE_FRACTION:
+            return 'stale'
+
+        rows = ForecastService._load(model.sensor_id, model.data_end, inclusive=False)
+        if not rows:
+            return None
+
+        residuals = [value - _evaluate(model.coefficients, _hours(timestamp, model.base_time))
+                     for timestamp, value in rows]
+        mean_residual = sum(residuals) / len(residuals)
+        # Нижняя граница СКО - на случай модели без шума (точная подгонка)
+        residual_std = max(model.residual_std, 1e-6 * abs(model.coefficients[0]), 1e-9)
+        tolerance = FORECAST_SHIFT_SIGMA * residual_std / math.sqrt(len(residuals))
+        return 'shifted' if abs(mean_residual) > tolerance else None
+
+    @staticmethod
+    def _threshold_crossing(coefficients, t_from, t_to, min_threshold, max_threshold):
+        """
+        Первое пересечение порога моделью на интервале (t_from, t_to], часы от base_time
+
+        Returns:
+            tuple: (тип порога, значение порога, t, уже превышен) или None
+        """
+        import numpy as np
+
+        current = _evaluate(coefficients, t_from)
+        crossings = []
+        for kind, threshold in (('max', max_threshold), ('min', min_threshold)):
+            if threshold is None:
+                continue
+            if (kind == 'max' and current >= threshold) or (kind == 'min' and current <= threshold):
+                crossings.append((t_from, kind, threshold, True))
+                continue
+
+            shifted = list(coefficients)
+            shifted[0] -= threshold
+            for root in np.polynomial.polynomial.polyroots(shifted):
+                if abs(root.imag) < 1e-9 and t_from < root.real <= t_to:
+                    crossings.append((float(root.real), kind, threshold, False))
+
+        if not crossings:
+            return None
+        t, kind, threshold, exceeded = min(crossings)
+        return kind, threshold, t, exceeded
+
+    @staticmethod
+    def _forecast_sensor(sensor, latest, model, thresholds, horizon_hours, window_hours, degree, num_points):
+        """Прогноз одного датчика (данные для пакетного режима загружены заранее)"""
+        result = {
+            'sensor_id': sensor.id,
+            'sensor_name': sensor.name,
+            'horizon_hours': horizon_hours,
+            'window_hours': window_hours,
+            'degree': degree,
+            'error': None
+        }
+
+        if latest is None:
+            result['error'] = 'Нет показаний'
+            return result
+
+        # Пересчет только при смещении модели новыми данными
+        if model is None:
+            reason = 'new'
+        elif latest <= model.data_end:
+            reason = None
+            status = 'cached'
+        else:
+            reason = ForecastService._refit_reason(model, latest)
+            status = 'validated'
+
+        if reason is not None:
+            model = ForecastService._fit(sensor.id, window_hours, degree, latest, model)
+            if model is None:
+                result['error'] = f'Нужно минимум {MIN_FORECAST_POINTS} показаний за {window_hours} ч'
+                return result
+            metrics.forecast_fits_total.inc(reason=reason)
+            status = 'refit'
+        metrics.forecast_requests_total.inc(result=status)
+
+        coefficients = model.coefficients
+        t_from = _hours(latest, model.base_time)
+        t_to = t_from + horizon_hours
+
+        forecast = []
+        for i in range(num_points):
+            t = t_from + horizon_hours * i / (num_points - 1)
+            forecast.append({
+                'timestamp': (model.base_time + timedelta(hours=t)).isoformat() + 'Z',
+                'value': _evaluate(coefficients, t)
+            })
+
+        min_threshold, max_threshold, unit = thresholds.get(sensor.sensor_type, (None, None, None))
+        crossing = None
+        found = ForecastService._threshold_crossing(coefficients, t_from, t_to, min_threshold, max_threshold)
+        if found is not None:
+            kind, threshold, t, exceeded = found
+            crossing = {
+                'threshold': kind,
+                'threshold_value': threshold,
+                'eta': (model.base_time + timedelta(hours=t)).isoformat() + 'Z',
+                'hours_from_last_reading': t - t_from,
+                'already_exceeded': exceeded
+            }
+
+        result.update({
+            'model': {
+                'status': status,
+                'coefficients': coefficients,
+                'base_time': model.base_time.isoformat() + 'Z',
+                'fitted_at': model.fitted_at.isoformat() + 'Z' if model.fitted_at else None,
+                'num_points': model.num_points,
+                'r_squared': model.r_squared,
+                'residual_std': model.residual_std
+            },
+            'last_timestamp': latest.isoformat() + 'Z',
+            'forecast': forecast,
+            'thresholds': {'min': min_threshold, 'max': max_threshold, 'unit': unit},
+            'threshold_crossing': crossing
+        })
+        return result
+
+    @staticmethod
+    def get_forecasts(sensors, horizon_hours=24, window_hours=FORECAST_WINDOW_HOURS, degree=1, num_points=25):
+        """
+        Прогноз для набора датчиков: последние показания, модели и пороги
+        загружаются одним запросом каждый, измененные модели сохраняются одной транзакцией
+        """
+        if not sensors:
+            return []
+
+        sensor_ids = [sensor.id for sensor in sensors]
+        latest = ForecastService._latest_timestamps(sensor_ids)
+        models = {
+            model.sensor_id: model
+            for model in ForecastModel.query.filter(
+                ForecastModel.sensor_id.in_(sensor_ids),
+                ForecastModel.window_hours == window_hours,
+                ForecastModel.degree == degree
+            )
+        }
+        thresholds = ForecastService._thresholds({sensor.sensor_type for sensor in sensors})
+
+        results = [
+            ForecastService._forecast_sensor(
+                sensor, latest.get(sensor.id), models.get(sensor.id), thresholds,
+                horizon_hours, window_hours, degree, num_points
+            )
+            for sensor in sensors
+        ]
+        db.session.commit()
+        return results
+
+    @staticmethod
+    def get_forecast(sensor, horizon_hours=24, window_hours=FORECAST_WINDOW_HOURS, degree=1, num_points=25):
+        """Прогноз одного датчика"""
+        return ForecastService.get_forecasts([sensor], horizon_hours, window_hours, degree, num_points)[0]
+
+    @staticmethod
+    def get_building_forecast(building_id, horizon_hours=24, window_hours=FORECAST_WINDOW_HOURS, degree=1, num_points=25):
+        """Прогноз для всех датчиков здания"""
+        sensors = Sensor.query.filter_by(building_id=building_id).all()
+        return ForecastService.get_forecasts(sensors, horizon_hours, window_hours, degree, num_points)
@@ -0,0 +1,203 @@
+# server/services/heatmap_service.py
+#
+# Тепловая карта этажа: последние показания датчиков одного типа, интерполированные
+# на сетку по координатам position_x/position_y методом обратно взвешенных
+# расстояний (IDW). Веса зависят только от координат датчиков и сетки, поэтому
+# матрица весов (ячейки × датчики) считается один раз и хранится в кэше с
+# координатами в ключе: новая карта - два умножения матрицы на вектор
+# последних значений, а перемещение датчика дает новый ключ.
+
+import re
+from sqlalchemy import text
+from server.config import HEATMAP_POWER, HEATMAP_MAX_GRID, HEATMAP_CACHE_SIZE
+from server.database.db import db
+from server.database.timestamps import from_db
+from server.monitoring import metrics
+from server.utils.cache import VersionedCache, versions
+
+_GRID_PATTERN = re.compile(r'^(\d+)(?:x(\d+))?$')
+
+# Матрицы весов по (здание, этаж, тип, сетка, степень, границы, координаты датчиков)
+_weights_cache = VersionedCache(versions, max_entries=HEATMAP_CACHE_SIZE)
+
+
+def parse_grid(value):
+    """
+    Размер сетки из параметра запроса: '40' (40×40) или '60x30' (по X и по Y)
+
+    Returns:
+        tuple: (nx, ny), ValueError вне пределов 2..HEATMAP_MAX_GRID
+    """
+    match = _GRID_PATTERN.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Неверная сетка: {value}. Примеры: 40, 60x30")
+    nx = int(match.group(1))
+    ny = int(match.group(2) or nx)
+    if not (2 <= nx <= HEATMAP_MAX_GRID and 2 <= ny <= HEATMAP_MAX_GRID):
+        raise ValueError(f'Размер сетки - от 2 до {HEATMAP_MAX_GRID} ячеек по стороне')
+    return nx, ny
+
+
+def _isoformat(value):
+    """Время из БД (строка SQLite или микросекунды) в ISO с 'Z'"""
+    value = from_db(value)
+    return value.isoformat() + 'Z' if value is not None else None
+
+
+def _bounds(xs, ys):
+    """Прямоугольник по координатам датчиков здания с полями 5% (или 1 при совпадающих координатах)"""
+    bounds = []
+    for low, high in ((min(xs), max(xs)), (min(ys), max(ys))):
+        margin = (high - low) * 0.05 or 1.0
+        bounds.extend((low - margin, high + margin))
+    return tuple(bounds)
+
+
+def idw_weights(grid_x, grid_y, sensor_x, sensor_y, power=HEATMAP_POWER):
+    """
+    Матрица весов обратно взвешенных расстояний
+
+    Args:
+        grid_x, grid_y (ndarray): координаты узлов сетки по осям (nx и ny)
+        sensor_x, sensor_y (ndarray): координаты датчиков
+        power (float): степень расстояния
+
+    Returns:
+        ndarray: (ny * nx, датчиков), строки - узлы сетки построчно по Y; веса не нормированы,
+                 узел в точке датчика получает от него подавляющий вес
+    """
+    import numpy as np
+
+    node_x, node_y = np.meshgrid(grid_x, grid_y)
+    dx = node_x.reshape(-1, 1) - sensor_x
+    dy = node_y.reshape(-1, 1) - sensor_y
+    squared = dx * dx + dy * dy
+
+    span = max(grid_x[-1] - grid_x[0], grid_y[-1] - grid_y[0])
+    np.maximum(squared, (span * 1e-6) ** 2, out=squared)
+    if power == 2:
+        return np.reciprocal(squared, out=squared)
+    return squared ** (-power / 2)
+
+
+def interpolate(weights, values):
+    """
+    Значения в узлах сетки: среднее значений датчиков с весами
+
+    Датчики без значения (NaN) не участвуют; узлы без единого значения - NaN.
+    """
+    import numpy as np
+
+    known = ~np.isnan(values)
+    numerator = weights @ np.where(known, values, 0.0)
+    denominator = weights @ known.astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return numerator / denominator
+
+
+class HeatmapService:
+    """Тепловые карты по последним показаниям датчиков"""
+
+    @staticmethod
+    def _sensors(building_id):
+        """Датчики здания с последним показанием (поиск по индексу (sensor_id, timestamp) на датчик)"""
+        return db.session.execute(text("""
+            SELECT s.id, s.name, s.sensor_type, s.floor, s.position_x, s.position_y,
+                   r.value, r.unit, r.timestamp, r.is_alert
+            FROM sensor s
+            LEFT JOIN sensor_reading r ON r.id = (
+                SELECT id FROM sensor_reading WHERE sensor_id = s.id ORDER BY timestamp DESC LIMIT 1
+            )
+            WHERE s.building_id = :building_id
+            ORDER BY s.id
+        """), {'building_id': building_id}).fetchall()
+
+    @staticmethod
+    def _weights(key, grid_x, grid_y, sensor_x, sensor_y, power):
+        weights = _weights_cache.get(key)
+        if weights is not None:
+            metrics.heatmap_weights_total.inc(result='hit')
+            return weights, True
+        metrics.heatmap_weights_total.inc(result='miss')
+        weights = idw_weights(grid_x, grid_y, sensor_x, sensor_y, power)
+        _weights_cache.set(key, weights)
+        return weights, False
+
+    @staticmethod
+    def get_heatmap(building_id, sensor_type=None, floor=None, grid=(40, 40), power=HEATMAP_POWER):
+        """
+        Тепловая карта здания по последним показаниям
+
+        Args:
+            building_id (int): здание
+            sensor_type (str): тип датчиков (None - самый частый среди датчиков с координатами)
+            floor (int): этаж (None - все этажи в проекции на план)
+            grid (tuple): (nx, ny), см. parse_grid
+            power (float): степень расстояния в весах IDW
+
+        Returns:
+            dict: сетка, значения по строкам Y (null - нет данных), датчики; None - нет датчиков
+                  с координатами для карты
+        """
+        import numpy as np
+
+        sensors = HeatmapService._sensors(building_id)
+        placed = [row for row in sensors if row.position_x is not None and row.position_y is not None]
+        if not placed:
+            return None
+
+        # Границы - по всем датчикам здания, чтобы карты разных типов и этажей совпадали
+        bounds = _bounds([row.position_x for row in placed], [row.position_y for row in placed])
+
+        if floor is not None:
+            placed = [row for row in placed if row.floor == floor]
+        types = {}
+        for row in placed:
+            types[row.sensor_type] = types.get(row.sensor_type, 0) + 1
+        if sensor_type is None and types:
+            sensor_type = max(sorted(types), key=types.get)
+        placed = [row for row in placed if row.sensor_type == sensor_type]
+        if not placed:
+            return None
+
+        nx, ny = grid
+        grid_x = np.linspace(bounds[0], bounds[1], nx)
+        grid_y = np.linspace(bounds[2], bounds[3], ny)
+        sensor_x = np.array([row.position_x for row in placed])
+        sensor_y = np.array([row.position_y for row in placed])
+        values = np.array([np.nan if row.value is None else row.value for row in placed])
+
+        key = (building_id, floor, sensor_type, nx, ny, power, bounds,
+               tuple((row.id, row.position_x, row.position_y) for row in placed))
+        weights, cached = HeatmapService._weights(key, grid_x, grid_y, sensor_x, sensor_y, power)
+
+        surface = interpolate(weights, values).reshape(ny, nx)
+        known = ~np.isnan(surface)
+        rows = surface.tolist()
+        if not known.all():
+            rows = [[None if value != value else value for value in row] for row in rows]
+
+        units = [row.unit for row in placed if row.unit is not None]
+        return {
+            'building_id': building_id,
+            'floor': floor,
+            'sensor_type': sensor_type,
+            'available_types': sorted(types),
+            'unit': units[0] if units else None,
+            'grid': {
+                'nx': nx, 'ny': ny, 'x': grid_x.tolist(), 'y': grid_y.tolist(),
+                'bounds': {'x_min': bounds[0], 'x_max': bounds[1], 'y_min': bounds[2], 'y_max': bounds[3]}
+            },
+            'values': rows,
+            'min': float(surface[known].min()) if known.any() else None,
+            'max': float(surface[known].max()) if known.any() else None,
+            'power': power,
+            'weights_cached': cached,
+            'sensors': [
+                {
+                    'id': row.id, 'name': row.name, 'floor': row.floor, 'x': row.position_x, 'y': row.position_y,
+                    'value': row.value, 'timestamp': _isoformat(row.timestamp), 'is_alert': bool(row.is_alert)
+                }
+                for row in placed
+            ]
+        }
@@ -0,0 +1,348 @@
+# server/services/ingest_service.py
+
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from server.config import SQLITE_DB_PATH, INGEST_MAX_BATCH_SIZE, INGEST_DEDUP_CACHE_SIZE
+from server.database.timestamps import SQLITE_TIMESTAMP_FORMAT, to_db, datetime_to_us  # noqa: F401 - SQLITE_TIMESTAMP_FORMAT для совместимости
+from server.monitoring import metrics
+from server.services.alert_events import AlertEventService, breach_direction
+from server.services.rollups import RollupService
+from server.utils.cache import RecentKeys
+
+logger = logging.getLogger(__name__)
+
+# Ограничение SQLite на количество параметров в одном запросе
+SQLITE_MAX_VARIABLES = 500
+
+DEFAULT_UNIT = 'единицы'
+
+# Обработчики, вызываемые после успешной записи показаний
+_listeners = []
+
+# Недавно записанные ключи (sensor_id, timestamp): повторы отбрасываются без обращения к БД
+_recent_keys = RecentKeys(INGEST_DEDUP_CACHE_SIZE)
+
+
+class IngestService:
+    """Общий пакетный писатель показаний (MQTT и REST API)"""
+
+    @staticmethod
+    def add_listener(listener):
+        """
+        Регистрирует обработчик записанных показаний
+
+        Обработчик получает список кортежей (sensor_id, timestamp, value, is_alert, reading_id, unit)
+        в порядке записи и вызывается после фиксации транзакции.
+        """
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+    @staticmethod
+    def notify_listeners(written):
+        """Передает записанные показания обработчикам (ошибки обработчиков не прерывают запись)"""
+        if not written:
+            return
+        for listener in list(_listeners):
+            try:
+                listener(written)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика показаний {getattr(listener, '__name__', listener)}: {e}")
+
+    @staticmethod
+    def parse_timestamp(value):
+        """
+        Приводит метку времени к naive datetime в UTC
+
+        Принимает ISO-строку (с 'Z' или смещением), число секунд Unix
+        или datetime. Если значение не задано - текущее время.
+        """
+        if value is None:
+            return datetime.utcnow()
+
+        if isinstance(value, datetime):
+            dt = value
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+        elif isinstance(value, str):
+            clean_time = value.strip()
+            if clean_time.endswith('Z'):
+                clean_time = clean_time[:-1] + '+00:00'
+            dt = datetime.fromisoformat(clean_time)
+        else:
+            raise ValueError(f'Неверный формат времени: {value!r}')
+
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt
+
+    @staticmethod
+    def _normalize_item(item, sensor_id=None, unit=None):
+        """Проверяет одно показание и возвращает нормализованный словарь"""
+        if isinstance(item, (list, tuple)):
+            # Компактная форма: [timestamp, value]
+            if len(item) != 2:
+                raise ValueError('Ожидается пара [timestamp, value]')
+            item = {'timestamp': item[0], 'value': item[1]}
+
+        if not isinstance(item, dict):
+            raise ValueError('Показание должно быть объектом')
+
+        if sensor_id is None:
+            sensor_id = item.get('sensor_id')
+        if sensor_id is None or isinstance(sensor_id, bool):
+            raise ValueError('Нужно указать sensor_id')
+        sensor_id = int(sensor_id)
+
+        if 'value' not in item or item['value'] is None or isinstance(item['value'], bool):
+            raise ValueError('Нужно указать value')
+        value = float(item['value'])
+        if value != value or value in (float('inf'), float('-inf')):
+            raise ValueError('value должно быть конечным числом')
+
+        item_unit = item.get('unit', unit)
+
+        return {
+            'sensor_id': sensor_id,
+            'timestamp': IngestService.parse_timestamp(item.get('timestamp')),
+            'value': value,
+            'unit': str(item_unit) if item_unit is not None else None
+        }
+
+    @staticmethod
+    def validate_batch(payload):
+        """
+        Проверяет пакет показаний
+
+        Поддерживаются две формы (можно вместе):
+            {"readings": [{"sensor_id": 1, "value": 1.2, "unit": "мм", "timestamp": "..."}]}
+            {"sensors": [{"sensor_id": 1, "unit": "мм", "values": [["...", 1.2], ...]}]}
+
+        Returns:
+            tuple: (список корректных показаний, список отклоненных с причинами)
+        """
+        if not isinstance(payload, dict):
+            raise ValueError('Пакет должен быть JSON-объектом')
+
+        flat_items = payload.get('readings', [])
+        grouped_items = payload.get('sensors', [])
+        if not isinstance(flat_items, list) or not isinstance(grouped_items, list):
+            raise ValueError('readings и sensors должны быть списками')
+        if not flat_items and not grouped_items:
+            raise ValueError('Пакет пуст: нужно указать readings или sensors')
+
+        # Размер пакета проверяется до разбора показаний: слишком большой отклоняется сразу
+        total = len(flat_items) + sum(
+            len(group['values']) for group in grouped_items
+            if isinstance(group, dict) and isinstance(group.get('values'), list)
+        )
+        if total > INGEST_MAX_BATCH_SIZE:
+            raise ValueError(f'Слишком большой пакет: {total} показаний (максимум {INGEST_MAX_BATCH_SIZE})')
+
+        readings = []
+        rejected = []
+
+        for index, item in enumerate(flat_items):
+            try:
+                readings.append(IngestService._normalize_item(item))
+            except (TypeError, ValueError) as e:
+                rejected.append({'index': index, 'error': str(e)})
+
+        for group_index, group in enumerate(grouped_items):
+            if not isinstance(group, dict) or not isinstance(group.get('values'), list):
+                rejected.append({'sensor_index': group_index, 'error': 'Нужно указать sensor_id и список values'})
+                continue
+            try:
+                sensor_id = int(group.get('sensor_id'))
+            except (TypeError, ValueError):
+                rejected.append({'sensor_index': group_index, 'error': 'Нужно указать sensor_id'})
+                continue
+
+            for index, item in enumerate(group['values']):
+                try:
+                    readings.append(IngestService._normalize_item(item, sensor_id, group.get('unit')))
+                except (TypeError, ValueError) as e:
+                    rejected.append({'sensor_index': group_index, 'index': index, 'error': str(e)})
+
+        return readings, rejected
+
+    @staticmethod
+    def drop_duplicates(readings):
+        """
+        Убирает повторы внутри пакета и показания, недавно записанные этим процессом
+
+        Returns:
+            list: показания, которые нужно записать (порядок сохраняется)
+        """
+        keys = [(reading['sensor_id'], reading['timestamp']) for reading in readings]
+        batch_keys = set()
+        unique = []
+        for reading, key, known in zip(readings, keys, _recent_keys.seen(keys)):
+            if known or key in batch_keys:
+                continue
+            batch_keys.add(key)
+            unique.append(reading)
+        return unique
+
+    @staticmethod
+    def _load_sensor_settings(cursor, sensor_ids):
+        """Пороги тревоги и единицы измерения для набора датчиков одним запросом на порцию"""
+        settings = {}
+        sensor_ids = sorted(sensor_ids)
+
+        for start in range(0, len(sensor_ids), SQLITE_MAX_VARIABLES):
+            chunk = sensor_ids[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"""
+                SELECT s.id, a.min_threshold, a.max_threshold, a.unit
+                FROM sensor s
+                LEFT JOIN alert_config a ON a.sensor_type = s.sensor_type
+                WHERE s.id IN ({placeholders})
+            """, chunk)
+            for sensor_id, min_threshold, max_threshold, unit in cursor.fetchall():
+                # При нескольких настройках на тип берем первую, как и раньше
+                settings.setdefault(sensor_id, (min_threshold, max_threshold, unit))
+
+        return settings
+
+    @staticmethod
+    def write_readings(readings, db_path=None, source='api'):
+        """
+        Записывает показания в БД одной транзакцией
+
+        Повтор ключа (sensor_id, timestamp) не записывается: сначала его
+        отсекает фильтр недавних ключей в памяти, затем уникальный индекс
+        (INSERT OR IGNORE). Обработчики получают только новые показания.
+        Инциденты тревог (alert_event) обновляются в той же транзакции.
+
+        Args:
+            readings (list): нормализованные показания (см. validate_batch)
+            db_path (str): путь к SQLite (по умолчанию SQLITE_DB_PATH)
+            source (str): источник для метрик (mqtt, mqtt_batch, http_bulk, ...)
+
+        Returns:
+            dict: количество записанных показаний, тревог, повторов и неизвестные датчики
+        """
+        result = {'inserted': 0, 'alerts': 0, 'duplicates': 0, 'unknown_sensors': []}
+        if not readings:
+            return result
+
+        db_path = db_path or SQLITE_DB_PATH
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f'БД не найдена: {db_path}')
+
+        started = time.perf_counter()
+        fresh = IngestService.drop_duplicates(readings)
+        cache_duplicates = len(readings) - len(fresh)
+        db_duplicates = 0
+        unknown_count = 0
+        written = []
+
+        if fresh:
+            conn = sqlite3.connect(db_path, timeout=10.0)
+            try:
+                cursor = conn.cursor()
+                settings = IngestService._load_sensor_settings(
+                    cursor, {reading['sensor_id'] for reading in fresh}
+                )
+
+                rows = []
+                directions = []
+                unknown_sensors = set()
+                for reading in fresh:
+                    sensor_id = reading['sensor_id']
+                    if sensor_id not in settings:
+                        unknown_sensors.add(sensor_id)
+                        unknown_count += 1
+                        continue
+
+                    min_threshold, max_threshold, config_unit = settings[sensor_id]
+                    value = reading['value']
+
+                    # Проверяем пороги тревоги
+                    direction = breach_direction(value, min_threshold, max_threshold)
+                    is_alert = int(direction is not None)
+
+                    rows.append((
+                        sensor_id,
+                        to_db(reading['timestamp']),
+                        value,
+                        reading['unit'] or config_unit or DEFAULT_UNIT,
+                        is_alert
+                    ))
+                    written.append((sensor_id, reading['timestamp'], value, bool(is_alert)))
+                    directions.append(direction)
+
+                if rows:
+                    with conn:
+                        # Блокировка записи до чтения MAX(id): id новых строк идут подряд после него
+                        cursor.execute("BEGIN IMMEDIATE")
+                        last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_reading").fetchone()[0]
+                        cursor.executemany(
+                            "INSERT OR IGNORE INTO sensor_reading (sensor_id, timestamp, value, unit, is_alert) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            rows
+                        )
+                        # Часть ключей уже была в БД: оставляем строки, вставленные сейчас
+                        if cursor.rowcount < len(rows):
+                            new_ids = {
+                                (sensor_id, timestamp): reading_id for reading_id, sensor_id, timestamp in cursor.execute(
+                                    "SELECT id, sensor_id, timestamp FROM sensor_reading WHERE id > ?", (last_id,)
+                                )
+                            }
+                            kept = [i for i, row in enumerate(rows) if (row[0], row[1]) in new_ids]
+                            db_duplicates = len(rows) - len(kept)
+                            rows = [rows[i] for i in kept]
+                            written = [written[i] for i in kept]
+                            directions = [directions[i] for i in kept]
+                            ids = [new_ids[(row[0], row[1])] for row in rows]
+                        else:
+                            ids = range(last_id + 1, last_id + 1 + len(rows))
+
+                        # Инциденты тревог - в той же транзакции
+                        AlertEventService.apply(cursor, [
+                            (sensor_id, datetime_to_us(timestamp), value, row[3], direction)
+                            for (sensor_id, timestamp, value, _), row, direction in zip(written, rows, directions)
+                        ])
+                        # Часовые агрегаты - тоже
+                        RollupService.apply(cursor, [
+                            (sensor_id, datetime_to_us(timestamp), value) for sensor_id, timestamp, value, _ in written
+                        ])
+
+                    # Ключи попадают в фильтр только после фиксации транзакции
+                    _recent_keys.add((sensor_id, timestamp) for sensor_id, timestamp, *_ in written)
+                    written = [item + (reading_id, row[3]) for item, reading_id, row in zip(written, ids, rows)]
+
+                result['inserted'] = len(rows)
+                result['alerts'] = sum(row[4] for row in rows)
+                result['unknown_sensors'] = sorted(unknown_sensors)
+            finally:
+                conn.close()
+
+        result['duplicates'] = cache_duplicates + db_duplicates
+        IngestService.notify_listeners(written)
+
+        # Метрики записи
+        finished = time.time()
+        metrics.ingest_batch_duration.observe(time.perf_counter() - started, source=source)
+        if result['inserted']:
+            newest = max(timestamp for _, timestamp, *_ in written)
+            metrics.ingest_readings_total.inc(result['inserted'], source=source)
+            metrics.ingest_alerts_total.inc(result['alerts'], source=source)
+            metrics.ingest_batch_size.observe(result['inserted'], source=source)
+            metrics.ingest_lag.observe(max(0.0, (datetime.utcnow() - newest).total_seconds()), source=source)
+            metrics.ingest_last_write.set(finished)
+        if unknown_count:
+            metrics.ingest_rejected_total.inc(unknown_count, source=source, reason='unknown_sensor')
+        if cache_duplicates:
+            metrics.ingest_duplicates_total.inc(cache_duplicates, source=source, stage='cache')
+        if db_duplicates:
+            metrics.ingest_duplicates_total.inc(db_duplicates, source=source, stage='db')
+
+        if result['unknown_sensors']:
+            logger.warning(f"Датчики не найдены в БД: {result['unknown_sensors']}")
+        logger.debug(f"Записано показаний: {result['inserted']}, тревог: {result['alerts']}, повторов: {result['duplicates']}")
+
+        return result
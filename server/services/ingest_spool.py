@@ -0,0 +1,325 @@
+# server/services/ingest_spool.py
+#
+# Журнал приема показаний на диске между обработчиком MQTT и записью в БД.
+# Обработчик только дописывает показания в текущий сегмент и сразу возвращается,
+# фоновый писатель забирает сегменты большими пакетами (IngestService.write_readings)
+# и удаляет их после фиксации транзакции. Если БД заблокирована или недоступна,
+# сегменты остаются на диске и записываются позже, а оставшиеся после сбоя -
+# при следующем старте. Повтор уже записанного отбрасывает ключ (sensor_id, timestamp).
+# Ошибки доступа к БД (блокировка, файл недоступен, ввод-вывод) повторяются без
+# ограничения. Сегмент, на котором INGEST_SPOOL_MAX_ATTEMPTS раз подряд падает
+# сама запись (ошибка схемы или ограничения, неразбираемые данные), переносится
+# в подкаталог failed/, чтобы не задерживать остальные; вернуть его можно,
+# переложив обратно в каталог журнала.
+
+import atexit
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from server.config import (
+    SQLITE_DB_PATH, INGEST_MAX_BATCH_SIZE, INGEST_SPOOL, INGEST_SPOOL_DIR,
+    INGEST_SPOOL_SEGMENT_BYTES, INGEST_SPOOL_FLUSH_INTERVAL, INGEST_SPOOL_FSYNC, INGEST_SPOOL_MAX_ATTEMPTS
+)
+from server.database.timestamps import datetime_to_us, us_to_datetime
+from server.monitoring import metrics
+from server.services.ingest_service import IngestService
+
+logger = logging.getLogger(__name__)
+
+# Запись: заголовок (crc32 тела, длина тела) + тело (датчик, время в мкс Unix UTC, значение) + единица UTF-8
+RECORD_HEADER = struct.Struct('<IH')
+RECORD_BODY = struct.Struct('<qqd')
+
+SEGMENT_SUFFIX = '.seg'
+
+# Подкаталог сегментов, запись которых не удалась INGEST_SPOOL_MAX_ATTEMPTS раз подряд
+FAILED_DIR = 'failed'
+
+# Сообщения sqlite3.OperationalError о недоступности БД, а не о данных сегмента
+_TRANSIENT_ERRORS = ('locked', 'busy', 'unable to open', 'disk i/o', 'disk is full', 'readonly')
+
+# Пауза писателя после ошибки записи в БД: удваивается до предела, секунды
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 10.0
+
+
+def is_transient(error):
+    """Ошибка доступа к БД, после которой сегмент нужно повторить, а не откладывать в failed/"""
+    if isinstance(error, OSError):
+        return True
+    if isinstance(error, sqlite3.OperationalError):
+        message = str(error).lower()
+        return any(part in message for part in _TRANSIENT_ERRORS)
+    return False
+
+
+def pack_reading(reading):
+    """Нормализованное показание (см. IngestService.validate_batch) в запись сегмента"""
+    body = RECORD_BODY.pack(
+        reading['sensor_id'], datetime_to_us(reading['timestamp']), reading['value']
+    ) + (reading['unit'] or '').encode('utf-8')
+    return RECORD_HEADER.pack(zlib.crc32(body), len(body)) + body
+
+
+def read_segment(path):
+    """
+    Показания из файла сегмента
+
+    Обрезанная или поврежденная запись в конце (сбой во время дописывания)
+    и все после нее пропускаются.
+
+    Returns:
+        tuple: (список показаний, количество пропущенных байт)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    readings = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        crc, length = RECORD_HEADER.unpack_from(data, offset)
+        body = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+        if len(body) < length or length < RECORD_BODY.size or zlib.crc32(body) != crc:
+            break
+        sensor_id, timestamp, value = RECORD_BODY.unpack_from(body)
+        unit = body[RECORD_BODY.size:].decode('utf-8')
+        readings.append({
+            'sensor_id': sensor_id,
+            'timestamp': us_to_datetime(timestamp),
+            'value': value,
+            'unit': unit or None
+        })
+        offset += RECORD_HEADER.size + length
+
+    return readings, len(data) - offset
+
+
+class IngestSpool:
+    """Журнал показаний из сегментов-файлов с фоновой записью в БД"""
+
+    def __init__(self, directory=INGEST_SPOOL_DIR, segment_bytes=INGEST_SPOOL_SEGMENT_BYTES,
+                 flush_interval=INGEST_SPOOL_FLUSH_INTERVAL, fsync=INGEST_SPOOL_FSYNC,
+                 batch_size=INGEST_MAX_BATCH_SIZE, db_path=None, max_attempts=INGEST_SPOOL_MAX_ATTEMPTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.db_path = db_path or SQLITE_DB_PATH
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Закрытые сегменты в порядке записи: (путь, байт, время первой записи)
+        self._sealed = deque()
+        self._active = None
+        self._active_path = None
+        self._active_bytes = 0
+        self._active_since = None
+        self.pending_bytes = 0
+        self.last_error = None
+        self.failed_segments = 0
+        # Неудачные попытки подряд для первого сегмента очереди: (путь, попыток)
+        self._failures = (None, 0)
+
+        # Сегменты, оставшиеся с прошлого запуска, записываются первыми
+        os.makedirs(directory, exist_ok=True)
+        names = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            path = os.path.join(directory, name)
+            size = os.path.getsize(path)
+            self._sealed.append((path, size, os.path.getmtime(path)))
+            self.pending_bytes += size
+        self.replayed_segments = len(names)
+        # Номера продолжают и сегменты из failed/, чтобы их можно было вернуть без переименования
+        failed_dir = os.path.join(directory, FAILED_DIR)
+        failed = [name for name in os.listdir(failed_dir) if name.endswith(SEGMENT_SUFFIX)] if os.path.isdir(failed_dir) else []
+        numbers = [int(name[:-len(SEGMENT_SUFFIX)]) for name in names + failed]
+        self._next_segment = max(numbers) + 1 if numbers else 1
+
+        if names:
+            logger.info(f"Журнал приема: {len(names)} сегментов ({self.pending_bytes} байт) с прошлого запуска")
+        self._update_gauges()
+
+    def append(self, readings):
+        """Дописывает нормализованные показания в текущий сегмент (без обращения к БД)"""
+        if not readings:
+            return
+        data = b''.join(pack_reading(reading) for reading in readings)
+
+        with self._lock:
+            if self._active is None:
+                self._active_path = os.path.join(self.directory, f'{self._next_segment:012d}{SEGMENT_SUFFIX}')
+                self._next_segment += 1
+                self._active = open(self._active_path, 'ab')
+                self._active_bytes = 0
+                self._active_since = time.time()
+
+            self._active.write(data)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._active_bytes += len(data)
+            self.pending_bytes += len(data)
+
+            full = self._active_bytes >= self.segment_bytes
+            if full:
+                self._seal_locked()
+
+        metrics.ingest_spool_records_total.inc(len(readings), event='appended')
+        metrics.ingest_spool_bytes.set(self.pending_bytes)
+        if full:
+            self._wakeup.set()
+
+    def _seal_locked(self):
+        """Закрывает текущий сегмент и передает его писателю (под self._lock)"""
+        if self._active is None:
+            return
+        self._active.close()
+        self._sealed.append((self._active_path, self._active_bytes, self._active_since))
+        self._active = None
+        self._active_path = None
+        self._active_bytes = 0
+        self._active_since = None
+
+    def drain(self):
+        """
+        Записывает в БД все накопленные сегменты
+
+        Returns:
+            bool: журнал пуст (False - ошибка записи, сегменты остались на диске)
+        """
+        with self._lock:
+            self._seal_locked()
+            segments = list(self._sealed)
+
+        for path, size, _ in segments:
+            try:
+                readings, skipped = read_segment(path)
+                if skipped:
+                    metrics.ingest_spool_records_total.inc(1, event='corrupt')
+                    logger.warning(f"Журнал приема: в {path} пропущено {skipped} байт поврежденного хвоста")
+
+                for start in range(0, len(readings), self.batch_size):
+                    IngestService.write_readings(
+                        readings[start:start + self.batch_size], db_path=self.db_path, source='mqtt_spool'
+                    )
+            except Exception as e:
+                self.last_error = str(e)
+                metrics.ingest_spool_errors_total.inc()
+                if is_transient(e):
+                    logger.warning(f"Журнал приема: запись сегмента {os.path.basename(path)} отложена: {e}")
+                    self._update_gauges()
+                    return False
+
+                attempts = self._failures[1] + 1 if self._failures[0] == path else 1
+                if attempts < self.max_attempts:
+                    self._failures = (path, attempts)
+                    logger.warning(f"Журнал приема: запись сегмента {os.path.basename(path)} отложена: {e}")
+                    self._update_gauges()
+                    return False
+                self._set_aside(path, size, e)
+                continue
+
+            self._failures = (None, 0)
+            os.remove(path)
+            with self._lock:
+                self._sealed.popleft()
+                self.pending_bytes -= size
+            metrics.ingest_spool_records_total.inc(len(readings), event='written')
+
+        self.last_error = None
+        self._update_gauges()
+        return True
+
+    def _set_aside(self, path, size, error):
+        """Переносит сегмент, который не удается записать, в failed/ и снимает его с очереди"""
+        failed_dir = os.path.join(self.directory, FAILED_DIR)
+        os.makedirs(failed_dir, exist_ok=True)
+        os.replace(path, os.path.join(failed_dir, os.path.basename(path)))
+        with self._lock:
+            self._sealed.popleft()
+            self.pending_bytes -= size
+        self._failures = (None, 0)
+        self.failed_segments += 1
+        metrics.ingest_spool_failed_segments_total.inc()
+        logger.error(f"Журнал приема: сегмент {os.path.basename(path)} не записан после {self.max_attempts} "
+                     f"попыток и перенесен в {failed_dir}: {error}")
+
+    def _update_gauges(self):
+        with self._lock:
+            oldest = self._sealed[0][2] if self._sealed else self._active_since
+            segments = len(self._sealed) + (self._active is not None)
+            pending_bytes = self.pending_bytes
+        metrics.ingest_spool_bytes.set(pending_bytes)
+        metrics.ingest_spool_segments.set(segments)
+        metrics.ingest_spool_lag.set(max(0.0, time.time() - oldest) if oldest is not None else 0.0)
+
+    def status(self):
+        with self._lock:
+            oldest = self._sealed[0][2] if self._sealed else self._active_since
+            return {
+                'directory': self.directory,
+                'segments': len(self._sealed) + (self._active is not None),
+                'pending_bytes': self.pending_bytes,
+                'lag_seconds': round(max(0.0, time.time() - oldest), 3) if oldest is not None else 0.0,
+                'replayed_segments': self.replayed_segments,
+                'failed_segments': self.failed_segments,
+                'last_error': self.last_error
+            }
+
+    def start(self):
+        """Фоновый писатель: сегменты записываются раз в flush_interval или сразу после заполнения"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            delay = RETRY_DELAY
+            while not self._stop.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                if self.drain():
+                    delay = RETRY_DELAY
+                else:
+                    self._stop.wait(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+
+        self._thread = threading.Thread(target=loop, name='geo-ingest-spool', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Останавливает писателя и записывает остаток (при ошибке сегменты остаются на диске)"""
+        if self._thread is not None:
+            self._stop.set()
+            self._wakeup.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.drain()
+
+
+ingest_spool = None
+
+
+def init_ingest_spool():
+    """
+    Создает журнал приема и запускает писателя (INGEST_SPOOL=0 - запись напрямую)
+
+    Returns:
+        IngestSpool или None
+    """
+    global ingest_spool
+    if not INGEST_SPOOL:
+        return None
+    if ingest_spool is None:
+        ingest_spool = IngestSpool()
+        ingest_spool.start()
+        atexit.register(ingest_spool.stop)
+    return ingest_spool
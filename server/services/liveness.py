@@ -0,0 +1,403 @@
+# server/services/liveness.py
+#
+# Контроль связи с датчиками. Для каждого датчика в памяти хранятся время
+# последнего показания и ожидаемый интервал между показаниями (EWMA), срок
+# молчания - LIVENESS_FACTOR интервалов. Сроки лежат в хешированном колесе
+# таймеров: шаг проверки (LIVENESS_TICK) просматривает один слот, поэтому работа
+# пропорциональна числу истекших сроков, а не числу датчиков. Замолчавшие датчики
+# получают status='offline', при следующем показании - снова 'active'.
+# Время в памяти - секунды Unix (UTC). Срок отсчитывается от времени приема
+# показания сервером: дозагрузка шлюзом старых показаний или отстающие часы
+# датчика не делают его молчащим. Метки показаний нужны только для оценки интервала.
+
+import atexit
+import logging
+import math
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from server.config import (
+    SQLITE_DB_PATH, LIVENESS, LIVENESS_TICK, LIVENESS_SLOTS, LIVENESS_FACTOR,
+    LIVENESS_MIN_TIMEOUT, LIVENESS_MAX_TIMEOUT, LIVENESS_DEFAULT_INTERVAL
+)
+from server.database.db import db
+from server.database.timestamps import datetime_to_us, us_to_datetime, from_db, to_db
+from server.models.sensor_data import Sensor
+from server.monitoring import metrics
+from server.services.ingest_service import IngestService
+from server.utils.cache import versions
+
+logger = logging.getLogger(__name__)
+
+# Статусы датчика, которые меняет контроль связи (остальные выставлены вручную)
+ONLINE_STATUS = 'active'
+OFFLINE_STATUS = 'offline'
+
+# Вес нового интервала в EWMA и предел одного интервала (в ожидаемых),
+# чтобы перерыв связи не растягивал ожидаемый интервал
+INTERVAL_ALPHA = 0.2
+INTERVAL_CLAMP = 4.0
+
+
+def _seconds(value):
+    """Время из сырого SQL в секунды Unix"""
+    return datetime_to_us(from_db(value)) / 1e6
+
+
+def _isoformat(seconds):
+    return us_to_datetime(round(seconds * 1e6)).isoformat() + 'Z' if seconds is not None else None
+
+
+class TimerWheel:
+    """
+    Хешированное колесо таймеров
+
+    Срок округляется вверх до шага tick и попадает в слот (шаг по модулю
+    числа слотов). Сроки дальше одного оборота остаются в слоте и
+    пропускаются, пока не наступят. Перенос срока - O(1).
+    """
+
+    def __init__(self, tick, slots, now):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.current = int(now // tick)   # последний обработанный шаг
+        self._due = {}
+
+    def __len__(self):
+        return len(self._due)
+
+    def schedule(self, key, deadline):
+        """Назначает или переносит срок ключа (секунды)"""
+        due = max(math.ceil(deadline / self.tick), self.current + 1)
+        previous = self._due.get(key)
+        if previous == due:
+            return
+        if previous is not None:
+            self.slots[previous % len(self.slots)].discard(key)
+        self._due[key] = due
+        self.slots[due % len(self.slots)].add(key)
+
+    def advance(self, now):
+        """
+        Проходит шаги до now
+
+        Returns:
+            list: ключи с наступившими сроками (снимаются с колеса)
+        """
+        target = int(now // self.tick)
+        steps = min(target - self.current, len(self.slots))
+        expired = []
+        for step in range(self.current + 1, self.current + 1 + steps):
+            slot = self.slots[step % len(self.slots)]
+            for key in [key for key in slot if self._due[key] <= target]:
+                slot.discard(key)
+                del self._due[key]
+                expired.append(key)
+        self.current = max(self.current, target)
+        return expired
+
+
+class SensorLiveness:
+    """Время приема последнего показания и ожидаемый интервал одного датчика"""
+
+    __slots__ = ('last_seen', 'last_reading', 'interval', 'offline_since')
+
+    def __init__(self, last_seen, interval, last_reading=None):
+        self.last_seen = last_seen          # прием сервером - от него отсчитывается срок
+        self.last_reading = last_seen if last_reading is None else last_reading  # метка показания
+        self.interval = interval
+        self.offline_since = None
+
+    def observe(self, timestamp, received):
+        """
+        Учитывает показание с меткой timestamp, принятое в received;
+        запоздавшие продлевают связь, но не меняют интервал
+        """
+        self.last_seen = max(self.last_seen, received)
+        if timestamp <= self.last_reading:
+            return
+        gap = min(timestamp - self.last_reading, self.interval * INTERVAL_CLAMP)
+        self.interval += INTERVAL_ALPHA * (gap - self.interval)
+        self.last_reading = timestamp
+
+    @property
+    def timeout(self):
+        return min(max(self.interval * LIVENESS_FACTOR, LIVENESS_MIN_TIMEOUT), LIVENESS_MAX_TIMEOUT)
+
+    @property
+    def deadline(self):
+        return self.last_seen + self.timeout
+
+
+class LivenessTracker:
+    """Контроль связи со всеми датчиками процесса"""
+
+    def __init__(self, tick=LIVENESS_TICK, slots=LIVENESS_SLOTS):
+        self.tick = tick
+        self.enabled = False
+        self._sensors = {}
+        self._offline = set()
+        self._wheel = TimerWheel(tick, slots, time.time())
+        # Смены статуса, еще не записанные в sensor.status: {sensor_id: статус}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def on_readings(self, written):
+        """Обработчик записанных показаний (см. IngestService.add_listener)"""
+        latest = {}
+        for sensor_id, timestamp, *_ in written:
+            latest.setdefault(sensor_id, []).append(datetime_to_us(timestamp) / 1e6)
+
+        received = time.time()
+        with self._lock:
+            for sensor_id, timestamps in latest.items():
+                timestamps.sort()
+                state = self._sensors.get(sensor_id)
+                if state is None:
+                    state = self._sensors[sensor_id] = SensorLiveness(
+                        received, LIVENESS_DEFAULT_INTERVAL, last_reading=timestamps[0]
+                    )
+                for timestamp in timestamps:
+                    state.observe(timestamp, received)
+                if state.offline_since is not None and state.deadline > received:
+                    state.offline_since = None
+                    self._offline.discard(sensor_id)
+                    self._pending[sensor_id] = ONLINE_STATUS
+                    metrics.liveness_transitions_total.inc(state='online')
+                self._wheel.schedule(sensor_id, state.deadline)
+
+    def bootstrap(self):
+        """
+        Последнее показание и средний интервал датчиков по истории: одна
+        агрегация за LIVENESS_MAX_TIMEOUT и по запросу на датчик, молчащий дольше
+
+        Returns:
+            int: количество датчиков под контролем
+        """
+        since = datetime.utcnow() - timedelta(seconds=LIVENESS_MAX_TIMEOUT)
+        rows = db.session.execute(text(f"""
+            SELECT sensor_id, MIN(timestamp), MAX(timestamp), COUNT(*)
+            FROM sensor_reading WHERE timestamp >= :since
+            GROUP BY sensor_id
+        """), {'since': to_db(since)}).fetchall()
+        recent = {
+            sensor_id: (_seconds(first), _seconds(last), count) for sensor_id, first, last, count in rows
+        }
+        statuses = dict(db.session.execute(text("SELECT id, status FROM sensor")).fetchall())
+
+        # Время приема по истории неизвестно: берется метка показания, но не позже текущего момента
+        now = time.time()
+        sensors = {}
+        for sensor_id, status in statuses.items():
+            if status not in (ONLINE_STATUS, OFFLINE_STATUS, None):
+                continue
+            if sensor_id in recent:
+                first, last, count = recent[sensor_id]
+                interval = (last - first) / (count - 1) if count > 1 else LIVENESS_DEFAULT_INTERVAL
+            else:
+                # Молчит дольше LIVENESS_MAX_TIMEOUT: последнее показание по индексу (sensor_id, timestamp)
+                last = db.session.execute(text(
+                    "SELECT MAX(timestamp) FROM sensor_reading WHERE sensor_id = :sensor_id"
+                ), {'sensor_id': sensor_id}).scalar()
+                if last is None:
+                    continue
+                last = _seconds(last)
+                interval = LIVENESS_DEFAULT_INTERVAL
+            state = SensorLiveness(min(last, now), interval or LIVENESS_DEFAULT_INTERVAL, last_reading=last)
+            if status == OFFLINE_STATUS:
+                # Статус offline из прошлого запуска: вернется в active при первом шаге, если срок не истек
+                state.offline_since = state.deadline
+            sensors[sensor_id] = state
+
+        with self._lock:
+            self._sensors = sensors
+            self._offline = set()
+            self._wheel = TimerWheel(self.tick, len(self._wheel.slots), now)
+            for sensor_id, state in sensors.items():
+                if state.offline_since is not None and state.deadline > now:
+                    state.offline_since = None
+                    self._pending[sensor_id] = ONLINE_STATUS
+                elif state.offline_since is not None:
+                    self._offline.add(sensor_id)
+                self._wheel.schedule(sensor_id, state.deadline)
+            offline = len(self._offline)
+        metrics.liveness_offline_sensors.set(offline)
+        return len(sensors)
+
+    def check(self, now=None):
+        """
+        Шаг контроля: датчики с истекшим сроком - offline
+
+        Returns:
+            list: датчики, замолчавшие на этом шаге
+        """
+        now = time.time() if now is None else now
+        silent = []
+        with self._lock:
+            for sensor_id in self._wheel.advance(now):
+                state = self._sensors[sensor_id]
+                if state.offline_since is None:
+                    state.offline_since = state.deadline
+                    self._offline.add(sensor_id)
+                    self._pending[sensor_id] = OFFLINE_STATUS
+                    silent.append(sensor_id)
+            offline = len(self._offline)
+
+        if silent:
+            metrics.liveness_transitions_total.inc(len(silent), state='offline')
+            metrics.liveness_offline_sensors.set(offline)
+            logger.warning(f"Нет показаний от датчиков: {sorted(silent)}")
+        return silent
+
+    def persist(self, db_path=None):
+        """Записывает смены статуса в sensor.status (ручные статусы не меняются)"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        if not pending:
+            return 0
+
+        try:
+            conn = sqlite3.connect(db_path or SQLITE_DB_PATH, timeout=10.0)
+            try:
+                with conn:
+                    conn.executemany(
+                        "UPDATE sensor SET status = ? WHERE id = ? AND (status IN (?, ?) OR status IS NULL)",
+                        [(status, sensor_id, ONLINE_STATUS, OFFLINE_STATUS) for sensor_id, status in pending.items()]
+                    )
+            finally:
+                conn.close()
+        except Exception as e:
+            # Более новые смены статуса важнее возвращаемых
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            logger.error(f"Ошибка записи статуса датчиков: {e}")
+            return 0
+
+        versions.bump('metadata')
+        metrics.liveness_offline_sensors.set(len(self._offline))
+        return len(pending)
+
+    def offline(self):
+        """
+        Молчащие датчики, дольше всех молчащие первыми
+
+        Returns:
+            list: dict с sensor_id, last_seen, offline_since (секунды Unix),
+                  expected_interval и timeout (секунды)
+        """
+        with self._lock:
+            items = [
+                {
+                    'sensor_id': sensor_id,
+                    'last_seen': state.last_seen,
+                    'offline_since': state.offline_since,
+                    'expected_interval': round(state.interval, 3),
+                    'timeout': round(state.timeout, 3)
+                }
+                for sensor_id, state in ((sensor_id, self._sensors[sensor_id]) for sensor_id in self._offline)
+            ]
+        items.sort(key=lambda item: item['last_seen'])
+        return items
+
+    def status(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sensors': len(self._sensors),
+                'scheduled': len(self._wheel),
+                'offline': len(self._offline),
+                'tick': self.tick
+            }
+
+    def start(self):
+        """Фоновые шаги контроля раз в tick секунд"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(self.tick):
+                try:
+                    self.check()
+                    self.persist()
+                except Exception as e:
+                    logger.error(f"Ошибка контроля связи с датчиками: {e}")
+
+        self._thread = threading.Thread(target=loop, name='geo-liveness', daemon=True)
+        self._thread.start()
+        atexit.register(self.persist)
+
+
+liveness_tracker = LivenessTracker()
+
+
+def get_offline_sensors():
+    """
+    Молчащие датчики: из памяти, если этот процесс принимает показания, иначе
+    по сохраненному status='offline' (процессы api и ingest могут быть разными)
+
+    Returns:
+        dict: source (memory, stored) и sensors - датчики с последним показанием
+    """
+    if liveness_tracker.enabled:
+        items = liveness_tracker.offline()
+        source = 'memory'
+    else:
+        rows = db.session.execute(text("""
+            SELECT s.id, (SELECT MAX(r.timestamp) FROM sensor_reading r WHERE r.sensor_id = s.id)
+            FROM sensor s WHERE s.status = :status
+        """), {'status': OFFLINE_STATUS}).fetchall()
+        items = [
+            {'sensor_id': sensor_id, 'last_seen': _seconds(last) if last is not None else None}
+            for sensor_id, last in rows
+        ]
+        items.sort(key=lambda item: item['last_seen'] or 0)
+        source = 'stored'
+
+    sensors = {
+        sensor.id: sensor for sensor in
+        Sensor.query.filter(Sensor.id.in_([item['sensor_id'] for item in items])).all()
+    } if items else {}
+    now = time.time()
+
+    result = []
+    for item in items:
+        sensor = sensors.get(item['sensor_id'])
+        last_seen = item['last_seen']
+        result.append({
+            'sensor_id': item['sensor_id'],
+            'name': sensor.name if sensor else None,
+            'type': sensor.sensor_type if sensor else None,
+            'building_id': sensor.building_id if sensor else None,
+            'last_seen': _isoformat(last_seen),
+            'offline_since': _isoformat(item.get('offline_since')),
+            'silent_seconds': round(now - last_seen, 3) if last_seen is not None else None,
+            'expected_interval': item.get('expected_interval'),
+            'timeout': item.get('timeout')
+        })
+    return {'source': source, 'count': len(result), 'sensors': result}
+
+
+def init_liveness(app, ingest_in_process):
+    """
+    Включает контроль связи: состояние по истории, подписка на запись показаний
+    и фоновые шаги
+
+    Args:
+        app (Flask): Приложение Flask
+        ingest_in_process (bool): показания MQTT принимает этот процесс
+    """
+    if LIVENESS == '0' or (LIVENESS == 'auto' and not ingest_in_process):
+        return
+
+    with app.app_context():
+        count = liveness_tracker.bootstrap()
+    logger.info(f"Контроль связи: {count} датчиков")
+
+    liveness_tracker.enabled = True
+    IngestService.add_listener(liveness_tracker.on_readings)
+    liveness_tracker.start()
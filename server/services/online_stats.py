@@ -0,0 +1,283 @@
+# server/services/online_stats.py
+
+import atexit
+import logging
+import math
+import sqlite3
+import threading
+from datetime import datetime
+from sqlalchemy import text
+from server.config import SQLITE_DB_PATH, ONLINE_STATS, STATS_EWMA_ALPHA, STATS_PERSIST_INTERVAL
+from server.database.db import db
+from server.models.sensor_data import SensorStats
+from server.database.timestamps import SQLITE_TIMESTAMP_FORMAT, from_db
+from server.services.ingest_service import IngestService
+
+logger = logging.getLogger(__name__)
+
+
+class OnlineStats:
+    """
+    Накопитель статистики одного датчика, O(1) на показание
+
+    Среднее и дисперсия - алгоритм Уэлфорда (не зависят от порядка показаний),
+    EWMA и наклон обновляются только показаниями новее последнего.
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'min_value', 'max_value', 'ewma', 'ewm_variance',
+                 'last_value', 'last_timestamp', 'last_slope')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min_value = None
+        self.max_value = None
+        self.ewma = None
+        self.ewm_variance = 0.0
+        self.last_value = None
+        self.last_timestamp = None
+        self.last_slope = None
+
+    def update(self, timestamp, value, alpha=STATS_EWMA_ALPHA):
+        # Уэлфорд
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+        # Запоздавшие показания (досылка от шлюза) не двигают EWMA и наклон
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return
+
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            self.ewma += alpha * diff
+            self.ewm_variance = (1 - alpha) * (self.ewm_variance + alpha * diff * diff)
+
+        if self.last_timestamp is not None:
+            hours = (timestamp - self.last_timestamp).total_seconds() / 3600
+            self.last_slope = (value - self.last_value) / hours
+
+        self.last_value = value
+        self.last_timestamp = timestamp
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else None,
+            'variance': self.variance,
+            'std': math.sqrt(self.variance),
+            'min': self.min_value,
+            'max': self.max_value,
+            'ewma': self.ewma,
+            'ewm_std': math.sqrt(self.ewm_variance) if self.ewma is not None else None,
+            'last_value': self.last_value,
+            'last_timestamp': self.last_timestamp.isoformat() + 'Z' if self.last_timestamp else None,
+            'last_slope_per_hour': self.last_slope
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        """Восстановление из сохраненной строки SensorStats"""
+        stats = cls()
+        stats.count = record.count or 0
+        stats.mean = record.mean or 0.0
+        stats.m2 = record.m2 or 0.0
+        stats.min_value = record.min_value
+        stats.max_value = record.max_value
+        stats.ewma = record.ewma
+        stats.ewm_variance = record.ewm_variance or 0.0
+        stats.last_value = record.last_value
+        stats.last_timestamp = record.last_timestamp
+        stats.last_slope = record.last_slope
+        return stats
+
+
+class SensorStatsRegistry:
+    """Онлайн-статистика всех датчиков процесса"""
+
+    def __init__(self, alpha=STATS_EWMA_ALPHA):
+        self.alpha = alpha
+        self.enabled = False
+        self._stats = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def on_readings(self, written):
+        """Обработчик записанных показаний (см. IngestService.add_listener)"""
+        with self._lock:
+            for sensor_id, timestamp, value, *_ in written:
+                stats = self._stats.get(sensor_id)
+                if stats is None:
+                    stats = self._stats[sensor_id] = OnlineStats()
+                stats.update(timestamp, value, self.alpha)
+                self._dirty.add(sensor_id)
+
+    def get(self, sensor_id):
+        with self._lock:
+            stats = self._stats.get(sensor_id)
+            return stats.to_dict() if stats is not None else None
+
+    def load(self, records):
+        with self._lock:
+            for record in records:
+                self._stats[record.sensor_id] = OnlineStats.from_record(record)
+
+    def bootstrap(self):
+        """
+        Первичное заполнение по истории: агрегирующий запрос по всей таблице
+        показаний. Выполняется, если сохраненной статистики нет, и после
+        заполнения БД тестовыми данными.
+
+        Дисперсия считается в два прохода (отклонения от среднего датчика):
+        AVG(v*v) - mean² теряет точность на больших значениях с малым разбросом.
+        """
+        rows = db.session.execute(text("""
+            SELECT r.sensor_id, COUNT(*), m.mean, SUM((r.value - m.mean) * (r.value - m.mean)),
+                   MIN(r.value), MAX(r.value), MAX(r.timestamp),
+                   (SELECT value FROM sensor_reading WHERE sensor_id = r.sensor_id ORDER BY timestamp DESC LIMIT 1)
+            FROM sensor_reading r
+            JOIN (SELECT sensor_id, AVG(value) AS mean FROM sensor_reading GROUP BY sensor_id) m
+                ON m.sensor_id = r.sensor_id
+            GROUP BY r.sensor_id
+        """)).fetchall()
+
+        with self._lock:
+            for sensor_id, count, mean, m2, min_value, max_value, last_timestamp, last_value in rows:
+                stats = OnlineStats()
+                stats.count = count
+                stats.mean = mean
+                stats.m2 = max(0.0, m2)
+                stats.min_value = min_value
+                stats.max_value = max_value
+                # EWMA начинается с последнего значения, разброс - с дисперсии по истории,
+                # чтобы ewm_std не был нулевым до накопления новых показаний
+                stats.ewma = stats.last_value = last_value
+                stats.ewm_variance = stats.m2 / count
+                stats.last_timestamp = from_db(last_timestamp)
+                self._stats[sensor_id] = stats
+                self._dirty.add(sensor_id)
+
+        return len(rows)
+
+    def persist(self, db_path=None):
+        """Сохраняет измененную статистику в таблицу sensor_stats"""
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+            rows = []
+            for sensor_id in dirty:
+                stats = self._stats[sensor_id]
+                rows.append((
+                    sensor_id, stats.count, stats.mean, stats.m2, stats.min_value, stats.max_value,
+                    stats.ewma, stats.ewm_variance, stats.last_value,
+                    stats.last_timestamp.strftime(SQLITE_TIMESTAMP_FORMAT) if stats.last_timestamp else None,
+                    stats.last_slope, datetime.utcnow().strftime(SQLITE_TIMESTAMP_FORMAT)
+                ))
+
+        if not rows:
+            return 0
+
+        try:
+            conn = sqlite3.connect(db_path or SQLITE_DB_PATH, timeout=10.0)
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO sensor_stats (sensor_id, count, mean, m2, min_value, max_value, ewma,
+                                                  ewm_variance, last_value, last_timestamp, last_slope, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(sensor_id) DO UPDATE SET
+                            count = excluded.count, mean = excluded.mean, m2 = excluded.m2,
+                            min_value = excluded.min_value, max_value = excluded.max_value,
+                            ewma = excluded.ewma, ewm_variance = excluded.ewm_variance,
+                            last_value = excluded.last_value, last_timestamp = excluded.last_timestamp,
+                            last_slope = excluded.last_slope, updated_at = excluded.updated_at
+                    """, rows)
+            finally:
+                conn.close()
+        except Exception as e:
+            # Вернем датчики в очередь на следующую попытку
+            with self._lock:
+                self._dirty |= dirty
+            logger.error(f"Ошибка сохранения статистики: {e}")
+            return 0
+
+        return len(rows)
+
+    def start_persistence(self, interval=STATS_PERSIST_INTERVAL):
+        """Фоновое периодическое сохранение и сохранение при выходе"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.persist()
+
+        self._thread = threading.Thread(target=loop, name='geo-stats-persist', daemon=True)
+        self._thread.start()
+        atexit.register(self.persist)
+
+
+stats_registry = SensorStatsRegistry()
+
+
+def get_sensor_stats(sensor_id):
+    """
+    Статистика датчика: из памяти, если этот процесс принимает его показания,
+    иначе последняя сохраненная (процессы api и ingest могут быть разными)
+    """
+    if stats_registry.enabled:
+        stats = stats_registry.get(sensor_id)
+        if stats is not None:
+            stats['source'] = 'memory'
+            return stats
+
+    record = SensorStats.query.get(sensor_id)
+    if record is None:
+        return None
+
+    stats = OnlineStats.from_record(record).to_dict()
+    stats['source'] = 'stored'
+    stats['updated_at'] = record.updated_at.isoformat() + 'Z' if record.updated_at else None
+    return stats
+
+
+def init_online_stats(app, ingest_in_process):
+    """
+    Загружает сохраненную статистику, подписывается на запись показаний
+    и запускает периодическое сохранение. Без приема показаний в процессе
+    статистика читается из sensor_stats: копия в памяти устарела бы, а ее
+    сохранение затирало бы строки, записанные процессом ingest.
+
+    Args:
+        app (Flask): Приложение Flask
+        ingest_in_process (bool): показания MQTT принимает этот процесс
+    """
+    if ONLINE_STATS == '0' or (ONLINE_STATS == 'auto' and not ingest_in_process):
+        return
+
+    stats_registry.enabled = True
+    with app.app_context():
+        records = SensorStats.query.all()
+        if records:
+            stats_registry.load(records)
+        else:
+            count = stats_registry.bootstrap()
+            logger.info(f"Онлайн-статистика построена по истории для {count} датчиков")
+
+    IngestService.add_listener(stats_registry.on_readings)
+    stats_registry.start_persistence()
@@ -0,0 +1,314 @@
+# server/services/reading_buffer.py
+#
+# Кольцевые буферы последних показаний по датчикам (предвыделенные массивы numpy).
+# Показания датчика и аппроксимация за последние READING_BUFFER_HOURS часов
+# отдаются из памяти без обращения к БД, более старые периоды читаются SQL.
+# Буфер заполняется при записи показаний, при старте прогревается из БД, а при
+# промахе - результатом SQL-запроса. Если память превышает READING_BUFFER_MAX_BYTES,
+# вытесняются датчики, к которым дольше всего не обращались.
+# Буферы верны, только если все показания записываются через этот процесс,
+# поэтому по умолчанию включены вместе с подсистемой ingest (GEO_READING_BUFFER).
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from server.config import READING_BUFFER, READING_BUFFER_HOURS, READING_BUFFER_MAX_BYTES, READING_BUFFER_MAX_POINTS
+from server.database.timestamps import datetime_to_us
+from server.monitoring import metrics
+from server.services.ingest_service import IngestService
+
+logger = logging.getLogger(__name__)
+
+# Байт на показание: время, значение, id (int64/float64), тревога (bool), код единицы (uint16)
+ROW_BYTES = 8 + 8 + 8 + 1 + 2
+
+# Емкость буфера - запас к числу показаний за период, не меньше MIN_CAPACITY
+CAPACITY_RESERVE = 1.5
+MIN_CAPACITY = 256
+
+
+class SensorRing:
+    """
+    Кольцевой буфер показаний одного датчика, упорядоченных по времени
+
+    covered_from - время (мкс Unix), начиная с которого в буфере есть все
+    показания датчика; при перезаписи самых старых оно сдвигается вперед.
+    """
+
+    def __init__(self, capacity, covered_from):
+        import numpy as np
+
+        self.capacity = capacity
+        self.t = np.empty(capacity, dtype=np.int64)
+        self.v = np.empty(capacity, dtype=np.float64)
+        self.id = np.empty(capacity, dtype=np.int64)
+        self.alert = np.empty(capacity, dtype=bool)
+        self.unit = np.empty(capacity, dtype=np.uint16)
+        self.units = []
+        self.start = 0
+        self.size = 0
+        self.covered_from = covered_from
+
+    @property
+    def nbytes(self):
+        return self.capacity * ROW_BYTES
+
+    def unit_codes(self, units):
+        """Коды единиц измерения (словарь единиц у каждого буфера свой)"""
+        codes = []
+        for unit in units:
+            try:
+                codes.append(self.units.index(unit))
+            except ValueError:
+                self.units.append(unit)
+                codes.append(len(self.units) - 1)
+        return codes
+
+    def _ordered(self, array):
+        """Содержимое буфера в порядке времени (срез без копии, если не переходит через конец)"""
+        import numpy as np
+
+        end = self.start + self.size
+        if end <= self.capacity:
+            return array[self.start:end]
+        return np.concatenate((array[self.start:], array[:end - self.capacity]))
+
+    def extend(self, t, v, ids, alerts, units):
+        """
+        Добавляет показания (массивы numpy, t - мкс Unix)
+
+        Показания старше covered_from пропускаются (они есть только в БД),
+        повторы по времени - тоже. Обычно показания приходят по возрастанию
+        времени и дописываются на место самых старых; иначе буфер пересобирается.
+        """
+        import numpy as np
+
+        keep = t >= self.covered_from
+        if not keep.all():
+            t, v, ids, alerts, units = t[keep], v[keep], ids[keep], alerts[keep], units[keep]
+        count = len(t)
+        if count == 0:
+            return
+
+        last = self.t[(self.start + self.size - 1) % self.capacity] if self.size else None
+        in_order = (last is None or t[0] > last) and (count == 1 or bool((np.diff(t) > 0).all()))
+
+        if not in_order:
+            # Дозагрузка старых показаний: слияние с сортировкой и удалением повторов
+            columns = [np.concatenate((self._ordered(old), new)) for old, new in
+                       ((self.t, t), (self.v, v), (self.id, ids), (self.alert, alerts), (self.unit, units))]
+            order = np.argsort(columns[0], kind='stable')
+            columns = [column[order] for column in columns]
+            unique = np.ones(len(order), dtype=bool)
+            unique[1:] = columns[0][1:] != columns[0][:-1]
+            t, v, ids, alerts, units = (column[unique] for column in columns)
+            count = len(t)
+            self.start = 0
+            self.size = 0
+
+        # Не помещается: остаются самые новые, покрытие начинается с первого из них
+        dropped = self.size + count > self.capacity
+        if count >= self.capacity:
+            t, v, ids, alerts, units = (column[-self.capacity:] for column in (t, v, ids, alerts, units))
+            self.start = 0
+            self.size = 0
+            count = self.capacity
+
+        positions = (self.start + self.size + np.arange(count)) % self.capacity
+        self.t[positions] = t
+        self.v[positions] = v
+        self.id[positions] = ids
+        self.alert[positions] = alerts
+        self.unit[positions] = units
+
+        overflow = self.size + count - self.capacity
+        if overflow > 0:
+            self.start = (self.start + overflow) % self.capacity
+            self.size = self.capacity
+        else:
+            self.size += count
+        if dropped:
+            self.covered_from = max(self.covered_from, int(self.t[self.start]))
+
+    def window(self, since, until):
+        """Столбцы показаний за [since, until] (мкс Unix) или None, если период не покрыт"""
+        import numpy as np
+
+        if since < self.covered_from:
+            return None
+
+        t = self._ordered(self.t)
+        lo = int(np.searchsorted(t, since, side='left'))
+        hi = int(np.searchsorted(t, until, side='right'))
+        units = np.array(self.units, dtype=object)
+        return {
+            'id': self._ordered(self.id)[lo:hi].copy(),
+            't': t[lo:hi].astype('datetime64[us]'),
+            'v': self._ordered(self.v)[lo:hi].copy(),
+            'unit': units[self._ordered(self.unit)[lo:hi]].tolist() if hi > lo else [],
+            'is_alert': self._ordered(self.alert)[lo:hi].copy()
+        }
+
+
+class ReadingBufferRegistry:
+    """Буферы последних показаний всех датчиков процесса с общим лимитом памяти"""
+
+    def __init__(self, hours=READING_BUFFER_HOURS, max_bytes=READING_BUFFER_MAX_BYTES,
+                 max_points=READING_BUFFER_MAX_POINTS):
+        self.hours = hours
+        self.max_bytes = max_bytes
+        self.max_points = max_points
+        self.enabled = False
+        # Порядок - давность обращения (вытесняются первые)
+        self._rings = OrderedDict()
+        # Счетчики записей по датчикам и сбросов: буфер из результата SQL принимается,
+        # только если за время запроса показания датчика не записывались
+        self._writes = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def write_counter(self, sensor_id):
+        """Отметка перед запросом к БД для offer"""
+        return self._generation, self._writes.get(sensor_id, 0)
+
+    def on_readings(self, written):
+        """Обработчик записанных показаний (см. IngestService.add_listener)"""
+        import numpy as np
+
+        by_sensor = {}
+        for sensor_id, timestamp, value, is_alert, reading_id, unit in written:
+            by_sensor.setdefault(sensor_id, []).append((datetime_to_us(timestamp), value, reading_id, is_alert, unit))
+
+        with self._lock:
+            for sensor_id, rows in by_sensor.items():
+                self._writes[sensor_id] = self._writes.get(sensor_id, 0) + 1
+                ring = self._rings.get(sensor_id)
+                if ring is None:
+                    continue
+                t, v, ids, alerts, units = zip(*rows)
+                ring.extend(
+                    np.array(t, dtype=np.int64), np.array(v, dtype=np.float64), np.array(ids, dtype=np.int64),
+                    np.array(alerts, dtype=bool), np.array(ring.unit_codes(units), dtype=np.uint16)
+                )
+
+    def get_window(self, sensor_id, start_time, end_time):
+        """Столбцы показаний за период из памяти или None (период не покрыт буфером)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            ring = self._rings.get(sensor_id)
+            columns = ring.window(datetime_to_us(start_time), datetime_to_us(end_time)) if ring is not None else None
+            if columns is not None:
+                self._rings.move_to_end(sensor_id)
+        metrics.reading_buffer_requests_total.inc(result='miss' if columns is None else 'hit')
+        return columns
+
+    def offer(self, sensor_id, start_time, columns, write_counter):
+        """
+        Сохраняет в буфер показания за период, прочитанные из БД
+
+        Args:
+            start_time (datetime): начало периода запроса (буфер покрывает время с него)
+            columns (dict): столбцы показаний за период до текущего момента (см. get_readings_columns)
+            write_counter (tuple): write_counter(sensor_id) до запроса к БД
+        """
+        import numpy as np
+
+        # Периоды длиннее READING_BUFFER_HOURS (с запасом на время запроса) не сохраняются
+        if not self.enabled or start_time < datetime.utcnow() - timedelta(hours=self.hours, minutes=1):
+            return
+
+        count = len(columns['v'])
+        capacity = min(self.max_points, max(MIN_CAPACITY, int(count * CAPACITY_RESERVE)))
+        if count > capacity or capacity * ROW_BYTES > self.max_bytes:
+            return
+
+        ring = SensorRing(capacity, datetime_to_us(start_time))
+        ring.extend(
+            columns['t'].astype('datetime64[us]').view(np.int64), columns['v'], columns['id'],
+            columns['is_alert'], np.array(ring.unit_codes(columns['unit']), dtype=np.uint16)
+        )
+
+        with self._lock:
+            if self.write_counter(sensor_id) != write_counter:
+                return
+            previous = self._rings.pop(sensor_id, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._rings[sensor_id] = ring
+            self.nbytes += ring.nbytes
+
+            evicted = 0
+            while self.nbytes > self.max_bytes and len(self._rings) > 1:
+                _, oldest = self._rings.popitem(last=False)
+                self.nbytes -= oldest.nbytes
+                evicted += 1
+            sensors = len(self._rings)
+            nbytes = self.nbytes
+
+        if evicted:
+            metrics.reading_buffer_evictions_total.inc(evicted)
+        metrics.reading_buffer_bytes.set(nbytes)
+        metrics.reading_buffer_sensors.set(sensors)
+
+    @property
+    def full(self):
+        return self.nbytes >= self.max_bytes
+
+    def clear(self):
+        """Сбрасывает буферы (после записи показаний в обход IngestService)"""
+        with self._lock:
+            self._rings.clear()
+            self._generation += 1
+            self.nbytes = 0
+        metrics.reading_buffer_bytes.set(0)
+        metrics.reading_buffer_sensors.set(0)
+
+    def status(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sensors': len(self._rings),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'points': sum(ring.size for ring in self._rings.values()),
+                'hours': self.hours
+            }
+
+
+reading_buffer = ReadingBufferRegistry()
+
+
+def init_reading_buffer(app, ingest_in_process):
+    """
+    Включает буферы последних показаний и прогревает их в фоновом потоке
+
+    Args:
+        app (Flask): Приложение Flask
+        ingest_in_process (bool): показания MQTT принимает этот процесс
+    """
+    if READING_BUFFER == '0' or (READING_BUFFER == 'auto' and not ingest_in_process):
+        return
+
+    reading_buffer.enabled = True
+    IngestService.add_listener(reading_buffer.on_readings)
+
+    def warm_up():
+        from server.models.sensor_data import Sensor
+        from server.services.data_service import DataService
+
+        with app.app_context():
+            try:
+                # Промах запроса за READING_BUFFER_HOURS сохраняет результат SQL в буфер
+                sensor_ids = [sensor_id for sensor_id, in Sensor.query.with_entities(Sensor.id).order_by(Sensor.id)]
+                for sensor_id in sensor_ids:
+                    if reading_buffer.full:
+                        break
+                    DataService.get_readings_columns(sensor_id, reading_buffer.hours)
+                logger.info(f"Буферы показаний прогреты: {reading_buffer.status()}")
+            except Exception as e:
+                logger.error(f"Ошибка прогрева буферов показаний: {e}")
+
+    threading.Thread(target=warm_up, name='geo-reading-buffer-warmup', daemon=True).start()
@@ -0,0 +1,285 @@
+# server/services/resampling.py
+#
+# Регулярная сетка и пропуски в показаниях. Показания датчиков приходят
+# неравномерно и с перерывами, а сглаживающие методы аппроксимации (скользящее
+# среднее, Савицкий-Голей) предполагают равномерный шаг. Сетка строится по
+# столбцам показаний векторно: номер ячейки - целочисленным делением времени,
+# среднее и количество - np.bincount, заполнение пустых ячеек - np.interp или
+# np.searchsorted. Ячейки выровнены по кратным шагу от начала эпохи, поэтому
+# сетки разных датчиков с одним шагом совпадают.
+
+import re
+from datetime import datetime, timedelta
+from server.config import RESAMPLE_MAX_POINTS, GAP_FACTOR
+from server.services.data_service import DataService
+
+# Заполнение пустых ячеек: линейная интерполяция между соседними, последнее значение или пропуск (null)
+FILL_METHODS = ('linear', 'ffill', 'none')
+
+_INTERVAL_UNITS = {'s': 1, 'min': 60, 'h': 3600, 'd': 86400}
+_INTERVAL_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)\s*(s|min|h|d)?$')
+
+
+def parse_interval(value):
+    """
+    Интервал из параметра запроса ('30s', '5min', '1h', '1d'; число - секунды)
+
+    Returns:
+        float: секунды (ValueError для неверного или нулевого интервала)
+    """
+    match = _INTERVAL_PATTERN.match(str(value).strip())
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"Неверный интервал: {value}. Примеры: 30s, 5min, 1h, 1d")
+    return float(match.group(1)) * _INTERVAL_UNITS[match.group(2) or 's']
+
+
+def _to_us(timestamps):
+    import numpy as np
+
+    return timestamps.astype('datetime64[us]').view(np.int64)
+
+
+def _clip(t_us, start_us, end_us):
+    """Границы среза [lo, hi) отсортированного времени по периоду (None - без границы)"""
+    import numpy as np
+
+    lo = 0 if start_us is None else int(np.searchsorted(t_us, start_us, side='left'))
+    hi = len(t_us) if end_us is None else int(np.searchsorted(t_us, end_us, side='right'))
+    return lo, hi
+
+
+def resample(t, v, step, fill='linear', alerts=None, start=None, end=None, max_points=RESAMPLE_MAX_POINTS):
+    """
+    Показания на регулярной сетке: среднее по ячейкам шириной step
+
+    Args:
+        t (ndarray): время datetime64, по возрастанию
+        v (ndarray): значения
+        step (float): шаг сетки, секунды
+        fill (str): заполнение пустых ячеек (FILL_METHODS); linear не продлевает
+                    ряд за первое и последнее показание
+        alerts (ndarray): признаки тревоги показаний (bool) или None
+        start, end (datetime64): границы сетки (None - по первому и последнему показанию)
+        max_points (int): предел ячеек (ValueError, если сетка длиннее)
+
+    Returns:
+        dict: t (datetime64[us], начало ячейки), v (float64, NaN - нет значения),
+              count (показаний в ячейке), is_alert (тревога в ячейке), filled (значение заполнено),
+              step (секунды)
+    """
+    import numpy as np
+
+    step_us = int(round(step * 1e6))
+    if step_us <= 0:
+        raise ValueError('Шаг сетки должен быть больше нуля')
+
+    t_us = _to_us(t)
+    start_us = None if start is None else int(_to_us(np.asarray(start)))
+    end_us = None if end is None else int(_to_us(np.asarray(end)))
+    lo, hi = _clip(t_us, start_us, end_us)
+    t_us, v = t_us[lo:hi], np.asarray(v, dtype=np.float64)[lo:hi]
+
+    first = start_us if start_us is not None else (int(t_us[0]) if len(t_us) else None)
+    last = end_us if end_us is not None else (int(t_us[-1]) if len(t_us) else None)
+    if first is None or last is None or last < first:
+        empty = np.empty(0, dtype=np.int64)
+        return {
+            't': empty.view('datetime64[us]'), 'v': np.empty(0), 'count': empty,
+            'is_alert': np.empty(0, dtype=bool), 'filled': np.empty(0, dtype=bool), 'step': step
+        }
+
+    origin = first // step_us * step_us
+    bins = (last - origin) // step_us + 1
+    if bins > max_points:
+        raise ValueError(f'Сетка из {bins} точек длиннее предела {max_points}: увеличьте шаг или сократите период')
+
+    index = (t_us - origin) // step_us
+    count = np.bincount(index, minlength=bins)
+    sums = np.bincount(index, weights=v, minlength=bins)
+    occupied = count > 0
+    values = np.full(bins, np.nan)
+    values[occupied] = sums[occupied] / count[occupied]
+
+    if alerts is not None:
+        alert_counts = np.bincount(index, weights=np.asarray(alerts, dtype=np.float64)[lo:hi], minlength=bins)
+        is_alert = alert_counts > 0
+    else:
+        is_alert = np.zeros(bins, dtype=bool)
+
+    filled = np.zeros(bins, dtype=bool)
+    known = np.flatnonzero(occupied)
+    if fill != 'none' and len(known) and len(known) < bins:
+        positions = np.arange(bins)
+        if fill == 'linear':
+            filled = ~occupied & (positions > known[0]) & (positions < known[-1])
+            values[filled] = np.interp(positions[filled], known, values[known])
+        else:
+            # Номер последней непустой ячейки не позже текущей
+            previous = np.searchsorted(known, positions, side='right') - 1
+            filled = ~occupied & (previous >= 0)
+            values[filled] = values[known[previous[filled]]]
+
+    grid = origin + np.arange(bins, dtype=np.int64) * step_us
+    return {
+        't': grid.view('datetime64[us]'), 'v': values, 'count': count,
+        'is_alert': is_alert, 'filled': filled, 'step': step
+    }
+
+
+def find_gaps(t, start=None, end=None, min_gap=None, factor=GAP_FACTOR):
+    """
+    Пропуски в показаниях: перерывы дольше min_gap или factor медианных интервалов
+
+    Начало и конец периода считаются границами: молчание до первого показания
+    и после последнего тоже пропуск. Без показаний за период весь период - пропуск,
+    с одним показанием (интервал неизвестен, min_gap не задан) - все время до и после него.
+
+    Args:
+        t (ndarray): время datetime64, по возрастанию
+        start, end (datetime64): период (None - от первого до последнего показания)
+        min_gap (float): порог, секунды (None - по медианному интервалу)
+        factor (float): порог в медианных интервалах
+
+    Returns:
+        dict: start, end (datetime64[us]), duration (секунды), missing (примерно пропущено
+              показаний, если интервал известен) - массивы по пропускам; expected_interval,
+              threshold (секунды или None), readings, total_seconds, coverage (доля периода без пропусков)
+    """
+    import numpy as np
+
+    t_us = _to_us(t)
+    start_us = None if start is None else int(_to_us(np.asarray(start)))
+    end_us = None if end is None else int(_to_us(np.asarray(end)))
+    lo, hi = _clip(t_us, start_us, end_us)
+    t_us = t_us[lo:hi]
+
+    interval = float(np.median(np.diff(t_us))) / 1e6 if len(t_us) >= 2 else None
+    threshold = min_gap if min_gap is not None else (factor * interval if interval else None)
+
+    bounds = t_us
+    if start_us is not None:
+        bounds = np.concatenate(([start_us], bounds))
+    if end_us is not None:
+        bounds = np.concatenate((bounds, [end_us]))
+
+    if not len(t_us) and start_us is not None and end_us is not None:
+        gap_index = np.zeros(1, dtype=np.int64)
+    elif len(bounds) < 2:
+        gap_index = np.empty(0, dtype=np.int64)
+    elif threshold is None:
+        # Меньше двух показаний - интервал неизвестен: время периода до и после показания - пропуск
+        gap_index = np.flatnonzero(np.diff(bounds) > 0)
+    else:
+        gap_index = np.flatnonzero(np.diff(bounds) > threshold * 1e6)
+
+    gap_start = bounds[gap_index] if len(gap_index) else np.empty(0, dtype=np.int64)
+    gap_end = bounds[gap_index + 1] if len(gap_index) else np.empty(0, dtype=np.int64)
+    duration = (gap_end - gap_start) / 1e6
+    if interval:
+        missing = np.maximum(np.rint(duration / interval).astype(np.int64) - 1, 0)
+    else:
+        missing = np.zeros(len(duration), dtype=np.int64)
+
+    period = (bounds[-1] - bounds[0]) / 1e6 if len(bounds) >= 2 else 0.0
+    total = float(duration.sum())
+    return {
+        'start': gap_start.view('datetime64[us]'),
+        'end': gap_end.view('datetime64[us]'),
+        'duration': duration,
+        'missing': missing,
+        'expected_interval': interval,
+        'threshold': threshold,
+        'readings': len(t_us),
+        'total_seconds': total,
+        'coverage': float(max(0.0, 1.0 - total / period)) if period > 0 else (1.0 if len(t_us) else 0.0)
+    }
+
+
+def gaps_payload(gaps, ts_format='iso'):
+    """Отчет find_gaps для JSON: пропуски списком объектов"""
+    from server.utils.serialization import format_timestamps
+
+    rows = [
+        {'start': start, 'end': end, 'duration_seconds': duration, 'missing_readings': missing}
+        for start, end, duration, missing in zip(
+            format_timestamps(gaps['start'], ts_format), format_timestamps(gaps['end'], ts_format),
+            gaps['duration'].tolist(), gaps['missing'].tolist()
+        )
+    ]
+    return {
+        'readings': gaps['readings'],
+        'expected_interval': gaps['expected_interval'],
+        'threshold': gaps['threshold'],
+        'count': len(rows),
+        'total_seconds': gaps['total_seconds'],
+        'coverage': gaps['coverage'],
+        'gaps': rows
+    }
+
+
+class ResamplingService:
+    """Показания на регулярной сетке и отчеты о пропусках"""
+
+    @staticmethod
+    def get_resampled(sensor_id, hours_back, step, fill='linear'):
+        """
+        Показания датчика за последние hours_back часов на сетке с шагом step
+
+        Returns:
+            tuple: (resample(...), единица измерения или None)
+        """
+        import numpy as np
+
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours_back)
+        # Сетка - по запрошенному периоду: показания вне его (расширение до последних 100 записей) отсекаются
+        columns = DataService.get_readings_columns(sensor_id, hours_back)
+        series = resample(columns['t'], columns['v'], step, fill, alerts=columns['is_alert'],
+                          start=np.datetime64(start_time, 'us'), end=np.datetime64(end_time, 'us'))
+        return series, columns['unit'][0] if columns['unit'] else None
+
+    @staticmethod
+    def get_sensor_gaps(sensor_id, hours_back=24, min_gap=None, ts_format='iso'):
+        """Пропуски в показаниях датчика за последние hours_back часов"""
+        import numpy as np
+
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours_back)
+        # Показания за период без расширения до последних 100 записей (лишнее отсекается по времени)
+        columns = DataService.get_readings_columns(sensor_id, hours_back)
+        gaps = find_gaps(columns['t'], np.datetime64(start_time, 'us'), np.datetime64(end_time, 'us'), min_gap)
+
+        report = gaps_payload(gaps, ts_format)
+        report['sensor_id'] = sensor_id
+        report['hours'] = hours_back
+        return report
+
+    @staticmethod
+    def get_gaps(sensor_ids, hours_back=24, min_gap=None, ts_format='iso'):
+        """
+        Пропуски по нескольким датчикам: одна выгрузка показаний, ряды датчиков -
+        срезы отсортированного массива (границы через np.searchsorted)
+
+        Returns:
+            list: отчеты gaps_payload по датчикам (с sensor_id), худшее покрытие - первым
+        """
+        import numpy as np
+
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours_back)
+        array, _ = DataService.export_readings(sensor_ids, start_time, end_time)
+
+        sensor_ids = np.asarray(sorted(sensor_ids), dtype=np.int64)
+        lows = np.searchsorted(array['sensor_id'], sensor_ids, side='left')
+        highs = np.searchsorted(array['sensor_id'], sensor_ids, side='right')
+        times = array['t'].view('datetime64[us]')
+        start, end = np.datetime64(start_time, 'us'), np.datetime64(end_time, 'us')
+
+        reports = []
+        for sensor_id, lo, hi in zip(sensor_ids.tolist(), lows.tolist(), highs.tolist()):
+            report = gaps_payload(find_gaps(times[lo:hi], start, end, min_gap), ts_format)
+            report['sensor_id'] = sensor_id
+            reports.append(report)
+
+        reports.sort(key=lambda report: (report['coverage'], report['sensor_id']))
+        return reports
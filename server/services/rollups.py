@@ -0,0 +1,118 @@
+# server/services/rollups.py
+#
+# Часовые агрегаты показаний (таблица reading_rollup): количество, сумма,
+# минимум и максимум по датчику и часу. Таблица обновляется в транзакции
+# записи показаний (upsert по ключу (sensor_id, bucket)), поэтому агрегаты
+# с корзиной, кратной часу, читают одну строку на датчик и час вместо всех
+# показаний. bucket - начало часа в секундах Unix, не зависит от режима
+# GEO_TIMESTAMP_STORAGE.
+
+import logging
+from server.database.timestamps import epoch_us_sql
+from server.monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ширина корзины агрегатов, секунды
+ROLLUP_SECONDS = 3600
+
+_UPSERT = """
+    INSERT INTO reading_rollup (sensor_id, bucket, count, total, min_value, max_value)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+        count = count + excluded.count,
+        total = total + excluded.total,
+        min_value = MIN(min_value, excluded.min_value),
+        max_value = MAX(max_value, excluded.max_value)
+"""
+
+
+class RollupService:
+    """Поддержка часовых агрегатов при записи показаний"""
+
+    @staticmethod
+    def apply(cursor, readings):
+        """
+        Добавляет новые показания в часовые агрегаты (в транзакции их записи)
+
+        Args:
+            cursor: курсор sqlite3
+            readings (iterable): кортежи (sensor_id, время в мкс Unix, value) - только
+                                 действительно вставленные показания, порядок любой
+
+        Returns:
+            int: количество затронутых строк reading_rollup
+        """
+        bucket_us = ROLLUP_SECONDS * 1000000
+        buckets = {}
+        for sensor_id, timestamp, value in readings:
+            key = (sensor_id, timestamp // bucket_us * ROLLUP_SECONDS)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [1, value, value, value]
+            else:
+                bucket[0] += 1
+                bucket[1] += value
+                if value < bucket[2]:
+                    bucket[2] = value
+                if value > bucket[3]:
+                    bucket[3] = value
+
+        if buckets:
+            cursor.executemany(_UPSERT, [key + tuple(bucket) for key, bucket in buckets.items()])
+            metrics.rollup_updates_total.inc(len(buckets))
+        return len(buckets)
+
+    @staticmethod
+    def rebuild(cursor, sensor_ids=None):
+        """
+        Пересчитывает агрегаты по истории показаний (после записи в обход
+        IngestService и для существующей БД) одним GROUP BY
+
+        Args:
+            cursor: курсор sqlite3 (вызывающий фиксирует транзакцию)
+            sensor_ids (list): датчики (None - все)
+
+        Returns:
+            int: количество строк reading_rollup
+        """
+        from server.services.ingest_service import SQLITE_MAX_VARIABLES
+
+        select = f"""
+            INSERT INTO reading_rollup (sensor_id, bucket, count, total, min_value, max_value)
+            SELECT sensor_id, {epoch_us_sql()} / {ROLLUP_SECONDS * 1000000} * {ROLLUP_SECONDS} AS bucket,
+                   COUNT(*), SUM(value), MIN(value), MAX(value)
+            FROM sensor_reading
+        """
+        if sensor_ids is None:
+            cursor.execute("DELETE FROM reading_rollup")
+            cursor.execute(select + " GROUP BY sensor_id, bucket")
+            return cursor.rowcount
+
+        total = 0
+        sensor_ids = sorted(sensor_ids)
+        for start in range(0, len(sensor_ids), SQLITE_MAX_VARIABLES):
+            chunk = sensor_ids[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"DELETE FROM reading_rollup WHERE sensor_id IN ({placeholders})", chunk)
+            cursor.execute(select + f" WHERE sensor_id IN ({placeholders}) GROUP BY sensor_id, bucket", chunk)
+            total += cursor.rowcount
+        return total
+
+
+def ensure_rollups(connection):
+    """
+    Заполняет reading_rollup по истории, если таблица пуста, а показания есть
+    (первый запуск после ее появления)
+
+    Args:
+        connection: соединение SQLAlchemy
+    """
+    if connection.exec_driver_sql("SELECT 1 FROM reading_rollup LIMIT 1").fetchone():
+        return
+    if not connection.exec_driver_sql("SELECT 1 FROM sensor_reading LIMIT 1").fetchone():
+        return
+
+    count = RollupService.rebuild(connection.connection.cursor())
+    connection.commit()
+    logger.info(f"Часовые агрегаты показаний восстановлены по истории: {count}")
@@ -0,0 +1,364 @@
+# server/services/seed_service.py
+#
+# Заполнение БД тестовыми данными: здания, датчики и история показаний
+# Запуск вручную: python -m server.services.seed_service --buildings 10 --sensors 20 --days 30 --rate 60
+
+import argparse
+import itertools
+import logging
+import multiprocessing
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from server.config import SQLITE_DB_PATH, SEED_WORKERS, SEED_BATCH_SIZE
+from server.database.db import db
+from server.database.timestamps import datetime64_to_db
+from server.models.sensor_data import AlertConfig
+from server.services.alert_events import AlertEventService
+from server.services.rollups import RollupService
+from server.services.online_stats import stats_registry
+from server.services.trend_tracker import trend_registry
+from server.services.reading_buffer import reading_buffer
+from server.utils.cache import versions, sensor_data_version
+from server.utils.data_generator import DataGenerator
+
+logger = logging.getLogger(__name__)
+
+# Масштаб по умолчанию - как у прежнего синхронного /init-sample-data:
+# 3 здания по 3 датчика, 2 дня истории, показание раз в 2 часа
+DEFAULT_SCALE = {'buildings': 3, 'sensors_per_building': 3, 'days': 2, 'rate': 0.5}
+
+# Допустимые пределы масштаба: (минимум, максимум)
+SCALE_LIMITS = {
+    'buildings': (1, 1000),
+    'sensors_per_building': (1, 1000),
+    'days': (0.01, 3650),
+    'rate': (0.01, 3600),          # показаний в час на датчик
+    'workers': (1, 64)
+}
+
+# Генерация запускается из потока задачи внутри сервера Flask: fork скопировал бы
+# блокировки, которые в этот момент держат другие потоки, поэтому процессы пула -
+# через forkserver (или spawn)
+_POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+_jobs_lock = threading.Lock()
+_current_job = None
+
+
+def validate_scale(scale):
+    """Проверяет масштаб заполнения (словарь из SCALE_LIMITS), ValueError при выходе за пределы"""
+    for name, value in scale.items():
+        low, high = SCALE_LIMITS[name]
+        if value is None or not low <= value <= high:
+            raise ValueError(f'{name} должен быть в диапазоне {low}..{high}')
+
+
+def _generate_sensor(sensor_id, sensor_type, thresholds, start_time, end_time, count, seed):
+    """
+    Ряд показаний одного датчика в виде, готовом для записи (выполняется в процессе пула)
+
+    Случайный генератор зависит только от seed и sensor_id, поэтому данные
+    не меняются от числа процессов.
+
+    Returns:
+        tuple: (sensor_id, время в формате хранения, значения, флаги тревоги, единица) - списки
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(None if seed is None else [seed, sensor_id])
+    timestamps, values, unit = DataGenerator.generate_series(sensor_type, start_time, end_time, count, rng)
+
+    min_threshold, max_threshold = thresholds
+    alerts = np.zeros(count, dtype=bool)
+    if min_threshold is not None:
+        alerts |= values < min_threshold
+    if max_threshold is not None:
+        alerts |= values > max_threshold
+
+    return sensor_id, datetime64_to_db(timestamps), values.tolist(), alerts.astype(np.int8).tolist(), unit
+
+
+def _iter_series(tasks, workers):
+    """
+    Ряды датчиков по мере готовности
+
+    В пуле одновременно не больше 2 * workers задач: готовые ряды ждут
+    писателя в памяти, поэтому генерация не должна сильно его опережать.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _generate_sensor(*task)
+        return
+
+    tasks = iter(tasks)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT) as pool:
+        pending = deque(pool.submit(_generate_sensor, *task) for task in itertools.islice(tasks, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            task = next(tasks, None)
+            if task is not None:
+                pending.append(pool.submit(_generate_sensor, *task))
+            yield result
+
+
+class SeedJob:
+    """Состояние заполнения (обновляется писателем, читается эндпоинтом статуса)"""
+
+    def __init__(self, scale, sensor_count, readings_total):
+        self.id = uuid.uuid4().hex[:12]
+        self.scale = scale
+        self.status = 'pending'          # pending, running, done, failed
+        self.sensors_total = sensor_count
+        self.sensors_done = 0
+        self.readings_total = readings_total
+        self.readings_written = 0
+        self.readings_skipped = 0        # уже были в БД (INSERT OR IGNORE)
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+        self.error = None
+        self._started = None
+        self._elapsed = None
+        self._finished = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in ('pending', 'running')
+
+    def wait(self, timeout=None):
+        """Ожидает завершения; True, если заполнение закончилось"""
+        return self._finished.wait(timeout)
+
+    def to_dict(self):
+        if self._elapsed is not None:
+            elapsed = self._elapsed
+        elif self._started is not None:
+            elapsed = time.monotonic() - self._started
+        else:
+            elapsed = 0.0
+
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'scale': self.scale,
+            'sensors': {'total': self.sensors_total, 'done': self.sensors_done},
+            'readings': {'total': self.readings_total, 'written': self.readings_written, 'skipped': self.readings_skipped},
+            'progress': round((self.readings_written + self.readings_skipped) / self.readings_total, 4)
+                        if self.readings_total else 1.0,
+            'elapsed_seconds': round(elapsed, 3),
+            'readings_per_second': round(self.readings_written / elapsed) if elapsed > 0 else None,
+            'created_at': self.created_at.isoformat() + 'Z',
+            'finished_at': self.finished_at.isoformat() + 'Z' if self.finished_at else None,
+            'error': self.error
+        }
+
+
+class SeedService:
+    """Фоновое заполнение БД: генерация рядов в пуле процессов, запись одним писателем"""
+
+    @staticmethod
+    def create_metadata(buildings, sensors_per_building):
+        """
+        Здания, настройки тревог и датчики через ORM (их немного - создаются сразу)
+
+        Returns:
+            tuple: (список (sensor_id, sensor_type), пороги {тип: (min, max)})
+        """
+        building_objs = DataGenerator.generate_sample_buildings(count=buildings)
+        db.session.add_all(building_objs)
+        if AlertConfig.query.first() is None:
+            db.session.add_all(DataGenerator.generate_alert_configs())
+        db.session.commit()
+
+        sensors = DataGenerator.generate_sample_sensors(building_objs, count_per_building=sensors_per_building)
+        db.session.add_all(sensors)
+        db.session.commit()
+
+        # При нескольких настройках на тип берем первую, как и при записи показаний
+        thresholds = {}
+        for config in AlertConfig.query.order_by(AlertConfig.id):
+            thresholds.setdefault(config.sensor_type, (config.min_threshold, config.max_threshold))
+
+        return [(sensor.id, sensor.sensor_type) for sensor in sensors], thresholds
+
+    @staticmethod
+    def write_series(job, sensor_rows, thresholds, start_time, end_time, count,
+                     workers=SEED_WORKERS, seed=None, db_path=None, batch_size=SEED_BATCH_SIZE):
+        """
+        Генерирует ряды датчиков в пуле процессов и записывает их одним
+        соединением SQLite транзакциями по batch_size показаний
+        """
+        tasks = [
+            (sensor_id, sensor_type, thresholds.get(sensor_type, (None, None)), start_time, end_time, count, seed)
+            for sensor_id, sensor_type in sensor_rows
+        ]
+
+        conn = sqlite3.connect(db_path or SQLITE_DB_PATH, timeout=10.0)
+        try:
+            for sensor_id, timestamps, values, alerts, unit in _iter_series(tasks, workers):
+                for start in range(0, len(values), batch_size):
+                    end = start + batch_size
+                    with conn:
+                        cursor = conn.executemany(
+                            "INSERT OR IGNORE INTO sensor_reading (sensor_id, timestamp, value, unit, is_alert) VALUES (?, ?, ?, ?, ?)",
+                            zip(itertools.repeat(sensor_id), timestamps[start:end], values[start:end],
+                                itertools.repeat(unit), alerts[start:end])
+                        )
+                    # Показаний/с - только по действительно вставленным, повторы ключа считаются отдельно
+                    job.readings_written += cursor.rowcount
+                    job.readings_skipped += len(values[start:end]) - cursor.rowcount
+                # Инциденты тревог и часовые агрегаты по записанному ряду (запись идет в обход IngestService)
+                with conn:
+                    AlertEventService.rebuild(conn.cursor(), [sensor_id])
+                    RollupService.rebuild(conn.cursor(), [sensor_id])
+                job.sensors_done += 1
+        finally:
+            conn.close()
+
+    @staticmethod
+    def refresh_derived(sensor_ids):
+        """
+        Онлайн-статистика, тренды и версии кэшей по записанной истории - одним
+        проходом, а не обработчиками записи на каждое показание
+        """
+        stats_registry.bootstrap()
+        if not stats_registry.enabled:
+            # Статистику в памяти этот процесс не отдает - сразу в sensor_stats
+            stats_registry.persist()
+        if trend_registry.enabled:
+            trend_registry.warm_up()
+        reading_buffer.clear()
+        versions.bump('readings', *(sensor_data_version(sensor_id) for sensor_id in sensor_ids))
+
+    @staticmethod
+    def _run(app, job, sensor_rows, thresholds, count, workers, seed, refresh):
+        job.status = 'running'
+        job._started = time.monotonic()
+        try:
+            # История заканчивается текущим моментом - без разрыва с данными симулятора
+            end_time = datetime.utcnow()
+            start_time = end_time - timedelta(days=job.scale['days'])
+
+            SeedService.write_series(job, sensor_rows, thresholds, start_time, end_time, count, workers, seed)
+            if refresh:
+                with app.app_context():
+                    SeedService.refresh_derived([sensor_id for sensor_id, _ in sensor_rows])
+            job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error(f"Ошибка заполнения тестовыми данными: {e}")
+        finally:
+            job._elapsed = time.monotonic() - job._started
+            job.finished_at = datetime.utcnow()
+            job._finished.set()
+
+        if job.status == 'done':
+            logger.info(f"Тестовые данные: {job.readings_written} показаний для {job.sensors_total} датчиков "
+                        f"за {job._elapsed:.1f} с")
+
+    @staticmethod
+    def start(app, buildings=DEFAULT_SCALE['buildings'], sensors_per_building=DEFAULT_SCALE['sensors_per_building'],
+              days=DEFAULT_SCALE['days'], rate=DEFAULT_SCALE['rate'], workers=SEED_WORKERS, seed=None, refresh=True):
+        """
+        Создает здания и датчики и запускает генерацию истории в фоновом потоке
+        (вызывается в контексте приложения)
+
+        Args:
+            buildings (int): количество зданий
+            sensors_per_building (int): датчиков в здании
+            days (float): глубина истории, дни
+            rate (float): показаний в час на датчик
+            workers (int): процессы генерации рядов
+            seed (int): зерно генератора (None - случайные данные)
+            refresh (bool): обновить статистику, тренды и кэши процесса после записи
+
+        Returns:
+            SeedJob: состояние заполнения (RuntimeError, если заполнение уже идет)
+        """
+        global _current_job
+
+        scale = {'buildings': buildings, 'sensors_per_building': sensors_per_building, 'days': days, 'rate': rate}
+        validate_scale(dict(scale, workers=workers))
+
+        with _jobs_lock:
+            if _current_job is not None and _current_job.active:
+                raise RuntimeError('Заполнение тестовыми данными уже выполняется')
+
+            sensor_rows, thresholds = SeedService.create_metadata(buildings, sensors_per_building)
+            count = max(1, int(days * 24 * rate))
+            job = _current_job = SeedJob(scale, len(sensor_rows), count * len(sensor_rows))
+
+        threading.Thread(
+            target=SeedService._run, args=(app, job, sensor_rows, thresholds, count, workers, seed, refresh),
+            name='geo-seed', daemon=True
+        ).start()
+        return job
+
+    @staticmethod
+    def get_job():
+        """Последнее запущенное заполнение (или None)"""
+        return _current_job
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Заполнение БД тестовыми данными (БД из GEO_MONITORING_DB, данные добавляются к существующим)'
+    )
+    parser.add_argument('--buildings', type=int, default=DEFAULT_SCALE['buildings'], help='Количество зданий')
+    parser.add_argument('--sensors', type=int, default=DEFAULT_SCALE['sensors_per_building'], help='Датчиков в здании')
+    parser.add_argument('--days', type=float, default=DEFAULT_SCALE['days'], help='Глубина истории, дни')
+    parser.add_argument('--rate', type=float, default=DEFAULT_SCALE['rate'], help='Показаний в час на датчик')
+    parser.add_argument('--workers', type=int, default=SEED_WORKERS, help='Процессы генерации рядов')
+    parser.add_argument('--seed', type=int, default=None, help='Зерно генератора')
+    args = parser.parse_args()
+
+    from flask import Flask
+    from server.config import SQLALCHEMY_DATABASE_URI
+    from server.database.db import init_db
+    import server.models.sensor_data  # noqa: F401 - модели для create_all
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
+    init_db(app)
+
+    # Тренды и буферы сервер построит по истории при старте
+    with app.app_context():
+        try:
+            job = SeedService.start(app, args.buildings, args.sensors, args.days, args.rate,
+                                    args.workers, args.seed, refresh=False)
+        except ValueError as e:
+            parser.error(str(e))
+
+    print(f'БД: {SQLITE_DB_PATH}', file=sys.stderr)
+    while not job.wait(1.0):
+        state = job.to_dict()
+        print(f"\r{state['progress'] * 100:5.1f}%  датчиков {state['sensors']['done']}/{state['sensors']['total']}  "
+              f"показаний {state['readings']['written']}/{state['readings']['total']}  "
+              f"{state['readings_per_second'] or 0} показаний/с", end='', file=sys.stderr)
+    print(file=sys.stderr)
+
+    state = job.to_dict()
+    if state['status'] != 'done':
+        print(f"Ошибка: {state['error']}", file=sys.stderr)
+        sys.exit(1)
+
+    # Сохраненная статистика загружается сервером как есть, без пересчета по
+    # истории, - пересчитываем ее здесь с учетом записанных показаний
+    with app.app_context():
+        stats_registry.bootstrap()
+    stats_registry.persist()
+    print(f"Записано {state['readings']['written']} показаний для {state['sensors']['total']} датчиков "
+          f"за {state['elapsed_seconds']} с ({state['readings_per_second']} показаний/с), "
+          f"пропущено повторов {state['readings']['skipped']}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
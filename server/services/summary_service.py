@@ -0,0 +1,210 @@
+# server/services/summary_service.py
+
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from server.config import SUMMARY_CACHE_TTL, SUMMARY_MIN_REFRESH
+from server.database.db import db
+from server.database.timestamps import to_db, from_db
+from server.services.ingest_service import IngestService
+from server.utils.cache import VersionedCache, versions
+
+# Сводки зависят от показаний, найденных аномалий и метаданных
+SUMMARY_DEPENDENCIES = ('readings', 'anomalies', 'metadata')
+
+_summary_cache = VersionedCache(versions, max_entries=32)
+
+
+def _iso(value):
+    """Время из БД (строка SQLite или микросекунды) в ISO с 'Z'"""
+    value = from_db(value)
+    return value.isoformat() + 'Z' if value is not None else None
+
+
+class SummaryService:
+    """Сводки по зданиям: фиксированное число агрегирующих запросов на все здания"""
+
+    @staticmethod
+    def _sensor_counts():
+        return db.session.execute(text("""
+            SELECT building_id, sensor_type, status, COUNT(*)
+            FROM sensor
+            GROUP BY building_id, sensor_type, status
+        """)).fetchall()
+
+    @staticmethod
+    def _current_state():
+        """
+        Последнее показание каждого датчика и самый нагруженный датчик здания
+
+        Нагрузка - положение значения относительно порогов: 1.0 - на пороге,
+        больше 1 - за порогом (для двух порогов - от середины коридора).
+        """
+        return db.session.execute(text("""
+            WITH latest AS (
+                -- В SQLite значения берутся из строки с MAX(timestamp)
+                SELECT sensor_id, MAX(timestamp) AS timestamp, value, is_alert
+                FROM sensor_reading
+                GROUP BY sensor_id
+            ),
+            config AS (
+                SELECT sensor_type, min_threshold, max_threshold, unit
+                FROM alert_config
+                WHERE id IN (SELECT MIN(id) FROM alert_config GROUP BY sensor_type)
+            ),
+            scored AS (
+                SELECT s.building_id, s.id AS sensor_id, s.name, s.sensor_type,
+                       l.value, l.timestamp, l.is_alert, c.min_threshold, c.max_threshold, c.unit,
+                       CASE
+                           WHEN c.min_threshold IS NOT NULL AND c.max_threshold > c.min_threshold
+                               THEN ABS(l.value - (c.max_threshold + c.min_threshold) / 2.0)
+                                    / ((c.max_threshold - c.min_threshold) / 2.0)
+                           WHEN c.max_threshold > 0 THEN l.value / c.max_threshold
+                           WHEN c.min_threshold < 0 THEN l.value / c.min_threshold
+                       END AS load_ratio
+                FROM sensor s
+                JOIN latest l ON l.sensor_id = s.id
+                LEFT JOIN config c ON c.sensor_type = s.sensor_type
+            ),
+            ranked AS (
+                SELECT *,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY building_id ORDER BY load_ratio IS NULL, load_ratio DESC
+                       ) AS rank,
+                       COUNT(*) OVER (PARTITION BY building_id) AS reporting,
+                       SUM(is_alert) OVER (PARTITION BY building_id) AS in_alert,
+                       MAX(timestamp) OVER (PARTITION BY building_id) AS last_reading_at
+                FROM scored
+            )
+            SELECT building_id, reporting, in_alert, last_reading_at,
+                   sensor_id, name, sensor_type, value, unit, timestamp, is_alert,
+                   load_ratio, min_threshold, max_threshold
+            FROM ranked
+            WHERE rank = 1
+        """)).fetchall()
+
+    @staticmethod
+    def _alert_counts(since):
+        """Инциденты тревог (alert_event), открытые сейчас или продолжавшиеся в периоде"""
+        return db.session.execute(text("""
+            SELECT s.building_id, COUNT(*), SUM(e.ended_at IS NULL), COUNT(DISTINCT e.sensor_id), MAX(e.last_at)
+            FROM alert_event e
+            JOIN sensor s ON s.id = e.sensor_id
+            WHERE e.ended_at IS NULL OR e.last_at >= :since
+            GROUP BY s.building_id
+        """), {'since': since}).fetchall()
+
+    @staticmethod
+    def _anomaly_counts(since):
+        return db.session.execute(text("""
+            SELECT s.building_id, COUNT(*)
+            FROM sensor_anomaly a
+            JOIN sensor s ON s.id = a.sensor_id
+            WHERE a.timestamp >= :since
+            GROUP BY s.building_id
+        """), {'since': since}).fetchall()
+
+    @staticmethod
+    def _compute(hours_back):
+        since = to_db(datetime.utcnow() - timedelta(hours=hours_back))
+
+        buildings = db.session.execute(text(
+            "SELECT id, name, address, floors, building_type FROM building ORDER BY id"
+        )).fetchall()
+
+        summaries = {}
+        for building_id, name, address, floors, building_type in buildings:
+            summaries[building_id] = {
+                'building_id': building_id,
+                'name': name,
+                'address': address,
+                'floors': floors,
+                'building_type': building_type,
+                'sensors': {'total': 0, 'reporting': 0, 'by_status': {}, 'by_type': {}},
+                'current': {'sensors_in_alert': 0, 'last_reading_at': None, 'worst': None},
+                'alerts': {'hours': hours_back, 'count': 0, 'active': 0, 'sensors': 0, 'last_alert_at': None},
+                'anomalies': {'hours': hours_back, 'count': 0}
+            }
+
+        for building_id, sensor_type, status, count in SummaryService._sensor_counts():
+            summary = summaries.get(building_id)
+            if summary is None:
+                continue
+            sensors = summary['sensors']
+            sensors['total'] += count
+            sensors['by_status'][status] = sensors['by_status'].get(status, 0) + count
+            sensors['by_type'][sensor_type] = sensors['by_type'].get(sensor_type, 0) + count
+
+        for row in SummaryService._current_state():
+            (building_id, reporting, in_alert, last_reading_at, sensor_id, name, sensor_type, value, unit,
+             timestamp, is_alert, load_ratio, min_threshold, max_threshold) = row
+            summary = summaries.get(building_id)
+            if summary is None:
+                continue
+            summary['sensors']['reporting'] = reporting
+            summary['current'] = {
+                'sensors_in_alert': in_alert or 0,
+                'last_reading_at': _iso(last_reading_at),
+                'worst': {
+                    'sensor_id': sensor_id,
+                    'name': name,
+                    'type': sensor_type,
+                    'value': value,
+                    'unit': unit,
+                    'timestamp': _iso(timestamp),
+                    'is_alert': bool(is_alert),
+                    'load_ratio': load_ratio,
+                    'min_threshold': min_threshold,
+                    'max_threshold': max_threshold
+                }
+            }
+
+        for building_id, count, active, sensors, last_alert_at in SummaryService._alert_counts(since):
+            if building_id in summaries:
+                summaries[building_id]['alerts'].update(
+                    count=count, active=active or 0, sensors=sensors, last_alert_at=_iso(last_alert_at)
+                )
+
+        for building_id, count in SummaryService._anomaly_counts(since):
+            if building_id in summaries:
+                summaries[building_id]['anomalies']['count'] = count
+
+        return {
+            'hours': hours_back,
+            'generated_at': datetime.utcnow().isoformat() + 'Z',
+            'buildings': list(summaries.values())
+        }
+
+    @staticmethod
+    def get_summaries(hours_back=24):
+        """
+        Сводки по всем зданиям (кэшируются до записи новых показаний
+        или аномалий, но не дольше SUMMARY_CACHE_TTL)
+        """
+        return _summary_cache.get_or_compute(
+            ('buildings_summary', hours_back),
+            lambda: SummaryService._compute(hours_back),
+            SUMMARY_DEPENDENCIES, ttl=SUMMARY_CACHE_TTL, min_age=SUMMARY_MIN_REFRESH
+        )
+
+    @staticmethod
+    def get_building_summary(building_id, hours_back=24):
+        """Сводка по одному зданию (из общей сводки) или None"""
+        summaries = SummaryService.get_summaries(hours_back)
+        for summary in summaries['buildings']:
+            if summary['building_id'] == building_id:
+                return dict(summary, hours=summaries['hours'], generated_at=summaries['generated_at'])
+        return None
+
+
+def _on_readings(written):
+    versions.bump('readings')
+
+
+def init_summary_cache(app):
+    """
+    Подписывает кэш сводок на запись показаний
+
+    Args:
+        app (Flask): Приложение Flask
+    """
+    IngestService.add_listener(_on_readings)
@@ -0,0 +1,292 @@
+# server/services/trend_tracker.py
+
+import logging
+import math
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from server.config import TREND_TRACKER, TREND_MEMORY_HOURS, TREND_WARMUP_POINTS
+from server.database.db import db
+from server.database.timestamps import to_db, from_db
+from server.services.ingest_service import IngestService
+from server.services.approximation_service import ApproximationService
+
+logger = logging.getLogger(__name__)
+
+# Начальная ковариация коэффициентов (малое доверие к нулевому старту)
+INITIAL_COVARIANCE = 1e6
+
+# Минимум показаний для выдачи тренда (как в get_trend_analysis)
+MIN_TREND_POINTS = 3
+
+
+class RecursiveLeastSquares:
+    """
+    Рекурсивный МНК с забыванием для модели y = a + b·s + c·s²,
+    где s - часы относительно последнего показания
+
+    Опорное время переносится на каждое новое показание, поэтому
+    коэффициенты всегда относятся к "сейчас": a - текущий уровень,
+    b - наклон в единицах за час. Забывание экспоненциальное по времени
+    (постоянная memory_hours), а не по числу показаний - частота опроса
+    датчиков разная. Обновление и запрос - O(1).
+    """
+
+    __slots__ = ('order', 'memory_hours', 'theta', 'P', 't_ref', 'first_timestamp', 'count')
+
+    def __init__(self, order=2, memory_hours=TREND_MEMORY_HOURS):
+        size = order + 1
+        self.order = order
+        self.memory_hours = memory_hours
+        self.theta = [0.0] * size
+        self.P = [[INITIAL_COVARIANCE if i == j else 0.0 for j in range(size)] for i in range(size)]
+        self.t_ref = None
+        self.first_timestamp = None
+        self.count = 0
+
+    def _shift(self, hours):
+        """Перенос опорного времени вперед: theta' = T·theta, P' = T·P·Tᵀ"""
+        d = hours
+        if self.order == 1:
+            T = [[1.0, d], [0.0, 1.0]]
+        else:
+            T = [[1.0, d, d * d], [0.0, 1.0, 2 * d], [0.0, 0.0, 1.0]]
+        size = self.order + 1
+        rows = range(size)
+
+        self.theta = [sum(T[i][k] * self.theta[k] for k in rows) for i in rows]
+        TP = [[sum(T[i][k] * self.P[k][j] for k in rows) for j in rows] for i in rows]
+        self.P = [[sum(TP[i][k] * T[j][k] for k in rows) for j in rows] for i in rows]
+
+    def update(self, timestamp, value):
+        """Учитывает показание; запоздавшие и повторные показания пропускаются"""
+        if self.t_ref is None:
+            self.t_ref = self.first_timestamp = timestamp
+        else:
+            hours = (timestamp - self.t_ref).total_seconds() / 3600
+            if hours <= 0:
+                return False
+
+            self._shift(hours)
+            forgetting = math.exp(-hours / self.memory_hours)
+            if forgetting < 1e-6:
+                # После долгого перерыва история не значима - начинаем заново
+                size = self.order + 1
+                self.P = [[INITIAL_COVARIANCE if i == j else 0.0 for j in range(size)] for i in range(size)]
+                self.first_timestamp = timestamp
+                self.count = 0
+            else:
+                self.P = [[p / forgetting for p in row] for row in self.P]
+            self.t_ref = timestamp
+
+        # Регрессор в новой системе отсчета: x = (1, 0, 0)
+        P = self.P
+        rows = range(self.order + 1)
+        denominator = 1.0 + P[0][0]
+        gain = [P[i][0] / denominator for i in rows]
+        error = value - self.theta[0]
+
+        self.theta = [self.theta[i] + gain[i] * error for i in rows]
+        self.P = [[P[i][j] - gain[i] * P[0][j] for j in rows] for i in rows]
+        self.count += 1
+        return True
+
+    def value_at(self, hours_ago):
+        """Значение модели за hours_ago часов до последнего показания"""
+        s = -hours_ago
+        return sum(coefficient * s ** power for power, coefficient in enumerate(self.theta))
+
+    @property
+    def slope(self):
+        """Текущий наклон, единиц в час"""
+        return self.theta[1]
+
+    @property
+    def span_hours(self):
+        if self.t_ref is None:
+            return 0.0
+        return (self.t_ref - self.first_timestamp).total_seconds() / 3600
+
+
+class SensorTrend:
+    """Линейный и квадратичный трекеры одного датчика"""
+
+    __slots__ = ('linear', 'quadratic')
+
+    def __init__(self, memory_hours=TREND_MEMORY_HOURS):
+        self.linear = RecursiveLeastSquares(1, memory_hours)
+        self.quadratic = RecursiveLeastSquares(2, memory_hours)
+
+    def update(self, timestamp, value):
+        self.linear.update(timestamp, value)
+        self.quadratic.update(timestamp, value)
+
+    def analysis(self, hours_back=24):
+        """
+        Тренд за последние hours_back часов в формате get_trend_analysis
+
+        Начало и конец периода берутся по квадратичной модели (аналог
+        полинома в get_trend_analysis), период ограничен накопленной историей.
+        """
+        model = self.quadratic
+        if model.count < MIN_TREND_POINTS:
+            return None
+
+        hours = min(hours_back, model.span_hours)
+        start_value = model.value_at(hours)
+        end_value = model.value_at(0)
+
+        if start_value != 0:
+            change_percent = ((end_value - start_value) / abs(start_value)) * 100
+        else:
+            change_percent = 0
+
+        trend, description = ApproximationService.classify_trend(change_percent)
+
+        return {
+            'trend': trend,
+            'description': description,
+            'change_percent': change_percent,
+            'start_value': start_value,
+            'end_value': end_value,
+            'slope_per_hour': model.slope,
+            'linear_slope_per_hour': self.linear.slope,
+            'curvature': 2 * model.theta[2],
+            'hours': hours,
+            'points': model.count,
+            'last_timestamp': model.t_ref.isoformat() + 'Z'
+        }
+
+
+class TrendRegistry:
+    """Трекеры тренда всех датчиков процесса"""
+
+    def __init__(self, memory_hours=TREND_MEMORY_HOURS):
+        self.memory_hours = memory_hours
+        self.enabled = False
+        self._trends = {}
+        self._lock = threading.Lock()
+        # Пока идет прогрев, новые показания откладываются, чтобы не нарушить порядок
+        self._warming = False
+        self._pending = []
+
+    def _apply(self, written):
+        for sensor_id, timestamp, value, *_ in written:
+            trend = self._trends.get(sensor_id)
+            if trend is None:
+                trend = self._trends[sensor_id] = SensorTrend(self.memory_hours)
+            trend.update(timestamp, value)
+
+    def on_readings(self, written):
+        """Обработчик записанных показаний (см. IngestService.add_listener)"""
+        with self._lock:
+            if self._warming:
+                self._pending.extend(written)
+            else:
+                self._apply(written)
+
+    def get(self, sensor_id, hours_back=24):
+        with self._lock:
+            trend = self._trends.get(sensor_id)
+            return trend.analysis(hours_back) if trend is not None else None
+
+    def get_all(self, hours_back=24, sensor_ids=None):
+        """Тренды по всем (или выбранным) датчикам: {sensor_id: анализ}"""
+        with self._lock:
+            ids = self._trends.keys() if sensor_ids is None else sensor_ids
+            result = {}
+            for sensor_id in ids:
+                trend = self._trends.get(sensor_id)
+                analysis = trend.analysis(hours_back) if trend is not None else None
+                if analysis is not None:
+                    result[sensor_id] = analysis
+            return result
+
+    def warm_up(self, points_per_sensor=TREND_WARMUP_POINTS):
+        """
+        Прогрев по истории: последние points_per_sensor показаний каждого
+        датчика за 3 постоянные забывания (более старые весят < 5%)
+        """
+        with self._lock:
+            self._warming = True
+
+        trends = {}
+        try:
+            since = datetime.utcnow() - timedelta(hours=3 * self.memory_hours)
+            rows = db.session.execute(text("""
+                SELECT sensor_id, timestamp, value FROM (
+                    SELECT sensor_id, timestamp, value,
+                           ROW_NUMBER() OVER (PARTITION BY sensor_id ORDER BY timestamp DESC) AS rn
+                    FROM sensor_reading
+                    WHERE timestamp >= :since
+                )
+                WHERE rn <= :limit
+                ORDER BY sensor_id, timestamp
+            """), {
+                'since': to_db(since),
+                'limit': points_per_sensor
+            }).fetchall()
+
+            for sensor_id, timestamp, value in rows:
+                trend = trends.get(sensor_id)
+                if trend is None:
+                    trend = trends[sensor_id] = SensorTrend(self.memory_hours)
+                trend.update(from_db(timestamp), value)
+        finally:
+            with self._lock:
+                self._trends.update(trends)
+                # Показания, пришедшие во время прогрева (повторы отсеиваются по времени)
+                self._apply(self._pending)
+                self._pending = []
+                self._warming = False
+
+        return len(trends)
+
+
+trend_registry = TrendRegistry()
+
+
+def get_sensor_trend(sensor_id, hours_back=24):
+    """
+    Тренд датчика: из инкрементального трекера, если этот процесс принимает
+    показания и трекер накопил данные, иначе полным пересчетом полинома (get_trend_analysis)
+    """
+    analysis = trend_registry.get(sensor_id, hours_back) if trend_registry.enabled else None
+    if analysis is not None:
+        analysis['source'] = 'rls'
+        return analysis
+
+    analysis = ApproximationService.get_trend_analysis(sensor_id, hours_back)
+    analysis['source'] = 'polynomial'
+    return analysis
+
+
+def init_trend_tracker(app, ingest_in_process):
+    """
+    Подписывает трекеры тренда на запись показаний и прогревает их
+    по истории в фоновом потоке (старт сервера не задерживается). Без приема
+    показаний в процессе трекеры не обновлялись бы после прогрева - тренд
+    тогда считается полиномом.
+
+    Args:
+        app (Flask): Приложение Flask
+        ingest_in_process (bool): показания MQTT принимает этот процесс
+    """
+    if TREND_TRACKER == '0' or (TREND_TRACKER == 'auto' and not ingest_in_process):
+        return
+
+    trend_registry.enabled = True
+    IngestService.add_listener(trend_registry.on_readings)
+
+    if TREND_WARMUP_POINTS <= 0:
+        return
+
+    def warm_up():
+        with app.app_context():
+            try:
+                count = trend_registry.warm_up()
+                logger.info(f"Трекеры тренда прогреты для {count} датчиков")
+            except Exception as e:
+                logger.error(f"Ошибка прогрева трекеров тренда: {e}")
+
+    threading.Thread(target=warm_up, name='geo-trend-warmup', daemon=True).start()
@@ -0,0 +1,141 @@
+# server/utils/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionCounters:
+    """
+    Счетчики версий данных (readings, metadata, ...)
+
+    Запись данных увеличивает счетчик, закэшированные значения сравнивают
+    версии, с которыми они построены, с текущими.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def get(self, name):
+        return self._versions.get(name, 0)
+
+    def snapshot(self, names):
+        """Кортеж текущих версий для набора имен"""
+        return tuple(self._versions.get(name, 0) for name in names)
+
+
+class VersionedCache:
+    """
+    Кэш значений, зависящих от счетчиков версий, с вытеснением по LRU
+
+    Значение считается актуальным, пока версии зависимостей не изменились и
+    не истек ttl. min_age позволяет не пересчитывать значение чаще раза в
+    min_age секунд при непрерывной записи показаний.
+    """
+
+    def __init__(self, counters, max_entries=256):
+        self.counters = counters
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, depends_on=(), ttl=None, min_age=0):
+        """Значение из кэша или None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                versions, created, value = entry
+                age = now - created
+                fresh = versions == self.counters.snapshot(depends_on) or age < min_age
+                if fresh and (ttl is None or age < ttl):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, depends_on=(), versions=None):
+        """
+        Сохраняет значение; versions - версии на момент начала расчета
+        (запись, пришедшая во время расчета, сделает значение устаревшим)
+        """
+        if versions is None:
+            versions = self.counters.snapshot(depends_on)
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute, depends_on=(), ttl=None, min_age=0):
+        value = self.get(key, depends_on, ttl, min_age)
+        if value is None:
+            versions = self.counters.snapshot(depends_on)
+            value = compute()
+            self.set(key, value, depends_on, versions)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RecentKeys:
+    """
+    Множество недавно виденных ключей с вытеснением по LRU
+
+    Используется как быстрый фильтр повторов перед записью в БД: ключ,
+    вытесненный из памяти, снова проверит уникальный индекс.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def seen(self, keys):
+        """Флаги для keys: встречался ли ключ (найденные становятся самыми свежими)"""
+        with self._lock:
+            flags = []
+            for key in keys:
+                found = key in self._keys
+                if found:
+                    self._keys.move_to_end(key)
+                flags.append(found)
+            return flags
+
+    def add(self, keys):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+def sensor_data_version(sensor_id):
+    """Имя счетчика версий показаний датчика"""
+    return f'sensor:{sensor_id}'
+
+
+# Общие счетчики версий процесса
+versions = VersionCounters()
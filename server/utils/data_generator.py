@@ -6,6 +6,15 @@ import math
 from server.models.sensor_data import Sensor, Building, AlertConfig
 from server.services.data_service import DataService
 
+# Модель сигнала по типам датчиков: базовое значение, единица, тренд за период и уровень шума
+SENSOR_PROFILES = {
+    'инклинометр': {'base': 0, 'unit': 'градусы', 'trend': 3, 'noise': 0.5},
+    'тензометр': {'base': 0, 'unit': 'мкм/м', 'trend': 20, 'noise': 0.5},
+    'акселерометр': {'base': 5, 'unit': 'мм/с²', 'trend': 0, 'noise': 2},
+    'датчик трещин': {'base': 0.5, 'unit': 'мм', 'trend': 2, 'noise': 0.5},
+    'датчик температуры': {'base': 20, 'unit': '°C', 'trend': 0, 'noise': 0.5}
+}
+
 class DataGenerator:
     """Генератор синтетических данных для тестирования"""
     
@@ -157,6 +166,47 @@ class DataGenerator:
                 
         print(f"Сгенерировано {total_readings} показаний для датчика {sensor.id}")
     
+    @staticmethod
+    def generate_series(sensor_type, start_time, end_time, count, rng=None):
+        """
+        Быстрая векторная генерация ряда показаний (та же модель, что и
+        в generate_readings_for_sensor, но без ORM и без записи в БД)
+        
+        Args:
+            sensor_type (str): тип датчика
+            start_time, end_time (datetime): период
+            count (int): количество показаний
+            rng (numpy.random.Generator): генератор случайных чисел
+        
+        Returns:
+            tuple: (метки времени datetime64[us], значения float64, единица измерения)
+        """
+        import numpy as np
+        
+        rng = rng if rng is not None else np.random.default_rng()
+        profile = SENSOR_PROFILES.get(sensor_type, {'base': 0, 'unit': 'единицы', 'trend': 0, 'noise': 0.5})
+        
+        start = np.datetime64(start_time, 'us')
+        step_us = int((end_time - start_time).total_seconds() * 1e6 / count) if count else 0
+        timestamps = start + np.arange(count, dtype=np.int64) * np.timedelta64(step_us, 'us')
+        
+        # Тренд (медленное изменение со временем)
+        trend = np.arange(count) / max(count, 1) * profile['trend']
+        
+        # Периодические колебания по часу суток
+        hour_of_day = (timestamps.astype(np.int64) // 3_600_000_000) % 24
+        if sensor_type == 'датчик температуры':
+            periodic = 5 * np.sin(hour_of_day * np.pi / 12)
+        elif sensor_type == 'акселерометр':
+            periodic = np.where((hour_of_day >= 8) & (hour_of_day <= 18), 5.0, 0.0)
+        else:
+            periodic = 0
+        
+        noise = rng.uniform(-1, 1, count) * profile['noise']
+        values = profile['base'] + trend + periodic + noise
+        
+        return timestamps, values, profile['unit']
+    
     @staticmethod
     def cleanup_old_readings(sensor_id, keep_days=30):
         """
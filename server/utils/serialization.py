@@ -0,0 +1,283 @@
+# server/utils/serialization.py
+#
+# Быстрая сериализация больших наборов показаний: векторное форматирование
+# времени, столбцовый JSON, необязательный кодировщик orjson и бинарные
+# форматы (Arrow IPC, NumPy .npy) для аналитических клиентов
+
+import io
+import json
+from datetime import datetime
+from flask import Response
+
+# Форматы времени в ответах: ISO-строка с 'Z' или миллисекунды Unix
+TS_FORMATS = ('iso', 'epoch')
+
+# Раскладка показаний: список объектов (как раньше) или столбцы {"t": [...], "v": [...]}
+LAYOUTS = ('rows', 'columns')
+
+# Форматы ответа с показаниями: JSON или бинарные столбцы
+FORMATS = ('json', 'arrow', 'npy')
+
+# Поля бинарной выгрузки: t - микросекунды Unix (UTC), порядок байт little-endian
+READING_FIELDS = (
+    ('sensor_id', '<i8'),
+    ('id', '<i8'),
+    ('t', '<i8'),
+    ('v', '<f8'),
+    ('is_alert', '?')
+)
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.file'
+NPY_MIMETYPE = 'application/octet-stream'
+
+# Метки времени хранятся naive в UTC
+_EPOCH = datetime(1970, 1, 1)
+
+_orjson = None
+_pyarrow = None
+
+
+def _get_orjson():
+    """orjson, если установлен (необязательная зависимость), иначе False"""
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    return _orjson
+
+
+def _get_pyarrow():
+    """pyarrow, если установлен (необязательная зависимость), иначе False"""
+    global _pyarrow
+    if _pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            _pyarrow = pyarrow
+        except ImportError:
+            _pyarrow = False
+    return _pyarrow
+
+
+def format_timestamps(timestamps, ts_format='iso'):
+    """
+    Векторное форматирование массива datetime64
+
+    Returns:
+        list: ISO-строки с 'Z' (ts_format='iso', как datetime.isoformat() + 'Z' - без
+              дробной части при нулевых микросекундах) или целые миллисекунды Unix ('epoch')
+    """
+    import numpy as np
+
+    if ts_format == 'epoch':
+        return timestamps.astype('datetime64[ms]').astype(np.int64).tolist()
+    if len(timestamps) == 0:
+        return []
+    timestamps = timestamps.astype('datetime64[us]')
+    whole = timestamps == timestamps.astype('datetime64[s]')
+    strings = np.where(whole, np.datetime_as_string(timestamps, unit='s'),
+                       np.datetime_as_string(timestamps, unit='us'))
+    return np.char.add(strings, 'Z').tolist()
+
+
+def format_timestamp(timestamp, ts_format='iso'):
+    """Одна метка времени (datetime) в выбранном формате"""
+    if timestamp is None:
+        return None
+    if ts_format == 'epoch':
+        return int((timestamp - _EPOCH).total_seconds() * 1000)
+    return timestamp.isoformat() + 'Z'
+
+
+def readings_payload(columns, layout='rows', ts_format='iso'):
+    """
+    Показания из столбцового набора (см. DataService.get_readings_columns)
+
+    Args:
+        columns (dict): id, t (datetime64[us]), v, unit, is_alert
+        layout (str): rows - [{"id", "value", "unit", "timestamp", "is_alert"}, ...],
+                      columns - {"id": [...], "t": [...], "v": [...], "unit": "мм" или [...], "is_alert": [...]}
+        ts_format (str): iso или epoch
+    """
+    timestamps = format_timestamps(columns['t'], ts_format)
+    ids = columns['id'].tolist()
+    values = columns['v'].tolist()
+    alerts = columns['is_alert'].tolist()
+    units = columns['unit']
+
+    if layout == 'columns':
+        # Единица у датчика обычно одна - не повторяем ее для каждого показания
+        unit = units[0] if units and units.count(units[0]) == len(units) else units
+        return {'id': ids, 't': timestamps, 'v': values, 'unit': unit, 'is_alert': alerts}
+
+    return [
+        {'id': reading_id, 'value': value, 'unit': unit, 'timestamp': timestamp, 'is_alert': is_alert}
+        for reading_id, value, unit, timestamp, is_alert in zip(ids, values, units, timestamps, alerts)
+    ]
+
+
+def resampled_payload(series, unit=None, layout='rows', ts_format='iso'):
+    """
+    Показания на регулярной сетке (см. resampling.resample), пустые ячейки - null
+
+    Args:
+        series (dict): t, v, count, is_alert, filled, step
+        unit (str): единица измерения датчика
+        layout (str): rows - [{"timestamp", "value", "count", "is_alert", "filled"}, ...],
+                      columns - {"t": [...], "v": [...], "count": [...], ..., "step": секунды}
+        ts_format (str): iso или epoch
+    """
+    import numpy as np
+
+    timestamps = format_timestamps(series['t'], ts_format)
+    values = series['v'].tolist()
+    if np.isnan(series['v']).any():
+        values = [None if value != value else value for value in values]
+    counts = series['count'].tolist()
+    alerts = series['is_alert'].tolist()
+    filled = series['filled'].tolist()
+
+    if layout == 'columns':
+        return {
+            't': timestamps, 'v': values, 'count': counts, 'is_alert': alerts, 'filled': filled,
+            'unit': unit, 'step': series['step']
+        }
+
+    return [
+        {'timestamp': timestamp, 'value': value, 'unit': unit, 'count': count, 'is_alert': is_alert, 'filled': fill}
+        for timestamp, value, count, is_alert, fill in zip(timestamps, values, counts, alerts, filled)
+    ]
+
+
+def dumps(data):
+    """JSON в байтах: orjson, если доступен, иначе стандартный json"""
+    orjson = _get_orjson()
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """Ответ Flask с JSON без повторного обхода через jsonify"""
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def request_formats(args):
+    """
+    Параметры формата из запроса: (layout, ts_format) или ValueError
+
+    Args:
+        args: request.args
+    """
+    layout = args.get('layout', 'rows')
+    ts_format = args.get('ts_format', 'iso')
+    if layout not in LAYOUTS:
+        raise ValueError(f"Неизвестный layout: {layout}. Доступны: {', '.join(LAYOUTS)}")
+    if ts_format not in TS_FORMATS:
+        raise ValueError(f"Неизвестный ts_format: {ts_format}. Доступны: {', '.join(TS_FORMATS)}")
+    return layout, ts_format
+
+
+def request_format(args):
+    """
+    Формат ответа из запроса (json, arrow, npy) или ValueError
+
+    Args:
+        args: request.args
+    """
+    fmt = args.get('format', 'json')
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный format: {fmt}. Доступны: {', '.join(FORMATS)}")
+    return fmt
+
+
+def format_unavailable(fmt):
+    """Сообщение об ошибке, если для формата не установлена зависимость, иначе None"""
+    if fmt == 'arrow' and not _get_pyarrow():
+        return 'Формат arrow недоступен: не установлен pyarrow (используйте format=npy)'
+    return None
+
+
+def readings_dtype(with_sensor_id=True):
+    """Структурный dtype показаний (см. READING_FIELDS)"""
+    import numpy as np
+
+    return np.dtype([field for field in READING_FIELDS if with_sensor_id or field[0] != 'sensor_id'])
+
+
+def readings_array(columns):
+    """
+    Столбцы DataService.get_readings_columns в структурный массив readings_dtype(False)
+
+    Время переводится в микросекунды Unix без копирования (view datetime64[us] как int64).
+    """
+    import numpy as np
+
+    array = np.empty(len(columns['id']), dtype=readings_dtype(with_sensor_id=False))
+    array['id'] = columns['id']
+    array['t'] = columns['t'].astype('datetime64[us]').view(np.int64)
+    array['v'] = columns['v']
+    array['is_alert'] = columns['is_alert']
+    return array
+
+
+def _npy_bytes(array):
+    """Массив в формате .npy (загружается через np.load(..., mmap_mode='r'))"""
+    import numpy as np
+
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _arrow_bytes(array, units):
+    """
+    Структурный массив в файл Arrow IPC: каждое поле - отдельный непрерывный буфер,
+    t - timestamp[us, UTC]; единицы измерения - в метаданных схемы (JSON)
+    """
+    import numpy as np
+
+    pa = _get_pyarrow()
+    arrays, names = [], []
+    for name in array.dtype.names:
+        column = np.ascontiguousarray(array[name])
+        if name == 't':
+            arrays.append(pa.array(column.view('datetime64[us]'), type=pa.timestamp('us', tz='UTC')))
+        else:
+            arrays.append(pa.array(column))
+        names.append(name)
+
+    metadata = {'units': json.dumps(units or {}, ensure_ascii=False)}
+    table = pa.Table.from_arrays(arrays, names=names, metadata=metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def binary_response(array, fmt, units=None, filename='readings'):
+    """
+    Ответ с показаниями в бинарном формате
+
+    Args:
+        array (ndarray): структурный массив readings_dtype
+        fmt (str): arrow или npy
+        units (dict): единицы измерения по датчикам (для npy - в заголовке X-Units)
+        filename (str): имя файла без расширения для Content-Disposition
+    """
+    if fmt == 'arrow':
+        response = Response(_arrow_bytes(array, units), mimetype=ARROW_MIMETYPE)
+        extension = 'arrow'
+    else:
+        response = Response(_npy_bytes(array), mimetype=NPY_MIMETYPE)
+        extension = 'npy'
+
+    # Заголовки HTTP - latin-1, поэтому JSON с экранированием не-ASCII символов
+    response.headers['X-Units'] = json.dumps({str(key): value for key, value in (units or {}).items()})
+    response.headers['X-Record-Count'] = str(len(array))
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    return response